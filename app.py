@@ -11,12 +11,23 @@ load_dotenv(dotenv_path=BASE_DIR / '.env')
 
 # Importar desde módulos locales
 from database.models import init_db
-from database.queries import register_user, get_user_tests, get_all_tests, get_statistics, get_recent_tests, save_test
+from database.queries import register_user, get_user_tests, next_cursor, get_all_tests, get_statistics, get_latency_percentiles, get_rolling_latency_percentiles, get_preprocessing_impact, get_gemini_stream_metrics, get_hedge_stats, get_recent_tests, get_recent_exec_times, save_test, enqueue_job, get_job, get_test_payload, get_test_phases, get_test_records, get_record_agreement, save_scores, get_field_accuracy, sync_read_caches
 from services.gemini_service import process_with_gemini
-from services.unstract_service import run_unstract_workflow
+from services.invoice_schema import parse_partial_json
+from services.normalize import normalize_results, compare_records
+from services.scoring import load_ground_truth, records_frame, score_fields, field_metrics, pick_best
+from services.orchestrator import PartialResult
+from services.unstract_service import run_unstract_workflow, seed_execution_times
 from services.document_ai_service import process_with_document_ai
+from services.clients import warm_up_clients
+from services.hedging import seed_latencies
+from services.pipeline import iter_document_runs, lookup_cached_results, store_run, cache_variant
+from services.batch import expand_uploads, iter_batch_results, result_status
+from services.result_cache import file_sha256
+from services.preprocessing import prepare_upload, prepare_documents
 from ui.styles import CUSTOM_CSS
-from config.settings import UNSTRACT_API_KEY, UNSTRACT_URL_WORKFLOW
+from ui.charts import phase_waterfall_chart
+from config.settings import UNSTRACT_API_KEY, UNSTRACT_URL_WORKFLOW, BATCH_CONCURRENCY, PAGE_SPLIT_CHUNK_PAGES
 
 # ==========================
 # Streamlit config
@@ -31,10 +42,62 @@ st.set_page_config(
 # Custom CSS
 st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
+# Display names; providers missing here are shown by their key
+PLATFORM_LABELS = {
+    "gemini": "🤖 Gemini AI",
+    "unstract": "🔧 Unstract",
+    "document_ai": "📄 Document AI"
+}
+
+
+def platform_label(provider):
+    return PLATFORM_LABELS.get(provider, provider)
+
+
+def expand_exec_times(df, column="exec_times", suffix=" Time (s)"):
+    """Replace the {provider: exec_time} column with one formatted column per provider that ran."""
+    exec_times = df.pop(column).apply(lambda times: times or {})
+    providers = sorted({provider for times in exec_times for provider in times}, key=lambda p: (p not in PLATFORM_LABELS, p))
+    for provider in providers:
+        df.insert(
+            len(df.columns) - 1,
+            f"{platform_label(provider)}{suffix}",
+            exec_times.apply(lambda times: f"{float(times[provider]):.2f}" if times.get(provider) is not None else "N/A")
+        )
+    return providers
+
 # ==========================
-# DB Init
+# DB Init (once per process)
 # ==========================
-init_db()
+# The schema statements take table locks; running them on every rerun would
+# queue each page interaction behind them
+@st.cache_resource
+def init_schema():
+    init_db()
+
+init_schema()
+# Writes from other processes (manage.py, other app replicas) reach this process's cached reads here
+sync_read_caches()
+
+# ==========================
+# Provider clients (once per process)
+# ==========================
+@st.cache_resource
+def warm_up_provider_clients():
+    warm_up_clients()
+    # Start Unstract polling from the execution times seen so far
+    try:
+        seed_execution_times(get_recent_exec_times("unstract"))
+    except Exception as e:
+        print(f"Could not seed Unstract execution times: {e}")
+    # Hedge delays start from the same history
+    for provider in PLATFORM_LABELS:
+        try:
+            seed_latencies(provider, get_recent_exec_times(provider))
+        except Exception as e:
+            print(f"Could not seed {provider} latencies: {e}")
+
+warm_up_provider_clients()
 
 # ==========================
 # Login UI
@@ -72,21 +135,23 @@ with col2:
     if st.button("🚪 Log Out", key="logout_button"):
         st.session_state.username = None
         st.session_state.user_id = None
+        # Cursors point into this user's history
+        st.session_state.history_cursors = [None]
         st.rerun()
 
 # ==========================
 # Tabs
 # ==========================
-tab1, tab2, tab3 = st.tabs([
+tab1, tab2, tab3, tab4 = st.tabs([
     "📤 Process Invoice",
     "📜 My History",
-    "📊 Statistics"
+    "📊 Statistics",
+    "📦 Batch Processing"
 ])
 
 # --------------------------
 # Tab 1: Upload & OCR
 # --------------------------
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 
 with tab1:
@@ -105,6 +170,23 @@ with tab1:
         st.session_state.current_file_type = None
     if 'file_bytes_stored' not in st.session_state:
         st.session_state.file_bytes_stored = None
+    if 'cache_hits' not in st.session_state:
+        st.session_state.cache_hits = set()
+    if 'phases' not in st.session_state:
+        st.session_state.phases = {}
+    if 'preprocessing' not in st.session_state:
+        st.session_state.preprocessing = None
+    if 'records' not in st.session_state:
+        st.session_state.records = {}
+    if 'force_refresh' not in st.session_state:
+        st.session_state.force_refresh = False
+    if 'split_pages' not in st.session_state:
+        st.session_state.split_pages = False
+
+    if 'job_id' not in st.session_state:
+        st.session_state.job_id = None
+    if 'use_worker' not in st.session_state:
+        st.session_state.use_worker = False
 
     # Initialize platform checkboxes
     if 'run_gemini' not in st.session_state:
@@ -114,6 +196,15 @@ with tab1:
     if 'run_documentai' not in st.session_state:
         st.session_state.run_documentai = True
     
+    def selected_platforms():
+        return [
+            platform for platform, selected in (
+                ("gemini", st.session_state.run_gemini),
+                ("unstract", st.session_state.run_unstract),
+                # ("document_ai", st.session_state.run_documentai)
+            ) if selected
+        ]
+
     uploaded_file = st.file_uploader(
         "Select an invoice (image or PDF)", 
         type=['png','jpg','jpeg','pdf'], 
@@ -123,7 +214,8 @@ with tab1:
     
     if uploaded_file:
         filename = uploaded_file.name
-        file_bytes = uploaded_file.read()
+        # A view over the uploader's buffer: no copy is made, here or in session_state
+        file_bytes = uploaded_file.getbuffer()
         file_type = uploaded_file.type
         
         col1, col2 = st.columns([1,2])
@@ -131,7 +223,7 @@ with tab1:
         with col1:
             st.subheader("Preview")
             if file_type.startswith('image'):
-                st.image(file_bytes, use_container_width=True)
+                st.image(uploaded_file, use_container_width=True)
             else:
                 st.info(f"📄 PDF uploaded: **{filename}**")
         
@@ -156,6 +248,25 @@ with tab1:
             #     key="check_documentai",
             #     disabled=st.session_state.processing
             # )
+
+            st.session_state.force_refresh = st.checkbox(
+                "♻️ Force refresh (ignore cached results)",
+                value=st.session_state.force_refresh,
+                key="check_force_refresh",
+                disabled=st.session_state.processing
+            )
+            st.session_state.split_pages = st.checkbox(
+                f"📑 Split multi-page PDFs and process pages in parallel ({PAGE_SPLIT_CHUNK_PAGES} page(s) per request)",
+                value=st.session_state.split_pages,
+                key="check_split_pages",
+                disabled=st.session_state.processing or file_type != "application/pdf"
+            )
+            st.session_state.use_worker = st.checkbox(
+                "🧵 Run in background worker (keeps running if you close the tab)",
+                value=st.session_state.use_worker,
+                key="check_use_worker",
+                disabled=st.session_state.processing
+            )
             
             if st.button(
                 "🚀 Process with selected platforms", 
@@ -168,10 +279,48 @@ with tab1:
                 use_container_width=True
             ):
                 st.session_state.processing = True
-                st.session_state.file_bytes_stored = file_bytes
                 st.session_state.current_filename = filename
                 st.session_state.current_file_type = file_type
+                if st.session_state.use_worker:
+                    st.session_state.job_id = enqueue_job(
+                        user_id=st.session_state.user_id,
+                        filename=filename,
+                        file_type=file_type,
+                        file_bytes=file_bytes,
+                        providers=selected_platforms(),
+                        force_refresh=st.session_state.force_refresh,
+                        page_chunk=PAGE_SPLIT_CHUNK_PAGES if st.session_state.split_pages else None
+                    )
+                else:
+                    st.session_state.file_bytes_stored = file_bytes
                 st.rerun()
+
+    # Background job: poll until a worker finishes it
+    if st.session_state.job_id:
+        job = get_job(st.session_state.job_id)
+
+        if job is None:
+            st.error(f"❌ Job #{st.session_state.job_id} not found")
+            st.session_state.job_id = None
+            st.session_state.processing = False
+        elif job.status in ("queued", "running"):
+            st.info(f"⏳ Job #{job.id} is {job.status}... (attempt {job.attempts})")
+            time.sleep(2)
+            st.rerun()
+        elif job.status == "done":
+            st.session_state.results = job.results
+            st.session_state.records = normalize_results(job.results)
+            st.session_state.exec_times = job.exec_times
+            st.session_state.cache_hits = set(job.cache_hits or [])
+            st.session_state.phases = job.phases or {}
+            st.session_state.preprocessing = job.preprocessing
+            st.session_state.job_id = None
+            st.session_state.processing = False
+            st.rerun()
+        else:
+            st.error(f"❌ Job #{job.id} failed: {job.error}")
+            st.session_state.job_id = None
+            st.session_state.processing = False
     
     # Processing logic
     if st.session_state.processing and st.session_state.file_bytes_stored:
@@ -188,52 +337,61 @@ with tab1:
             st.markdown("### 🔄 Processing...")
             progress_bar = st.progress(0)
             status_text = st.empty()
+            partial_area = st.empty()
 
-            total_platforms = sum([
-                st.session_state.run_gemini,
-                st.session_state.run_unstract,
-                st.session_state.run_documentai
-            ])
+            platforms = selected_platforms()
+            total_platforms = len(platforms)
             current = 0
+            cache_hits = set()
+            phases = {}
+            streaming = set()
 
-            futures = {}
-            start_times = {}
-
-            with ThreadPoolExecutor(max_workers=3) as executor:
+            # Shrink the upload once; every provider gets the same prepared bytes
+            status_text.markdown("**⏳ Preparing upload...**")
+            upload = prepare_upload(file_bytes, filename, file_type)
 
-                if st.session_state.run_gemini:
-                    status_text.markdown("**⏳ Submitting Gemini AI...**")
-                    start_times["gemini"] = time.time()
-                    futures[executor.submit(process_with_gemini, file_bytes, filename, file_type)] = "gemini"
-
-                if st.session_state.run_unstract:
-                    status_text.markdown("**⏳ Submitting Unstract...**")
-                    start_times["unstract"] = time.time()
-                    futures[executor.submit(run_unstract_workflow, file_bytes=file_bytes, filename=filename, file_type=file_type)] = "unstract"
-
-                # if st.session_state.run_documentai:
-                #     status_text.markdown("**⏳ Submitting Google Document AI...**")
-                #     start_times["document_ai"] = time.time()
-                #     futures[executor.submit(process_with_document_ai, file_bytes, file_type,DOCAI_URL)] = "document_ai"
+            # Cached providers come back first; the rest run concurrently on the shared event loop
+            status_text.markdown(f"**⏳ Running {', '.join(platforms)}...**")
+            for run, from_cache in iter_document_runs(
+                upload.file_bytes, upload.filename, upload.file_type, platforms,
+                force_refresh=st.session_state.force_refresh,
+                page_chunk=PAGE_SPLIT_CHUNK_PAGES if st.session_state.split_pages else None,
+                partials=True
+            ):
+                if isinstance(run, PartialResult):
+                    # Streaming providers show their output while it is still being generated
+                    streaming.add(run.provider)
+                    with partial_area.container():
+                        st.caption(f"✍️ {run.provider} is writing...")
+                        partial = parse_partial_json(run.text)
+                        if partial is not None:
+                            st.json(partial)
+                        else:
+                            st.code(run.text[-2000:])
+                    continue
 
-                # Collect async results
-                for future in as_completed(futures):
-                    platform = futures[future]
-                    try:
-                        results[platform] = future.result()
-                        exec_times[platform] = time.time() - start_times[platform]
-                    except Exception as e:
-                        results[platform] = {"status": "error", "error": str(e)}
-                        exec_times[platform] = None
+                if run.provider in streaming:
+                    partial_area.empty()
+                results[run.provider] = run.result
+                exec_times[run.provider] = run.exec_time
+                if from_cache:
+                    cache_hits.add(run.provider)
+                else:
+                    phases[run.provider] = run.phases
 
-                    current += 1
-                    progress_bar.progress(current / total_platforms)
+                current += 1
+                progress_bar.progress(current / total_platforms)
+                status_text.markdown(f"**✅ {run.provider} finished**")
 
             status_text.markdown("**✅ Processing complete!**")
             time.sleep(0.5)
 
         st.session_state.results = results
+        st.session_state.records = normalize_results(results)
         st.session_state.exec_times = exec_times
+        st.session_state.cache_hits = cache_hits
+        st.session_state.phases = phases
+        st.session_state.preprocessing = upload.summary()
         st.session_state.processing = False
         st.rerun()
 
@@ -246,18 +404,62 @@ with tab1:
         cols = st.columns(len(st.session_state.exec_times))
         for idx, (platform, exec_time) in enumerate(st.session_state.exec_times.items()):
             with cols[idx]:
+                cached_label = " (cached)" if platform in st.session_state.cache_hits else ""
                 st.metric(
-                    label=f"{platform.upper()} Execution Time",
+                    label=f"{platform.upper()} Execution Time{cached_label}",
                     value=f"{exec_time:.2f}s" if exec_time else "N/A"
                 )
+                metrics = (st.session_state.results.get(platform) or {}).get("metrics")
+                if metrics and not cached_label:
+                    tokens_per_sec = metrics.get("tokens_per_sec")
+                    st.caption(
+                        f"First token after {metrics['ttft']:.2f}s"
+                        + (f" · {tokens_per_sec:.0f} tokens/s" if tokens_per_sec else "")
+                    )
+                hedge = (st.session_state.results.get(platform) or {}).get("hedge")
+                if hedge:
+                    st.caption(
+                        f"Hedged after {hedge['delay']:.2f}s · "
+                        + (f"second request won (~{hedge['saved']:.2f}s saved)" if hedge["won"] else "first request still won")
+                    )
         
+        preprocessing = st.session_state.preprocessing
+        if preprocessing and preprocessing.get("steps"):
+            saved_pct = (1 - preprocessing["size"] / preprocessing["original_size"]) * 100
+            st.caption(
+                f"🗜️ Upload preprocessed in {preprocessing['duration']:.2f}s: "
+                f"{preprocessing['original_size'] / 1e6:.2f} MB → {preprocessing['size'] / 1e6:.2f} MB "
+                f"({saved_pct:.0f}% smaller; {', '.join(preprocessing['steps'])})"
+            )
+
+        # Where the seconds went, per platform
+        waterfall = phase_waterfall_chart(st.session_state.phases)
+        if waterfall is not None:
+            st.subheader("⏱️ Timing Breakdown")
+            st.altair_chart(waterfall, use_container_width=True)
+        
+        # Side by side on the normalised records, not the raw payloads
+        comparison = compare_records(st.session_state.records)
+        if len(st.session_state.records) > 1:
+            st.subheader("🔀 Field Comparison")
+            comparison_df = pd.DataFrame([
+                {"Field": name, **{provider.upper(): value for provider, value in values.items()}, "Agree": "✅" if agree else "—"}
+                for name, values, agree in comparison
+            ])
+            st.dataframe(comparison_df.astype(str), use_container_width=True, hide_index=True)
+
         # Show results for each platform
         for platform, result in st.session_state.results.items():
-            with st.expander(f"📄 {platform.upper()} Results", expanded=True):
+            with st.expander(f"📄 {platform.upper()} Results", expanded=False):
+                if result.get("pages"):
+                    st.caption("Per-page timings")
+                    pages_df = pd.DataFrame(result["pages"])
+                    pages_df["exec_time"] = pages_df["exec_time"].apply(lambda x: f"{x:.2f}s" if x is not None else "N/A")
+                    st.dataframe(pages_df, use_container_width=True, hide_index=True)
                 if result.get("status") == "error":
                     st.error(f"❌ Error: {result.get('error', 'Unknown error')}")
-                else:
-                    st.json(result)
+                elif st.toggle("Show raw response", key=f"raw_{platform}"):
+                    st.json(result, expanded=False)
         
         # Best result selection
         st.markdown("---")
@@ -310,7 +512,11 @@ with tab1:
                         file_type=st.session_state.current_file_type,
                         results=st.session_state.results,
                         exec_times=st.session_state.exec_times,
-                        best=best
+                        best=best,
+                        phases=st.session_state.phases,
+                        preprocessing=st.session_state.preprocessing,
+                        records=st.session_state.records,
+                        cache_hits=st.session_state.cache_hits
                     )
                     
                     if result and result.get("success"):
@@ -322,6 +528,7 @@ with tab1:
                         st.session_state.current_file_type = None
                         st.session_state.file_bytes_stored = None
                         st.session_state.best_selection = None
+                        st.session_state.records = {}
                     else:
                         st.error("❌ Error: Test not saved")
                         
@@ -339,6 +546,8 @@ with tab1:
             st.session_state.current_file_type = None
             st.session_state.file_bytes_stored = None
             st.session_state.best_selection = None
+            st.session_state.records = {}
+            st.session_state.job_id = None
             st.session_state.processing = False
             st.rerun()
 # --------------------------
@@ -347,19 +556,47 @@ with tab1:
 with tab2:
     st.header(f"📜 My History ({st.session_state.username})")
     
+    # One keyset cursor per visited page; the last one is the page on screen
+    if 'history_cursors' not in st.session_state:
+        st.session_state.history_cursors = [None]
+
+    history_page_size = st.selectbox(
+        "Rows per page", [25, 50, 100], index=1, key="history_page_size",
+        on_change=lambda: st.session_state.update(history_cursors=[None])
+    )
+
     try:
-        user_tests = get_user_tests(st.session_state.user_id)
+        # One row past the page tells whether a next page exists
+        user_tests = get_user_tests(
+            st.session_state.user_id,
+            after=st.session_state.history_cursors[-1],
+            page_size=history_page_size + 1
+        )
+        history_next = next_cursor(user_tests, history_page_size)
+        user_tests = user_tests[:history_page_size]
+
+        # Pagination, kept outside the empty-page branch so there is always a way back
+        page_number = len(st.session_state.history_cursors)
+        col1, col2, col3 = st.columns([1,2,1])
+        with col1:
+            if st.button("⬅️ Previous", key="history_prev", disabled=page_number == 1):
+                st.session_state.history_cursors.pop()
+                st.rerun()
+        with col2:
+            st.markdown(f"<div style='text-align: center;'>Page {page_number}</div>", unsafe_allow_html=True)
+        with col3:
+            if st.button("Next ➡️", key="history_next", disabled=history_next is None):
+                st.session_state.history_cursors.append(history_next)
+                st.rerun()
         
         if user_tests:
             # Create DataFrame
             df = pd.DataFrame(user_tests, columns=[
-                'ID', 'Filename', 'File Type', 'Best Platform', 
-                'Gemini Time (s)', 'Unstract Time (s)', 'Document AI Time (s)', 'Date'
+                'ID', 'Filename', 'File Type', 'Best Platform', 'exec_times', 'Date'
             ])
             
-            # Format times
-            for col in ['Gemini Time (s)', 'Unstract Time (s)', 'Document AI Time (s)']:
-                df[col] = df[col].apply(lambda x: f"{x:.2f}" if x is not None else "N/A")
+            # One time column per provider that ran on this page
+            history_providers = expand_exec_times(df)
             
             # Format date
             df['Date'] = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d %H:%M')
@@ -373,11 +610,40 @@ with tab2:
             # Download button
             csv = df.to_csv(index=False)
             st.download_button(
-                label="📥 Download All History as CSV",
+                label="📥 Download This Page as CSV",
                 data=csv,
-                file_name="all_ocr_history.csv",
+                file_name=f"ocr_history_page_{page_number}.csv",
                 mime="text/csv"
             )
+
+            # Raw responses live in blob storage and are only fetched on demand
+            st.markdown("---")
+            st.subheader("🔎 Test Details")
+            detail_id = st.selectbox("Test ID", df['ID'].tolist(), key="history_detail_id")
+            detail_provider = st.selectbox(
+                "Platform", history_providers or list(PLATFORM_LABELS),
+                format_func=platform_label, key="history_detail_provider"
+            )
+            detail_records = get_test_records(detail_id)
+            if detail_records:
+                st.dataframe(
+                    pd.DataFrame(detail_records).drop(columns=["items"]).astype(str),
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+            if st.button("📂 Load Response", key="history_load_payload"):
+                payload = get_test_payload(detail_id, detail_provider)
+                if payload is None:
+                    st.info(f"No {detail_provider} response stored for test #{detail_id}")
+                else:
+                    st.json(payload, expanded=False)
+
+                waterfall = phase_waterfall_chart(get_test_phases(detail_id))
+                if waterfall is not None:
+                    st.altair_chart(waterfall, use_container_width=True)
+        elif page_number > 1:
+            st.info("📭 No more tests on this page.")
         else:
             st.info("📭 No tests found yet!")
             
@@ -393,68 +659,142 @@ with tab3:
     try:
         # Get all statistics
         stats = get_statistics()
+        total_tests = stats[0].tests if stats and stats[0].provider == "_all" else 0
+        # One row per provider; providers with no runs yet are left out
+        provider_stats = [row for row in stats if row.provider != "_all" and row.tests]
     
-        if stats[0] > 0:  # If there are tests
-            total_tests = stats[0]
-            
+        if total_tests > 0:  # If there are tests
             # Overall metrics
             st.subheader("🎯 Overall Performance")
-            col1, col2, col3, col4 = st.columns(4)
+            cols = st.columns(len(provider_stats) + 1)
             
-            with col1:
+            with cols[0]:
                 st.metric("Total Tests", total_tests)
             
-            with col2:
-                gemini_pct = (stats[1] / total_tests * 100) if stats[1] else 0
-                st.metric("🤖 Gemini Wins", f"{stats[1]} ({gemini_pct:.1f}%)")
-            
-            with col3:
-                unstract_pct = (stats[2] / total_tests * 100) if stats[2] else 0
-                st.metric("🔧 Unstract Wins", f"{stats[2]} ({unstract_pct:.1f}%)")
-            
-            with col4:
-                docai_pct = (stats[3] / total_tests * 100) if stats[3] else 0
-                st.metric("📄 Document AI Wins", f"{stats[3]} ({docai_pct:.1f}%)")
+            for col, row in zip(cols[1:], provider_stats):
+                with col:
+                    win_pct = row.wins / total_tests * 100
+                    st.metric(f"{platform_label(row.provider)} Wins", f"{row.wins} ({win_pct:.1f}%)")
             
             st.markdown("---")
             
             # Execution time comparison
             st.subheader("⏱️ Average Execution Time Comparison")
             
-            col1, col2, col3 = st.columns(3)
+            cols = st.columns(max(len(provider_stats), 1))
             
-            with col1:
-                if stats[4]:
-                    st.metric(
-                        "🤖 Gemini AI",
-                        f"{stats[4]:.2f}s",
-                        delta=None
-                    )
-                    st.caption(f"Min: {stats[7]:.2f}s | Max: {stats[10]:.2f}s")
-                else:
-                    st.metric("🤖 Gemini AI", "N/A")
+            for col, row in zip(cols, provider_stats):
+                with col:
+                    if row.avg_time is not None:
+                        st.metric(
+                            platform_label(row.provider),
+                            f"{row.avg_time:.2f}s",
+                            delta=None
+                        )
+                        st.caption(f"Min: {row.min_time:.2f}s | Max: {row.max_time:.2f}s")
+                    else:
+                        st.metric(platform_label(row.provider), "N/A")
             
+            st.markdown("---")
+
+            # Tail latency: averages hide the slow requests that matter for capacity planning
+            st.subheader("📉 Tail Latency")
+
+            rolling = get_rolling_latency_percentiles()
+            if rolling:
+                rolling_df = pd.DataFrame(rolling, columns=[
+                    'Window', 'Platform', 'Samples', 'p50 (s)', 'p90 (s)', 'p95 (s)', 'p99 (s)'
+                ])
+                for col in ['p50 (s)', 'p90 (s)', 'p95 (s)', 'p99 (s)']:
+                    rolling_df[col] = rolling_df[col].apply(lambda x: f"{x:.2f}")
+                st.dataframe(rolling_df, use_container_width=True, hide_index=True)
+
+            col1, col2 = st.columns([1,3])
+            with col1:
+                trend_bucket = st.radio("Bucket", ["hour", "day"], horizontal=True, key="latency_bucket")
+                trend_percentile = st.selectbox("Percentile", ["p50", "p90", "p95", "p99"], index=2, key="latency_percentile")
             with col2:
-                if stats[5]:
-                    st.metric(
-                        "🔧 Unstract",
-                        f"{stats[5]:.2f}s",
-                        delta=None
-                    )
-                    st.caption(f"Min: {stats[8]:.2f}s | Max: {stats[11]:.2f}s")
-                else:
-                    st.metric("🔧 Unstract", "N/A")
-            
-            with col3:
-                if stats[6]:
-                    st.metric(
-                        "📄 Document AI",
-                        f"{stats[6]:.2f}s",
-                        delta=None
-                    )
-                    st.caption(f"Min: {stats[9]:.2f}s | Max: {stats[12]:.2f}s")
+                trend = get_latency_percentiles(
+                    bucket=trend_bucket,
+                    since_hours=24 * 2 if trend_bucket == "hour" else 24 * 30
+                )
+                if trend:
+                    trend_df = pd.DataFrame(trend, columns=['Bucket', 'Platform', 'Samples', 'p50', 'p90', 'p95', 'p99'])
+                    st.line_chart(trend_df.pivot(index='Bucket', columns='Platform', values=trend_percentile))
                 else:
-                    st.metric("📄 Document AI", "N/A")
+                    st.info("No timed tests in this period yet.")
+
+            stream_metrics = get_gemini_stream_metrics()
+            if stream_metrics and stream_metrics.samples:
+                st.subheader("✍️ Gemini Streaming (last 30 days)")
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("TTFT p50", f"{stream_metrics.ttft_p50:.2f}s")
+                with col2:
+                    st.metric("TTFT p95", f"{stream_metrics.ttft_p95:.2f}s")
+                with col3:
+                    st.metric("Tokens / s", f"{stream_metrics.avg_tokens_per_sec:.0f}" if stream_metrics.avg_tokens_per_sec else "N/A")
+                with col4:
+                    st.metric("Avg Total", f"{stream_metrics.avg_total:.2f}s" if stream_metrics.avg_total else "N/A")
+                st.caption(f"{stream_metrics.samples} streamed Gemini runs")
+
+            # Second requests sent to slow calls (HEDGE_ENABLED) and what they bought
+            hedge_stats = get_hedge_stats()
+            if hedge_stats:
+                st.subheader("🪁 Hedged Requests (last 30 days)")
+                hedge_df = pd.DataFrame(hedge_stats, columns=[
+                    'Platform', 'Runs', 'Hedged', 'Hedge Wins', 'Avg Hedge Delay (s)', 'Avg Saved (s)', 'Total Saved (s)'
+                ])
+                hedge_df['Platform'] = hedge_df['Platform'].map(platform_label)
+                hedge_df['Hedge Rate'] = [
+                    f"{hedged / runs * 100:.1f}%" for hedged, runs in zip(hedge_df['Hedged'], hedge_df['Runs'])
+                ]
+                hedge_df['Hedge Win Rate'] = [
+                    f"{wins / hedged * 100:.1f}%" for wins, hedged in zip(hedge_df['Hedge Wins'], hedge_df['Hedged'])
+                ]
+                for col in ['Avg Hedge Delay (s)', 'Avg Saved (s)', 'Total Saved (s)']:
+                    hedge_df[col] = hedge_df[col].apply(lambda x: f"{float(x):.2f}" if x is not None else "N/A")
+                st.dataframe(hedge_df, use_container_width=True, hide_index=True)
+
+            # Image preprocessing: does the smaller upload pay off, and does it cost wins?
+            impact = get_preprocessing_impact()
+            if impact:
+                st.subheader("🗜️ Preprocessing Impact (images, last 30 days)")
+                impact_df = pd.DataFrame(impact, columns=[
+                    'Platform', 'Preprocessed', 'Samples', 'Avg Time (s)', 'p95 (s)',
+                    'Avg Upload (MB)', 'Avg Saved (MB)', 'Avg Preprocess (s)', 'Judged', 'Wins'
+                ])
+                impact_df['Win Rate'] = [
+                    f"{wins / judged * 100:.1f}%" if judged else "N/A"
+                    for wins, judged in zip(impact_df['Wins'], impact_df['Judged'])
+                ]
+                for col in ['Avg Upload (MB)', 'Avg Saved (MB)']:
+                    impact_df[col] = impact_df[col].apply(lambda x: f"{float(x) / 1e6:.2f}" if x is not None else "N/A")
+                for col in ['Avg Time (s)', 'p95 (s)', 'Avg Preprocess (s)']:
+                    impact_df[col] = impact_df[col].apply(lambda x: f"{float(x):.2f}" if x is not None else "N/A")
+                st.dataframe(impact_df, use_container_width=True, hide_index=True)
+
+            # How often providers extract the same values from the same invoice
+            agreement = get_record_agreement()
+            if agreement:
+                st.subheader("🤝 Provider Agreement (last 30 days)")
+                agreement_df = pd.DataFrame(agreement, columns=[
+                    'Provider A', 'Provider B', 'Compared', 'Invoice Number', 'Total', 'Item Count'
+                ])
+                for col in ['Invoice Number', 'Total', 'Item Count']:
+                    agreement_df[col] = agreement_df[col].apply(lambda x: f"{float(x) * 100:.1f}%" if x is not None else "N/A")
+                st.dataframe(agreement_df, use_container_width=True, hide_index=True)
+
+            # Scored against ground truth by the batch tab or `manage.py score`
+            accuracy = get_field_accuracy()
+            if accuracy:
+                st.subheader("🎯 Field Accuracy (last 30 days)")
+                accuracy_df = pd.DataFrame(accuracy, columns=[
+                    'Platform', 'Field', 'Expected', 'Predicted', 'Correct', 'Precision', 'Recall'
+                ])
+                for col in ['Precision', 'Recall']:
+                    accuracy_df[col] = accuracy_df[col].apply(lambda x: f"{float(x) * 100:.1f}%" if x is not None else "N/A")
+                st.dataframe(accuracy_df, use_container_width=True, hide_index=True)
             
             st.markdown("---")
             
@@ -462,26 +802,19 @@ with tab3:
             st.subheader("🏆 Performance Summary")
             
             # Find fastest platform
-            times = {
-                'Gemini AI': stats[4],
-                'Unstract': stats[5],
-                'Document AI': stats[6]
+            valid_times = {
+                platform_label(row.provider): row.avg_time for row in provider_stats if row.avg_time is not None
             }
-            valid_times = {k: v for k, v in times.items() if v is not None}
             
             if valid_times:
                 fastest = min(valid_times, key=valid_times.get)
                 st.success(f"🚀 **Fastest Platform:** {fastest} ({valid_times[fastest]:.2f}s average)")
             
             # Find most accurate platform
-            wins = {
-                'Gemini AI': stats[1],
-                'Unstract': stats[2],
-                'Document AI': stats[3]
-            }
-            most_accurate = max(wins, key=wins.get)
+            wins = {platform_label(row.provider): row.wins for row in provider_stats}
+            most_accurate = max(wins, key=wins.get) if wins else None
             
-            if wins[most_accurate] > 0:
+            if most_accurate and wins[most_accurate] > 0:
                 st.success(f"🎯 **Most Accurate Platform:** {most_accurate} ({wins[most_accurate]} wins, {wins[most_accurate]/total_tests*100:.1f}%)")
             
             # Chart: Win distribution
@@ -489,8 +822,8 @@ with tab3:
             st.subheader("📈 Win Distribution")
             
             win_data = pd.DataFrame({
-                'Platform': ['Gemini AI', 'Unstract', 'Document AI'],
-                'Wins': [stats[1], stats[2], stats[3]]
+                'Platform': list(wins),
+                'Wins': list(wins.values())
             })
             
             st.bar_chart(win_data.set_index('Platform'))
@@ -502,12 +835,11 @@ with tab3:
             recent = get_recent_tests(10)
             
             recent_df = pd.DataFrame(recent, columns=[
-                'Filename', 'Winner', 'Gemini Time', 'Unstract Time', 'Doc AI Time', 'Date'
+                'ID', 'Filename', 'Winner', 'exec_times', 'Date'
             ])
             
             # Format
-            for col in ['Gemini Time', 'Unstract Time', 'Doc AI Time']:
-                recent_df[col] = recent_df[col].apply(lambda x: f"{x:.2f}s" if x is not None else "N/A")
+            expand_exec_times(recent_df, suffix=" Time")
             
             recent_df['Date'] = pd.to_datetime(recent_df['Date']).dt.strftime('%Y-%m-%d %H:%M')
             
@@ -519,6 +851,165 @@ with tab3:
     except Exception as e:
         st.error(f"❌ Error loading statistics: {e}")
 
+# --------------------------
+# Tab 4: Batch Processing
+# --------------------------
+with tab4:
+    st.header("Process a Batch of Invoices")
+    st.markdown("Upload a ZIP archive or several files. Every document is sent to the selected platforms and saved automatically.")
+
+    if 'batch_summary' not in st.session_state:
+        st.session_state.batch_summary = None
+    if 'batch_metrics' not in st.session_state:
+        st.session_state.batch_metrics = None
+
+    batch_files = st.file_uploader(
+        "Select invoices or a ZIP archive",
+        type=['png','jpg','jpeg','pdf','zip'],
+        accept_multiple_files=True,
+        key="batch_upload"
+    )
+    batch_truth = st.file_uploader(
+        "Ground truth (optional): CSV or JSON with a filename column and the expected fields",
+        type=['csv','json','jsonl'],
+        key="batch_truth"
+    )
+
+    col1, col2 = st.columns([1,2])
+    with col1:
+        st.subheader("Platforms")
+        batch_gemini = st.checkbox("🤖 Google Gemini AI", value=True, key="batch_check_gemini")
+        batch_unstract = st.checkbox("🔧 Unstract", value=True, key="batch_check_unstract")
+        batch_force_refresh = st.checkbox("♻️ Force refresh (ignore cached results)", value=False, key="batch_force_refresh")
+        batch_split_pages = st.checkbox("📑 Split multi-page PDFs into pages", value=False, key="batch_split_pages")
+    with col2:
+        st.subheader("Concurrent documents per platform")
+        limit_col1, limit_col2 = st.columns(2)
+        with limit_col1:
+            gemini_limit = st.number_input("Gemini", min_value=1, max_value=32, value=BATCH_CONCURRENCY["gemini"], key="batch_limit_gemini")
+        with limit_col2:
+            unstract_limit = st.number_input("Unstract", min_value=1, max_value=32, value=BATCH_CONCURRENCY["unstract"], key="batch_limit_unstract")
+
+    batch_platforms = [
+        platform for platform, selected in (
+            ("gemini", batch_gemini),
+            ("unstract", batch_unstract),
+            # ("document_ai", batch_documentai)
+        ) if selected
+    ]
+
+    if st.button(
+        "🚀 Process batch",
+        key="batch_process_button",
+        disabled=not batch_files or not batch_platforms,
+        use_container_width=True
+    ):
+        documents = expand_uploads([(f.name, f.getbuffer()) for f in batch_files])
+
+        if not documents:
+            st.warning("No supported invoices (PNG, JPG, PDF) found in the upload.")
+        else:
+            # Shrink each upload once, then reuse cached provider results before fanning out
+            prepare_documents(documents)
+            batch_page_chunk = PAGE_SPLIT_CHUNK_PAGES if batch_split_pages else None
+            for document in documents:
+                document["sha256"] = file_sha256(document["upload"].file_bytes)
+                document["page_chunk"] = cache_variant(document["upload"].file_type, batch_page_chunk)
+                document["cached"] = {} if batch_force_refresh else lookup_cached_results(
+                    document["sha256"], batch_platforms, document["page_chunk"]
+                )
+
+            st.markdown(f"### 🔄 Processing {len(documents)} documents...")
+            batch_progress = st.progress(0)
+            batch_status = st.empty()
+            batch_table = st.empty()
+            summary = []
+            scored = []
+
+            for done, (document, runs) in enumerate(iter_batch_results(
+                documents,
+                batch_platforms,
+                concurrency={"gemini": gemini_limit, "unstract": unstract_limit},
+                page_chunk=batch_page_chunk
+            ), start=1):
+                results = {run.provider: run.result for run in runs}
+                exec_times = {run.provider: run.exec_time for run in runs}
+                records = normalize_results(results)
+                row = {"Filename": document["filename"]}
+
+                for run in runs:
+                    record = records[run.provider]
+                    row[f"{run.provider} status"] = record.status
+                    row[f"{run.provider} time (s)"] = f"{run.exec_time:.2f}" if run.exec_time else "N/A"
+                    row[f"{run.provider} total"] = record.total
+                    row[f"{run.provider} items"] = len(record.items)
+                    if run.provider not in document["cached"]:
+                        store_run(document["sha256"], run, document["page_chunk"])
+                row["Totals agree"] = next(agree for name, _, agree in compare_records(records) if name == "total")
+
+                try:
+                    saved = save_test(
+                        user_id=st.session_state.user_id,
+                        filename=document["filename"],
+                        file_type=document["file_type"],
+                        results=results,
+                        exec_times=exec_times,
+                        best=None,
+                        phases={run.provider: run.phases for run in runs if run.phases},
+                        preprocessing=document["upload"].summary(),
+                        records=records,
+                        cache_hits=set(document["cached"])
+                    )
+                    row["Test ID"] = saved["id"]
+                    scored.extend(
+                        (document["filename"], record, {"test_id": saved["id"], "exec_time": exec_times.get(provider)})
+                        for provider, record in records.items()
+                    )
+                except Exception as e:
+                    row["Test ID"] = f"Not saved: {e}"
+
+                # Keep only the summary row; raw payloads and records are already in the database
+                document["upload"] = None
+                summary.append(row)
+
+                batch_progress.progress(done / len(documents))
+                batch_status.markdown(f"**✅ {done}/{len(documents)} done — last: {document['filename']}**")
+                batch_table.dataframe(pd.DataFrame(summary), use_container_width=True, hide_index=True)
+
+            # Score the whole batch at once and pick the best response without anyone clicking
+            st.session_state.batch_metrics = None
+            if batch_truth and scored:
+                scores = score_fields(records_frame(scored), load_ground_truth(batch_truth))
+                best = pick_best(scores)
+                save_scores(scores, best.to_dict())
+                for row in summary:
+                    row["Best"] = best.get(row["Test ID"])
+                st.session_state.batch_metrics = field_metrics(scores)
+
+            st.session_state.batch_summary = summary
+            st.rerun()
+
+    if st.session_state.batch_summary:
+        summary_df = pd.DataFrame(st.session_state.batch_summary)
+        st.subheader(f"✅ Last batch: {len(summary_df)} documents processed")
+        st.dataframe(summary_df, use_container_width=True, hide_index=True)
+        st.download_button(
+            label="📥 Download Batch Summary as CSV",
+            data=summary_df.to_csv(index=False),
+            file_name="batch_summary.csv",
+            mime="text/csv"
+        )
+
+    if st.session_state.batch_metrics is not None and not st.session_state.batch_metrics.empty:
+        st.subheader("🎯 Field Accuracy vs Ground Truth")
+        metrics_df = st.session_state.batch_metrics.rename(columns={
+            'provider': 'Platform', 'field': 'Field', 'expected': 'Expected', 'predicted': 'Predicted',
+            'correct': 'Correct', 'precision': 'Precision', 'recall': 'Recall', 'f1': 'F1'
+        })
+        for col in ['Precision', 'Recall', 'F1']:
+            metrics_df[col] = metrics_df[col].apply(lambda x: f"{x * 100:.1f}%" if pd.notna(x) else "N/A")
+        st.dataframe(metrics_df, use_container_width=True, hide_index=True)
+
 #Footer
 st.divider()
 # st.markdown("""
@@ -0,0 +1,223 @@
+"""Headless OCR provider benchmark.
+
+Runs every invoice in a directory through the selected providers and writes
+one Parquet row per (document, provider) run:
+
+    python benchmark.py invoices/ --providers gemini unstract --parallelism 8
+
+Run once more with --no-preprocess to measure what image preprocessing does
+to latency and extracted fields. With --ground-truth the extracted fields are
+scored as well, and per-field precision/recall is written next to the runs.
+"""
+import argparse
+import json
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from services import process_with_gemini, run_unstract_workflow, process_with_document_ai
+from services.batch import SUPPORTED_EXTENSIONS, expand_uploads, result_status
+from services.normalize import normalize
+from services.preprocessing import prepare_documents
+from services.scoring import load_ground_truth, records_frame, score_fields, field_metrics, pick_best
+from services.tracing import traced
+
+PROVIDERS = {
+    "gemini": lambda upload: process_with_gemini(upload.file_bytes, upload.filename, upload.file_type),
+    "unstract": lambda upload: run_unstract_workflow(
+        file_bytes=upload.file_bytes, filename=upload.filename, file_type=upload.file_type
+    ),
+    "document_ai": lambda upload: process_with_document_ai(upload.file_bytes, upload.file_type)
+}
+
+SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("started_at", pa.timestamp("us", tz="UTC")),
+    ("filename", pa.string()),
+    ("file_type", pa.string()),
+    ("file_size", pa.int64()),
+    ("upload_size", pa.int64()),
+    ("preprocess_s", pa.float64()),
+    ("preprocess_steps", pa.list_(pa.string())),
+    ("provider", pa.string()),
+    ("status", pa.string()),
+    ("latency_s", pa.float64()),
+    ("ttft_s", pa.float64()),
+    ("tokens_per_sec", pa.float64()),
+    ("response_size", pa.int64()),
+    ("error", pa.string()),
+    ("fields", pa.map_(pa.string(), pa.string())),
+    ("phases", pa.list_(pa.struct([
+        ("phase", pa.string()),
+        ("start", pa.float64()),
+        ("duration", pa.float64())
+    ])))
+])
+
+
+def load_corpus(directory, limit=None):
+    documents = []
+    for path in sorted(Path(directory).rglob("*")):
+        if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS | {".zip"}:
+            relative = str(path.relative_to(directory))
+            documents.extend(expand_uploads([(relative, path.read_bytes())]))
+            if limit and len(documents) >= limit:
+                return documents[:limit]
+    return documents
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}{key}."))
+        return flat
+    if isinstance(value, list):
+        flat = {f"{prefix}count": str(len(value))}
+        for index, item in enumerate(value):
+            flat.update(_flatten(item, f"{prefix}{index}."))
+        return flat
+    return {prefix.rstrip("."): "" if value is None else str(value)}
+
+
+def parsed_fields(provider, result):
+    if result_status(result) == "error":
+        return {}
+
+    if provider == "gemini":
+        return _flatten(result.get("data") or {})
+
+    if provider == "unstract":
+        outputs = [
+            (item.get("result") or {}).get("output", {})
+            for item in result.get("message") or []
+            if isinstance(item, dict)
+        ]
+        return _flatten(outputs[0]) if outputs else {}
+
+    entities = (result.get("document") or {}).get("entities", [])
+    return {entity.get("type", ""): entity.get("mentionText", "") for entity in entities}
+
+
+def run_one(document, provider, run_id):
+    started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    with traced() as trace:
+        try:
+            result = PROVIDERS[provider](document["upload"])
+            error = result.get("error") if isinstance(result, dict) else None
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+            error = str(e)
+    latency = time.perf_counter() - start
+
+    status = result_status(result)
+    metrics = result.get("metrics") or {} if isinstance(result, dict) else {}
+    row = {
+        "run_id": run_id,
+        "started_at": started_at,
+        "filename": document["filename"],
+        "file_type": document["file_type"],
+        "file_size": document["upload"].original_size,
+        "upload_size": len(document["upload"].file_bytes),
+        "preprocess_s": document["upload"].duration,
+        "preprocess_steps": document["upload"].steps,
+        "provider": provider,
+        "status": status,
+        "latency_s": latency,
+        "ttft_s": metrics.get("ttft"),
+        "tokens_per_sec": metrics.get("tokens_per_sec"),
+        "response_size": len(json.dumps(result, default=str).encode("utf-8")),
+        "error": error if status == "error" else None,
+        "fields": list(parsed_fields(provider, result).items()),
+        "phases": trace.spans
+    }
+    return row, normalize(provider, result)
+
+
+def print_summary(rows, wall_time):
+    print("=" * 60)
+    print(f"{len(rows)} runs in {wall_time:.1f}s ({len(rows) / wall_time:.2f} runs/s)")
+    for provider in sorted({row["provider"] for row in rows}):
+        latencies = sorted(row["latency_s"] for row in rows if row["provider"] == provider and row["status"] == "ok")
+        errors = sum(1 for row in rows if row["provider"] == provider and row["status"] == "error")
+        if latencies:
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(f"{provider:12} ok={len(latencies):4} errors={errors:4} "
+                  f"p50={statistics.median(latencies):6.2f}s p95={p95:6.2f}s max={latencies[-1]:6.2f}s")
+        else:
+            print(f"{provider:12} ok=   0 errors={errors:4}")
+    print("=" * 60)
+
+
+def print_scores(scores):
+    metrics = field_metrics(scores)
+    print(metrics.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    wins = pick_best(scores).value_counts()
+    print("Best provider per document: " + ", ".join(f"{provider}={count}" for provider, count in wins.items()))
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR providers over a corpus of invoices")
+    parser.add_argument("corpus", help="Directory with invoices (PNG, JPG, PDF or ZIP archives)")
+    parser.add_argument("--providers", nargs="+", choices=sorted(PROVIDERS), default=["gemini", "unstract"])
+    parser.add_argument("--parallelism", type=int, default=4, help="Concurrent provider calls")
+    parser.add_argument("--limit", type=int, help="Only benchmark the first N documents")
+    parser.add_argument("--no-preprocess", action="store_true", help="Send the files exactly as they are on disk")
+    parser.add_argument("--output", help="Parquet file (default: benchmarks/benchmark_<timestamp>.parquet)")
+    parser.add_argument("--ground-truth", help="CSV or JSON with a filename column; scores every run's fields")
+    args = parser.parse_args()
+    truth = load_ground_truth(args.ground_truth) if args.ground_truth else None
+
+    documents = load_corpus(args.corpus, args.limit)
+    if not documents:
+        parser.error(f"No invoices found in {args.corpus}")
+
+    prepare_documents(documents, enabled=not args.no_preprocess)
+    saved = sum(document["upload"].bytes_saved for document in documents)
+    print(f"Preprocessing {'disabled' if args.no_preprocess else f'saved {saved / 1e6:.1f} MB'}")
+
+    run_id = uuid.uuid4().hex
+    output = Path(args.output or f"benchmarks/benchmark_{datetime.now():%Y%m%d_%H%M%S}.parquet")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    print(f"Benchmark {run_id}: {len(documents)} documents x {args.providers} (parallelism {args.parallelism})")
+
+    rows = []
+    records = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.parallelism) as executor:
+        futures = [
+            executor.submit(run_one, document, provider, run_id)
+            for document in documents
+            for provider in args.providers
+        ]
+        for future in as_completed(futures):
+            row, record = future.result()
+            rows.append(row)
+            records.append((row["filename"], record, {"exec_time": row["latency_s"]}))
+            print(f"[{len(rows)}/{len(futures)}] {row['provider']:12} {row['status']:5} "
+                  f"{row['latency_s']:6.2f}s {row['filename']}")
+    wall_time = time.perf_counter() - start
+
+    pq.write_table(pa.Table.from_pylist(rows, schema=SCHEMA), output, compression="zstd")
+    print_summary(rows, wall_time)
+    print(f"Results written to {output}")
+
+    if truth is not None:
+        scores = score_fields(records_frame(records), truth)
+        scores.insert(0, "run_id", run_id)
+        scores_output = output.with_name(f"{output.stem}_scores.parquet")
+        scores.to_parquet(scores_output, compression="zstd", index=False)
+        print_scores(scores)
+        print(f"Field scores written to {scores_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,39 @@
 from .settings import (
     DB_URL,
     GOOGLE_API_KEY,
+    GEMINI_BASE_URL,
     UNSTRACT_API_KEY,
     UNSTRACT_URL_WORKFLOW,
-    DOCAI_URL
+    DOCAI_URL,
+    RESULT_CACHE_TTL_HOURS,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_MB,
+    PROVIDER_DEADLINES,
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_KEEPALIVE_EXPIRY,
+    BATCH_CONCURRENCY,
+    RATE_LIMITS,
+    RATE_LIMIT_MAX_RETRIES,
+    JOB_STALE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    WORKER_POLL_INTERVAL,
+    QUERY_CACHE_TTL_SECONDS,
+    PREPROCESS_ENABLED,
+    PREPROCESS_MAX_LONG_EDGE,
+    PREPROCESS_GRAYSCALE,
+    PREPROCESS_JPEG_QUALITY,
+    PREPROCESS_REENCODE,
+    PAGE_SPLIT_CHUNK_PAGES,
+    GEMINI_STREAM,
+    CASSETTE_MODE,
+    CASSETTE_PATH,
+    CASSETTE_REPLAY_SPEED,
+    HEDGE_ENABLED,
+    HEDGE_PERCENTILE,
+    HEDGE_BUDGET,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_MIN_DELAY
     # DOCAI_PROJECT_ID,
     # DOCAI_LOCATION,
     # DOCAI_PROCESSOR_ID,
@@ -7,6 +7,8 @@ DB_URL = os.getenv("DATABASE_URL")
 
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Overrides the Gemini API endpoint, e.g. to point at fake_providers.py for load tests
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
 UNSTRACT_API_KEY = os.getenv("UNSTRACT_API_KEY")
 UNSTRACT_URL_WORKFLOW = os.getenv("UNSTRACT_URL_WORKFLOW")
 
@@ -15,4 +17,97 @@ DOCAI_URL = os.getenv("DOCAI_URL")
 # DOCAI_PROJECT_ID = os.getenv("DOCAI_PROJECT_ID")
 # DOCAI_LOCATION = os.getenv("DOCAI_LOCATION", "us")
 # DOCAI_PROCESSOR_ID = os.getenv("DOCAI_PROCESSOR_ID")
-# GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
\ No newline at end of file
+# GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+
+
+# Provider result cache
+RESULT_CACHE_TTL_HOURS = int(os.getenv("RESULT_CACHE_TTL_HOURS", "168"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "5000"))
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "512"))
+
+
+# Per-provider deadlines (seconds) enforced by the async orchestrator
+PROVIDER_DEADLINES = {
+    "gemini": float(os.getenv("GEMINI_DEADLINE", "120")),
+    "unstract": float(os.getenv("UNSTRACT_DEADLINE", "330")),
+    "document_ai": float(os.getenv("DOCUMENT_AI_DEADLINE", "120"))
+}
+
+
+# Connection pools shared by all provider clients
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+
+# Batch mode: maximum in-flight documents per provider
+BATCH_CONCURRENCY = {
+    "gemini": int(os.getenv("BATCH_CONCURRENCY_GEMINI", "4")),
+    "unstract": int(os.getenv("BATCH_CONCURRENCY_UNSTRACT", "2")),
+    "document_ai": int(os.getenv("BATCH_CONCURRENCY_DOCUMENT_AI", "4"))
+}
+
+
+# Per-provider rate limits: (requests per minute, burst, max concurrent calls)
+RATE_LIMITS = {
+    "gemini": (
+        float(os.getenv("GEMINI_RPM", "60")),
+        int(os.getenv("GEMINI_BURST", "5")),
+        int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+    ),
+    "unstract": (
+        float(os.getenv("UNSTRACT_RPM", "30")),
+        int(os.getenv("UNSTRACT_BURST", "3")),
+        int(os.getenv("UNSTRACT_MAX_CONCURRENCY", "4"))
+    ),
+    "document_ai": (
+        float(os.getenv("DOCUMENT_AI_RPM", "120")),
+        int(os.getenv("DOCUMENT_AI_BURST", "5")),
+        int(os.getenv("DOCUMENT_AI_MAX_CONCURRENCY", "8"))
+    )
+}
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5"))
+
+
+# Background job queue
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "900"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "2"))
+
+
+# Dashboard read cache (shared across sessions, cleared after any process writes)
+QUERY_CACHE_TTL_SECONDS = int(os.getenv("QUERY_CACHE_TTL_SECONDS", "60"))
+
+
+# Image preprocessing, run once per upload before fan-out
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_ENABLED", "true").lower() == "true"
+PREPROCESS_MAX_LONG_EDGE = int(os.getenv("PREPROCESS_MAX_LONG_EDGE", "2400"))  # ~200 DPI for an A4 page
+PREPROCESS_GRAYSCALE = os.getenv("PREPROCESS_GRAYSCALE", "false").lower() == "true"
+PREPROCESS_JPEG_QUALITY = int(os.getenv("PREPROCESS_JPEG_QUALITY", "85"))
+# Convert lossless uploads (PNG) to JPEG too; off keeps their format so fine print stays sharp
+PREPROCESS_REENCODE = os.getenv("PREPROCESS_REENCODE", "false").lower() == "true"
+
+
+# Optional page-level parallelism for multi-page PDFs (needs pypdf)
+PAGE_SPLIT_CHUNK_PAGES = int(os.getenv("PAGE_SPLIT_CHUNK_PAGES", "1"))
+
+
+# Stream Gemini responses (time-to-first-token metrics and progressive display)
+GEMINI_STREAM = os.getenv("GEMINI_STREAM", "true").lower() == "true"
+
+
+# Record/replay of provider exchanges: "off", "record" (live calls are saved) or
+# "replay" (answered from the cassette, no network). Replay speed 1 = as recorded, 2 = twice as fast, 0 = no waiting
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassettes/providers.zip")
+CASSETTE_REPLAY_SPEED = float(os.getenv("CASSETTE_REPLAY_SPEED", "1"))
+
+
+# Hedged provider calls: once a call runs past the provider's HEDGE_PERCENTILE latency an
+# identical second request goes out and the first answer wins. HEDGE_BUDGET caps hedges as a
+# fraction of calls (at most 1, i.e. never more than double load)
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_BUDGET = min(1.0, float(os.getenv("HEDGE_BUDGET", "0.1")))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1"))
@@ -3,8 +3,36 @@ from .models import init_db
 from .queries import (
     register_user,
     get_user_tests,
+    next_cursor,
     get_all_tests,
     get_statistics,
+    get_latency_percentiles,
+    get_rolling_latency_percentiles,
+    get_preprocessing_impact,
+    get_gemini_stream_metrics,
+    get_hedge_stats,
+    rebuild_provider_stats,
     get_recent_tests,
-    save_test
+    get_recent_exec_times,
+    save_test,
+    get_blob,
+    get_test_payload,
+    migrate_test_results,
+    get_test_phases,
+    get_test_records,
+    get_record_agreement,
+    get_records_for_scoring,
+    save_scores,
+    get_field_accuracy,
+    invalidate_read_caches,
+    sync_read_caches,
+    get_cached_result,
+    store_cached_result,
+    evict_cached_results,
+    enqueue_job,
+    claim_job,
+    heartbeat_job,
+    complete_job,
+    fail_job,
+    get_job
 )
@@ -0,0 +1,48 @@
+import hashlib
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Raw provider payloads are stored compressed and keyed by the SHA-256 of their
+# canonical JSON, so identical responses (cache hits, re-runs) are stored once.
+ZSTD_LEVEL = 10
+
+
+def canonical_json(payload):
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def encode_payload(payload):
+    raw = canonical_json(payload)
+    sha256 = hashlib.sha256(raw).hexdigest()
+
+    if zstandard is not None:
+        return sha256, "zstd", len(raw), zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return sha256, "zlib", len(raw), zlib.compress(raw, 9)
+
+
+def decode_payload(codec, data):
+    data = bytes(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required to read this payload")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        raw = zlib.decompress(data)
+    else:
+        raw = data
+    return json.loads(raw)
+
+
+def payload_summary(payload, ref, raw_size):
+    # Small enough to keep inline in tests and scan cheaply
+    status = "ok"
+    error = None
+    if isinstance(payload, dict):
+        error = payload.get("error")
+        status = "error" if error or payload.get("status") == "error" else str(payload.get("status") or "ok")
+    return {"status": status, "error": error, "bytes": raw_size, "ref": ref}
@@ -1,5 +1,6 @@
 from sqlalchemy import text
 from .connection import engine
+from .queries import rebuild_provider_stats, copy_legacy_results
 import streamlit as st
 
 def init_db():
@@ -13,31 +14,242 @@ def init_db():
                 );
             """))
             
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS tests (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id),
+                    filename TEXT,
+                    file_type TEXT,
+                    best_response TEXT,
+                    created_at TIMESTAMP DEFAULT NOW()
+                );
+            """))
+
+            # best_response used to be a response_type enum; plain text lets new providers win
             conn.execute(text("""
                 DO $$
                     BEGIN
-                        IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'response_type') THEN
-                        CREATE TYPE response_type AS ENUM ('unstract', 'gemini', 'document_ai');
+                        IF EXISTS (
+                            SELECT 1 FROM information_schema.columns
+                            WHERE table_name = 'tests' AND column_name = 'best_response' AND data_type = 'USER-DEFINED'
+                        ) THEN
+                        ALTER TABLE tests ALTER COLUMN best_response TYPE TEXT USING best_response::text;
                     END IF;
                 END
                 $$ LANGUAGE plpgsql;
             """))
+            conn.execute(text("DROP TYPE IF EXISTS response_type;"))
+
+            # Raw provider payloads, compressed and deduplicated by content hash
             conn.execute(text("""
-                CREATE TABLE IF NOT EXISTS tests (
+                CREATE TABLE IF NOT EXISTS response_blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    raw_size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    data BYTEA NOT NULL,
+                    created_at TIMESTAMP DEFAULT NOW()
+                );
+            """))
+
+            # One row per (test, provider) that ran; created_at mirrors tests.created_at so
+            # per-provider time windows are answered from the index alone
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS test_results (
+                    test_id INTEGER NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+                    provider TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    exec_time NUMERIC,
+                    payload_ref TEXT,
+                    created_at TIMESTAMP DEFAULT NOW(),
+                    PRIMARY KEY (test_id, provider)
+                );
+            """))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_test_results_provider_created
+                ON test_results (provider, created_at DESC) INCLUDE (exec_time, status);
+            """))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_test_results_created
+                ON test_results (created_at DESC);
+            """))
+            # Hedged calls (NULL hedge_delay = no second request was sent)
+            conn.execute(text("""
+                ALTER TABLE test_results
+                    ADD COLUMN IF NOT EXISTS hedge_delay REAL,
+                    ADD COLUMN IF NOT EXISTS hedge_won BOOLEAN,
+                    ADD COLUMN IF NOT EXISTS hedge_saved REAL;
+            """))
+            # Streaming metrics of the call (NULL = the provider does not stream, or a cache hit)
+            conn.execute(text("""
+                ALTER TABLE test_results
+                    ADD COLUMN IF NOT EXISTS ttft REAL,
+                    ADD COLUMN IF NOT EXISTS tokens_per_sec REAL;
+            """))
+            # First start after the upgrade: copy the old per-provider columns of tests
+            if conn.execute(text("SELECT NOT EXISTS (SELECT 1 FROM test_results)")).scalar():
+                copy_legacy_results(conn)
+
+            # Keyset pagination indexes for history and recent-activity queries
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_tests_user_created
+                ON tests (user_id, created_at DESC, id DESC);
+            """))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_tests_created
+                ON tests (created_at DESC, id DESC);
+            """))
+
+            # Provider results keyed by file content, so repeated uploads skip the API
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    file_sha256 TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    response JSONB NOT NULL,
+                    exec_time NUMERIC,
+                    hits INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT NOW(),
+                    last_hit_at TIMESTAMP DEFAULT NOW(),
+                    PRIMARY KEY (file_sha256, provider, model, prompt_version)
+                );
+            """))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_result_cache_last_hit
+                ON result_cache (last_hit_at DESC);
+            """))
+
+            # Bumped after every write; each process compares it to drop stale cached reads
+            conn.execute(text("CREATE SEQUENCE IF NOT EXISTS read_cache_version;"))
+
+            # Running totals per provider, updated by save_test ('_all' counts every test)
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS provider_stats (
+                    provider TEXT PRIMARY KEY,
+                    tests INTEGER NOT NULL DEFAULT 0,
+                    wins INTEGER NOT NULL DEFAULT 0,
+                    time_count INTEGER NOT NULL DEFAULT 0,
+                    time_sum NUMERIC NOT NULL DEFAULT 0,
+                    time_min NUMERIC,
+                    time_max NUMERIC,
+                    updated_at TIMESTAMP DEFAULT NOW()
+                );
+            """))
+            if conn.execute(text("SELECT NOT EXISTS (SELECT 1 FROM provider_stats)")).scalar():
+                rebuild_provider_stats(conn)
+
+            # Per-phase timing of every provider call, for the results waterfall
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS test_phases (
+                    id SERIAL PRIMARY KEY,
+                    test_id INTEGER NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+                    provider TEXT NOT NULL,
+                    phase TEXT NOT NULL,
+                    start_offset NUMERIC NOT NULL,
+                    duration NUMERIC NOT NULL
+                );
+            """))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_test_phases_test
+                ON test_phases (test_id);
+            """))
+
+            # One normalised extraction per (test, provider); comparisons and
+            # analytics run on these instead of the raw payloads
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS invoice_records (
+                    test_id INTEGER NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+                    provider TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    invoice_number TEXT,
+                    issue_date TEXT,
+                    due_date TEXT,
+                    seller_name TEXT,
+                    seller_tax_id TEXT,
+                    buyer_name TEXT,
+                    buyer_tax_id TEXT,
+                    currency TEXT,
+                    subtotal DOUBLE PRECISION,
+                    tax DOUBLE PRECISION,
+                    discount DOUBLE PRECISION,
+                    total DOUBLE PRECISION,
+                    item_count INTEGER NOT NULL DEFAULT 0,
+                    items JSONB,
+                    PRIMARY KEY (test_id, provider)
+                );
+            """))
+
+            # Field-level outcome of scoring a record against ground truth
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS field_scores (
+                    test_id INTEGER NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+                    provider TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    predicted BOOLEAN NOT NULL,
+                    expected BOOLEAN NOT NULL,
+                    correct BOOLEAN NOT NULL,
+                    scored_at TIMESTAMP DEFAULT NOW(),
+                    PRIMARY KEY (test_id, provider, field)
+                );
+            """))
+
+            # Durable work queue consumed by worker.py processes
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS jobs (
                     id SERIAL PRIMARY KEY,
                     user_id INTEGER REFERENCES users(id),
                     filename TEXT,
                     file_type TEXT,
-                    unstract_response JSONB,
-                    exec_time_unstract NUMERIC,
-                    gemini_response JSONB,
-                    exec_time_gemini NUMERIC,
-                    document_ai_response JSONB,
-                    exec_time_document_ai NUMERIC,
-                    best_response response_type,
-                    created_at TIMESTAMP DEFAULT NOW()
+                    file_bytes BYTEA,
+                    providers TEXT[] NOT NULL,
+                    force_refresh BOOLEAN DEFAULT FALSE,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    results JSONB,
+                    exec_times JSONB,
+                    cache_hits TEXT[],
+                    error TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    worker_id TEXT,
+                    locked_at TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT NOW(),
+                    finished_at TIMESTAMP
                 );
             """))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_jobs_pending
+                ON jobs (created_at) WHERE status IN ('queued', 'running');
+            """))
+            conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS phases JSONB;"))
+            conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS preprocessing JSONB;"))
+            conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS page_chunk INTEGER;"))
+
+            # What the preprocessing stage did to the upload (NULL = sent untouched)
+            conn.execute(text("""
+                ALTER TABLE tests
+                    ADD COLUMN IF NOT EXISTS original_size BIGINT,
+                    ADD COLUMN IF NOT EXISTS upload_size BIGINT,
+                    ADD COLUMN IF NOT EXISTS preprocess_time REAL;
+            """))
+
+            # Gemini streaming metrics used to live on tests; move them to its test_results row
+            conn.execute(text("""
+                DO $$
+                    BEGIN
+                        IF EXISTS (
+                            SELECT 1 FROM information_schema.columns
+                            WHERE table_name = 'tests' AND column_name = 'gemini_ttft'
+                        ) THEN
+                        UPDATE test_results r
+                        SET ttft = t.gemini_ttft, tokens_per_sec = t.gemini_tokens_per_sec
+                        FROM tests t
+                        WHERE t.id = r.test_id AND r.provider = 'gemini' AND t.gemini_ttft IS NOT NULL;
+                        ALTER TABLE tests DROP COLUMN gemini_ttft, DROP COLUMN IF EXISTS gemini_tokens_per_sec;
+                    END IF;
+                END
+                $$ LANGUAGE plpgsql;
+            """))
             
         except Exception as e:
             st.error(f"DB Initialization Error: {e}")
@@ -1,5 +1,14 @@
 from sqlalchemy import text
 from .connection import engine
+from .blobs import encode_payload, decode_payload, payload_summary
+from config.settings import (
+    RESULT_CACHE_TTL_HOURS,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_MB,
+    JOB_STALE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    QUERY_CACHE_TTL_SECONDS
+)
 import streamlit as st
 
 def register_user(username):
@@ -58,91 +67,749 @@ def register_user(username):
             raise
 
 
-def get_user_tests(user_id):
+def _keyset(after, prefix=""):
+    # `after` is the (created_at, id) of the last row on the previous page
+    if after is None:
+        return "", {}
+    return (
+        f"AND ({prefix}created_at, {prefix}id) < (:after_created_at, :after_id)",
+        {"after_created_at": after[0], "after_id": after[1]}
+    )
+
+
+def next_cursor(rows, page_size):
+    # rows were fetched with page_size + 1: only the extra row proves there is a next page
+    if len(rows) <= page_size:
+        return None
+    return rows[page_size - 1].created_at, rows[page_size - 1].id
+
+
+# {provider: exec_time} for the test aliased as t; one primary-key probe per row
+_EXEC_TIMES = """
+    (SELECT jsonb_object_agg(r.provider, r.exec_time) FROM test_results r WHERE r.test_id = t.id)
+"""
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
+def get_user_tests(user_id, after=None, page_size=50):
+    keyset, params = _keyset(after)
     with engine.connect() as conn:
         user_tests = conn.execute(
-            text("""
+            text(f"""
                 SELECT 
                     id,
                     filename,
                     file_type,
                     best_response,
-                    exec_time_gemini,
-                    exec_time_unstract,
-                    exec_time_document_ai,
+                    {_EXEC_TIMES} AS exec_times,
                     created_at
-                FROM tests 
-                WHERE user_id = :uid 
-                ORDER BY created_at DESC
+                FROM tests t
+                WHERE user_id = :uid {keyset}
+                ORDER BY created_at DESC, id DESC
+                LIMIT :page_size
             """),
-            {"uid": user_id}
+            {"uid": user_id, "page_size": page_size, **params}
         ).fetchall()
         return user_tests
 
 
-def get_all_tests():
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
+def get_all_tests(after=None, page_size=100):
+    keyset, params = _keyset(after, prefix="t.")
     with engine.connect() as conn:
-        all_tests = conn.execute(text("""
+        all_tests = conn.execute(text(f"""
             SELECT 
                 t.id,
                 u.username,
                 t.filename,
                 t.file_type,
                 t.best_response,
-                t.exec_time_gemini,
-                t.exec_time_unstract,
-                t.exec_time_document_ai,
+                {_EXEC_TIMES} AS exec_times,
                 t.created_at
             FROM tests t
             JOIN users u ON t.user_id = u.id
-            ORDER BY t.created_at DESC
-            LIMIT 100
-        """)).fetchall()
+            WHERE TRUE {keyset}
+            ORDER BY t.created_at DESC, t.id DESC
+            LIMIT :page_size
+        """), {"page_size": page_size, **params}).fetchall()
         return all_tests
 
 
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
 def get_statistics():
+    # Reads the incrementally maintained provider_stats rows instead of scanning tests
+    # One row per provider, '_all' first (its `tests` is the total number of tests)
     with engine.connect() as conn:
         stats = conn.execute(text("""
             SELECT 
-                COUNT(*) as total_tests,
-                COUNT(CASE WHEN best_response = 'gemini' THEN 1 END) as gemini_wins,
-                COUNT(CASE WHEN best_response = 'unstract' THEN 1 END) as unstract_wins,
-                COUNT(CASE WHEN best_response = 'document_ai' THEN 1 END) as docai_wins,
-                AVG(exec_time_gemini) as avg_gemini_time,
-                AVG(exec_time_unstract) as avg_unstract_time,
-                AVG(exec_time_document_ai) as avg_docai_time,
-                MIN(exec_time_gemini) as min_gemini_time,
-                MIN(exec_time_unstract) as min_unstract_time,
-                MIN(exec_time_document_ai) as min_docai_time,
-                MAX(exec_time_gemini) as max_gemini_time,
-                MAX(exec_time_unstract) as max_unstract_time,
-                MAX(exec_time_document_ai) as max_docai_time
-            FROM tests
-        """)).fetchone()
+                provider,
+                tests,
+                wins,
+                time_sum / NULLIF(time_count, 0) AS avg_time,
+                time_min AS min_time,
+                time_max AS max_time
+            FROM provider_stats
+            ORDER BY provider = '_all' DESC, provider
+        """)).fetchall()
         return stats
 
 
-def get_recent_tests(limit=10):
+_PERCENTILES = """
+    COUNT(*) AS samples,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY r.exec_time::float8) AS p50,
+    percentile_cont(0.9) WITHIN GROUP (ORDER BY r.exec_time::float8) AS p90,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY r.exec_time::float8) AS p95,
+    percentile_cont(0.99) WITHIN GROUP (ORDER BY r.exec_time::float8) AS p99
+"""
+
+LATENCY_WINDOWS = {
+    "Last hour": 1,
+    "Last 24 hours": 24,
+    "Last 7 days": 24 * 7,
+    "Last 30 days": 24 * 30
+}
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
+def get_latency_percentiles(bucket="hour", since_hours=24 * 7):
+    if bucket not in ("hour", "day"):
+        raise ValueError(f"Unsupported bucket: {bucket}")
+
+    with engine.connect() as conn:
+        return conn.execute(text(f"""
+            SELECT
+                date_trunc('{bucket}', r.created_at) AS bucket,
+                r.provider,
+                {_PERCENTILES}
+            FROM test_results r
+            WHERE r.exec_time IS NOT NULL
+              AND r.created_at >= NOW() - make_interval(hours => :since_hours)
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """), {"since_hours": since_hours}).fetchall()
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
+def get_rolling_latency_percentiles():
+    windows = ", ".join(f"('{label}', {hours})" for label, hours in LATENCY_WINDOWS.items())
+    with engine.connect() as conn:
+        return conn.execute(text(f"""
+            SELECT
+                w.label AS window,
+                r.provider,
+                {_PERCENTILES}
+            FROM (VALUES {windows}) AS w(label, hours)
+            JOIN test_results r ON r.created_at >= NOW() - make_interval(hours => w.hours)
+            WHERE r.exec_time IS NOT NULL
+            GROUP BY w.label, w.hours, r.provider
+            ORDER BY w.hours, r.provider
+        """)).fetchall()
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
+def get_preprocessing_impact(since_hours=24 * 30):
+    # Same providers, with and without preprocessing: latency, upload size and how often each still wins
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT
+                r.provider,
+                t.preprocess_time IS NOT NULL AS preprocessed,
+                COUNT(*) AS samples,
+                AVG(r.exec_time) AS avg_time,
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY r.exec_time::float8) AS p95,
+                AVG(COALESCE(t.upload_size, t.original_size)) AS avg_upload_bytes,
+                AVG(t.original_size - t.upload_size) FILTER (WHERE t.preprocess_time IS NOT NULL) AS avg_bytes_saved,
+                AVG(t.preprocess_time) AS avg_preprocess_time,
+                COUNT(*) FILTER (WHERE t.best_response IS NOT NULL) AS judged,
+                COUNT(*) FILTER (WHERE t.best_response = r.provider) AS wins
+            FROM test_results r
+            JOIN tests t ON t.id = r.test_id
+            WHERE r.exec_time IS NOT NULL
+              AND t.file_type LIKE 'image/%'
+              AND r.created_at >= NOW() - make_interval(hours => :since_hours)
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """), {"since_hours": since_hours}).fetchall()
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
+def get_gemini_stream_metrics(since_hours=24 * 30):
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT
+                COUNT(*) AS samples,
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY ttft::float8) AS ttft_p50,
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY ttft::float8) AS ttft_p95,
+                AVG(tokens_per_sec) AS avg_tokens_per_sec,
+                AVG(exec_time) AS avg_total
+            FROM test_results
+            WHERE provider = 'gemini'
+              AND ttft IS NOT NULL
+              AND created_at >= NOW() - make_interval(hours => :since_hours)
+        """), {"since_hours": since_hours}).fetchone()
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
+def get_hedge_stats(since_hours=24 * 30):
+    # How often each provider was hedged, how often the second request won and what it saved
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT
+                r.provider,
+                COUNT(*) AS runs,
+                COUNT(r.hedge_delay) AS hedged,
+                COUNT(*) FILTER (WHERE r.hedge_won) AS hedge_wins,
+                AVG(r.hedge_delay) AS avg_delay,
+                AVG(r.hedge_saved) FILTER (WHERE r.hedge_won) AS avg_saved,
+                COALESCE(SUM(r.hedge_saved), 0) AS total_saved
+            FROM test_results r
+            WHERE r.created_at >= NOW() - make_interval(hours => :since_hours)
+            GROUP BY r.provider
+            HAVING COUNT(r.hedge_delay) > 0
+            ORDER BY r.provider
+        """), {"since_hours": since_hours}).fetchall()
+
+
+_seen_cache_version = None
+
+
+def _read_cache_version(conn):
+    return conn.execute(
+        text("SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM read_cache_version")
+    ).scalar()
+
+
+def sync_read_caches():
+    """Drop this process's cached reads when any process (app, manage.py) wrote since the last check."""
+    global _seen_cache_version
+    try:
+        with engine.connect() as conn:
+            version = _read_cache_version(conn)
+    except Exception as e:
+        print(f"Read cache version check failed: {e}")
+        return
+    if _seen_cache_version is not None and version != _seen_cache_version:
+        _clear_read_caches()
+    _seen_cache_version = version
+
+
+def invalidate_read_caches():
+    # Dashboard reads are cached across sessions; drop them once a write commits, and
+    # bump the shared version so other processes drop theirs on their next sync_read_caches()
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("SELECT nextval('read_cache_version')"))
+    except Exception as e:
+        print(f"Read cache version bump failed: {e}")
+    _clear_read_caches()
+
+
+def _clear_read_caches():
+    for query in (
+        get_user_tests,
+        get_all_tests,
+        get_statistics,
+        get_recent_tests,
+        get_latency_percentiles,
+        get_rolling_latency_percentiles,
+        get_preprocessing_impact,
+        get_gemini_stream_metrics,
+        get_hedge_stats,
+        get_record_agreement,
+        get_field_accuracy
+    ):
+        query.clear()
+
+
+def _update_provider_stats(conn, results, exec_times, best):
+    rows = [{"provider": "_all", "ran": 1, "won": 0, "timed": 0, "exec_time": None}]
+    for provider in sorted(set(results) | set(exec_times)):
+        exec_time = exec_times.get(provider)
+        rows.append({
+            "provider": provider,
+            "ran": int(provider in results),
+            "won": int(best == provider),
+            "timed": int(exec_time is not None),
+            "exec_time": exec_time
+        })
+
+    conn.execute(
+        text("""
+            INSERT INTO provider_stats (provider, tests, wins, time_count, time_sum, time_min, time_max)
+            VALUES (:provider, :ran, :won, :timed, COALESCE(:exec_time, 0), :exec_time, :exec_time)
+            ON CONFLICT (provider) DO UPDATE
+            SET tests = provider_stats.tests + EXCLUDED.tests,
+                wins = provider_stats.wins + EXCLUDED.wins,
+                time_count = provider_stats.time_count + EXCLUDED.time_count,
+                time_sum = provider_stats.time_sum + EXCLUDED.time_sum,
+                time_min = LEAST(provider_stats.time_min, EXCLUDED.time_min),
+                time_max = GREATEST(provider_stats.time_max, EXCLUDED.time_max),
+                updated_at = NOW()
+        """),
+        rows
+    )
+
+
+def rebuild_provider_stats(conn=None):
+    if conn is None:
+        with engine.begin() as conn:
+            total = rebuild_provider_stats(conn)
+        invalidate_read_caches()
+        return total
+
+    # Block concurrent save_test calls so the rebuilt totals are exact
+    conn.execute(text("LOCK TABLE tests IN SHARE MODE"))
+    conn.execute(text("DELETE FROM provider_stats"))
+    conn.execute(text("""
+        INSERT INTO provider_stats (provider, tests, wins, time_count, time_sum, time_min, time_max)
+        SELECT '_all', COUNT(*), 0, 0, 0, NULL, NULL FROM tests
+        UNION ALL
+        SELECT
+            r.provider,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE t.best_response = r.provider),
+            COUNT(r.exec_time),
+            COALESCE(SUM(r.exec_time), 0),
+            MIN(r.exec_time),
+            MAX(r.exec_time)
+        FROM test_results r
+        JOIN tests t ON t.id = r.test_id
+        GROUP BY r.provider
+    """))
+    return conn.execute(text("SELECT tests FROM provider_stats WHERE provider = '_all'")).scalar()
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
+def get_recent_tests(limit=10, after=None):
+    keyset, params = _keyset(after)
     with engine.connect() as conn:
-        recent = conn.execute(text("""
+        recent = conn.execute(text(f"""
             SELECT 
+                id,
                 filename,
                 best_response,
-                exec_time_gemini,
-                exec_time_unstract,
-                exec_time_document_ai,
+                {_EXEC_TIMES} AS exec_times,
                 created_at
-            FROM tests
-            ORDER BY created_at DESC
+            FROM tests t
+            WHERE TRUE {keyset}
+            ORDER BY created_at DESC, id DESC
             LIMIT :limit
-        """), {"limit": limit}).fetchall()
+        """), {"limit": limit, **params}).fetchall()
         return recent
 
 
-def save_test(user_id, filename, file_type, results, exec_times, best):
+# Providers that had their own *_response / exec_time_* columns in tests before test_results
+LEGACY_PROVIDERS = ("gemini", "unstract", "document_ai")
+
+
+def get_recent_exec_times(provider, limit=200):
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT exec_time
+            FROM test_results
+            WHERE provider = :provider AND exec_time IS NOT NULL
+            ORDER BY created_at DESC
+            LIMIT :limit
+        """), {"provider": provider, "limit": limit}).fetchall()
+        return [float(row[0]) for row in rows]
+
+
+def _store_payload(conn, payload):
+    sha256, codec, raw_size, data = encode_payload(payload)
+    conn.execute(
+        text("""
+            INSERT INTO response_blobs (sha256, codec, raw_size, stored_size, data)
+            VALUES (:sha256, :codec, :raw_size, :stored_size, :data)
+            ON CONFLICT (sha256) DO NOTHING
+        """),
+        {
+            "sha256": sha256,
+            "codec": codec,
+            "raw_size": raw_size,
+            "stored_size": len(data),
+            "data": data
+        }
+    )
+    return sha256, payload_summary(payload, sha256, raw_size)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def get_blob(sha256):
+    # Blobs are immutable (content-addressed), so no TTL or invalidation is needed
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT codec, data FROM response_blobs WHERE sha256 = :sha256"),
+            {"sha256": sha256}
+        ).fetchone()
+    return decode_payload(row.codec, row.data) if row else None
+
+
+def get_test_payload(test_id, provider):
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("""
+                SELECT r.payload_ref, to_jsonb(t) -> :legacy_column AS inline
+                FROM tests t
+                LEFT JOIN test_results r ON r.test_id = t.id AND r.provider = :provider
+                WHERE t.id = :id
+            """),
+            {"id": test_id, "provider": provider, "legacy_column": f"{provider}_response"}
+        ).fetchone()
+
+    if row is None:
+        return None
+    ref, inline = row
+    # Tests saved before blob storage and not migrated yet still hold the payload inline in tests
+    return get_blob(ref) if ref else inline
+
+
+def _legacy_columns(conn):
+    # Named explicitly: a LIKE '%_response' pattern would also match best_response
+    candidates = [
+        column
+        for provider in LEGACY_PROVIDERS
+        for column in (f"{provider}_response", f"{provider}_response_ref", f"exec_time_{provider}")
+    ]
+    return {
+        row[0] for row in conn.execute(
+            text("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_name = 'tests' AND column_name = ANY(:candidates)
+            """),
+            {"candidates": candidates}
+        )
+    }
+
+
+def copy_legacy_results(conn):
+    """Copy the per-provider column pairs of tests into test_results (idempotent).
+
+    Reads the old columns through to_jsonb(t), so it works whichever of them a
+    database still has; payloads that only exist inline keep payload_ref NULL until
+    migrate_test_results moves them to blob storage.
+    """
+    providers = ", ".join(f"('{provider}')" for provider in LEGACY_PROVIDERS)
+    return conn.execute(text(f"""
+        INSERT INTO test_results (test_id, provider, status, exec_time, payload_ref, created_at)
+        SELECT
+            t.id,
+            p.provider,
+            CASE
+                WHEN l.response ? 'error' OR lower(l.response ->> 'status') IN ('error', 'failed', 'stopped') THEN 'error'
+                ELSE 'ok'
+            END,
+            l.exec_time,
+            l.ref,
+            t.created_at
+        FROM tests t
+        CROSS JOIN (VALUES {providers}) AS p(provider)
+        CROSS JOIN LATERAL (
+            SELECT
+                NULLIF(to_jsonb(t) -> (p.provider || '_response'), 'null'::jsonb) AS response,
+                (to_jsonb(t) ->> ('exec_time_' || p.provider))::numeric AS exec_time,
+                to_jsonb(t) ->> (p.provider || '_response_ref') AS ref
+        ) AS l
+        WHERE l.response IS NOT NULL OR l.exec_time IS NOT NULL OR l.ref IS NOT NULL
+        ON CONFLICT (test_id, provider) DO NOTHING
+    """)).rowcount
+
+
+def migrate_test_results(batch_size=100, drop_legacy=False):
+    """Move tests saved with per-provider columns to test_results and blob storage.
+
+    Returns (results_copied, payloads_moved). With drop_legacy the old columns are
+    dropped afterwards, which is only safe once every payload has a payload_ref.
+    """
+    with engine.begin() as conn:
+        if not _legacy_columns(conn):
+            return 0, 0
+        copied = copy_legacy_results(conn)
+
+    moved = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT r.test_id, r.provider, to_jsonb(t) -> (r.provider || '_response') AS payload
+                    FROM test_results r
+                    JOIN tests t ON t.id = r.test_id
+                    WHERE r.payload_ref IS NULL
+                      AND NULLIF(to_jsonb(t) -> (r.provider || '_response'), 'null'::jsonb) IS NOT NULL
+                    ORDER BY r.test_id
+                    LIMIT :batch_size
+                    FOR UPDATE OF r SKIP LOCKED
+                """),
+                {"batch_size": batch_size}
+            ).fetchall()
+            if not rows:
+                break
+
+            for row in rows:
+                ref, _ = _store_payload(conn, row.payload)
+                conn.execute(
+                    text("UPDATE test_results SET payload_ref = :ref WHERE test_id = :test_id AND provider = :provider"),
+                    {"ref": ref, "test_id": row.test_id, "provider": row.provider}
+                )
+            moved += len(rows)
+
+    if drop_legacy:
+        with engine.begin() as conn:
+            for column in sorted(_legacy_columns(conn)):
+                conn.execute(text(f'ALTER TABLE tests DROP COLUMN IF EXISTS "{column}"'))
+        invalidate_read_caches()
+    return copied, moved
+
+
+def _insert_phases(conn, test_id, phases):
+    rows = [
+        {
+            "test_id": test_id,
+            "provider": provider,
+            "phase": span["phase"],
+            "start_offset": span["start"],
+            "duration": span["duration"]
+        }
+        for provider, spans in phases.items()
+        for span in spans
+    ]
+    if rows:
+        conn.execute(
+            text("""
+                INSERT INTO test_phases (test_id, provider, phase, start_offset, duration)
+                VALUES (:test_id, :provider, :phase, :start_offset, :duration)
+            """),
+            rows
+        )
+
+
+RECORD_COLUMNS = (
+    "provider", "status", "error",
+    "invoice_number", "issue_date", "due_date",
+    "seller_name", "seller_tax_id", "buyer_name", "buyer_tax_id", "currency",
+    "subtotal", "tax", "discount", "total",
+    "item_count", "items"
+)
+
+
+def _insert_records(conn, test_id, records):
     import json
-    
+
+    rows = []
+    for record in records.values():
+        row = record.to_row()
+        row["items"] = json.dumps(row["items"])
+        row["test_id"] = test_id
+        rows.append(row)
+    if rows:
+        columns = ", ".join(RECORD_COLUMNS)
+        values = ", ".join(f":{column}" for column in RECORD_COLUMNS)
+        conn.execute(
+            text(f"INSERT INTO invoice_records (test_id, {columns}) VALUES (:test_id, {values})"),
+            rows
+        )
+
+
+def get_test_records(test_id):
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(f"SELECT {', '.join(RECORD_COLUMNS)} FROM invoice_records WHERE test_id = :test_id ORDER BY provider"),
+            {"test_id": test_id}
+        ).mappings().fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_records_for_scoring(since_hours=None, unjudged_only=True):
+    # One row per (test, provider) in the shape services.scoring.score_fields expects
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT
+                t.id AS test_id,
+                t.filename,
+                r.provider,
+                r.status,
+                r.invoice_number, r.issue_date, r.due_date,
+                r.seller_name, r.seller_tax_id, r.buyer_name, r.buyer_tax_id, r.currency,
+                r.subtotal, r.tax, r.discount, r.total,
+                r.item_count,
+                (SELECT SUM(amount::float) FROM jsonb_array_elements_text(r.items->'amount') AS amount) AS items_total,
+                x.exec_time::float AS exec_time
+            FROM invoice_records r
+            JOIN tests t ON t.id = r.test_id
+            LEFT JOIN test_results x ON x.test_id = r.test_id AND x.provider = r.provider
+            WHERE (:since_hours IS NULL OR t.created_at >= NOW() - make_interval(hours => :since_hours))
+              {"AND t.best_response IS NULL" if unjudged_only else ""}
+            ORDER BY t.id, r.provider
+        """), {"since_hours": since_hours}).mappings().fetchall()
+    return [dict(row) for row in rows]
+
+
+def save_scores(scores, best):
+    """Store field scores and fill best_response on tests nobody has judged yet.
+
+    scores is the frame from services.scoring.score_fields (with a test_id column),
+    best maps test_id -> provider. Returns how many tests got a best_response.
+    """
+    rows = [
+        {
+            "test_id": int(test_id),
+            "provider": provider,
+            "field": field,
+            "predicted": bool(predicted),
+            "expected": bool(expected),
+            "correct": bool(correct)
+        }
+        for test_id, provider, field, predicted, expected, correct in scores[
+            ["test_id", "provider", "field", "predicted", "expected", "correct"]
+        ].itertuples(index=False)
+    ]
+    judged = [{"test_id": int(test_id), "best": provider} for test_id, provider in best.items()]
+
+    with engine.begin() as conn:
+        if rows:
+            conn.execute(
+                text("""
+                    INSERT INTO field_scores (test_id, provider, field, predicted, expected, correct)
+                    VALUES (:test_id, :provider, :field, :predicted, :expected, :correct)
+                    ON CONFLICT (test_id, provider, field) DO UPDATE
+                    SET predicted = EXCLUDED.predicted,
+                        expected = EXCLUDED.expected,
+                        correct = EXCLUDED.correct,
+                        scored_at = NOW()
+                """),
+                rows
+            )
+
+        filled = []
+        for row in judged:
+            # Manual judgements win; only tests without a best_response are filled in
+            updated = conn.execute(
+                text("""
+                    UPDATE tests SET best_response = :best
+                    WHERE id = :test_id AND best_response IS NULL
+                    RETURNING best_response
+                """),
+                row
+            ).fetchone()
+            if updated:
+                filled.append(updated[0])
+
+        if filled:
+            conn.execute(
+                text("UPDATE provider_stats SET wins = wins + :won, updated_at = NOW() WHERE provider = :provider"),
+                [{"provider": provider, "won": filled.count(provider)} for provider in set(filled)]
+            )
+
+    invalidate_read_caches()
+    return len(filled)
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
+def get_field_accuracy(since_hours=24 * 30):
+    # Precision = correct / predicted, recall = correct / expected, per provider and field
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT
+                s.provider,
+                s.field,
+                COUNT(*) FILTER (WHERE s.expected) AS expected,
+                COUNT(*) FILTER (WHERE s.predicted) AS predicted,
+                COUNT(*) FILTER (WHERE s.correct) AS correct,
+                COUNT(*) FILTER (WHERE s.correct)::float / NULLIF(COUNT(*) FILTER (WHERE s.predicted), 0) AS precision,
+                COUNT(*) FILTER (WHERE s.correct)::float / NULLIF(COUNT(*) FILTER (WHERE s.expected), 0) AS recall
+            FROM field_scores s
+            JOIN tests t ON t.id = s.test_id
+            WHERE t.created_at >= NOW() - make_interval(hours => :since_hours)
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """), {"since_hours": since_hours}).fetchall()
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL_SECONDS, show_spinner=False)
+def get_record_agreement(since_hours=24 * 30):
+    # How often each pair of providers extracted the same key fields from the same invoice
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT
+                a.provider AS provider_a,
+                b.provider AS provider_b,
+                COUNT(*) AS compared,
+                AVG((upper(a.invoice_number) = upper(b.invoice_number))::int)
+                    FILTER (WHERE a.invoice_number <> '' AND b.invoice_number <> '') AS invoice_number_agreement,
+                AVG((abs(a.total - b.total) <= 0.01)::int)
+                    FILTER (WHERE a.total IS NOT NULL AND b.total IS NOT NULL) AS total_agreement,
+                AVG((a.item_count = b.item_count)::int) AS item_count_agreement
+            FROM invoice_records a
+            JOIN invoice_records b ON b.test_id = a.test_id AND b.provider > a.provider
+            JOIN tests t ON t.id = a.test_id
+            WHERE a.status = 'ok'
+              AND b.status = 'ok'
+              AND t.created_at >= NOW() - make_interval(hours => :since_hours)
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """), {"since_hours": since_hours}).fetchall()
+
+
+def get_test_phases(test_id):
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT provider, phase, start_offset, duration
+                FROM test_phases
+                WHERE test_id = :test_id
+                ORDER BY provider, start_offset
+            """),
+            {"test_id": test_id}
+        ).fetchall()
+
+    phases = {}
+    for provider, name, start_offset, duration in rows:
+        phases.setdefault(provider, []).append({
+            "phase": name,
+            "start": float(start_offset),
+            "duration": float(duration)
+        })
+    return phases
+
+
+def _insert_results(conn, test_id, results, exec_times, cache_hits=()):
+    from services.batch import result_status
+
+    # Raw payloads go to response_blobs; test_results keeps one narrow row per provider
+    rows = []
+    for provider, payload in results.items():
+        ref, _ = _store_payload(conn, payload)
+        hedge = (payload.get("hedge") if isinstance(payload, dict) else None) or {}
+        metrics = {} if provider in cache_hits else (payload.get("metrics") if isinstance(payload, dict) else None) or {}
+        rows.append({
+            "test_id": test_id,
+            "provider": provider,
+            "status": result_status(payload),
+            "exec_time": exec_times.get(provider),
+            "payload_ref": ref,
+            "hedge_delay": hedge.get("delay"),
+            "hedge_won": hedge.get("won"),
+            "hedge_saved": hedge.get("saved"),
+            "ttft": metrics.get("ttft"),
+            "tokens_per_sec": metrics.get("tokens_per_sec")
+        })
+    if rows:
+        conn.execute(
+            text("""
+                INSERT INTO test_results (
+                    test_id, provider, status, exec_time, payload_ref, hedge_delay, hedge_won, hedge_saved,
+                    ttft, tokens_per_sec
+                )
+                VALUES (
+                    :test_id, :provider, :status, :exec_time, :payload_ref, :hedge_delay, :hedge_won, :hedge_saved,
+                    :ttft, :tokens_per_sec
+                )
+            """),
+            rows
+        )
+
+
+def save_test(user_id, filename, file_type, results, exec_times, best, phases=None, preprocessing=None, records=None,
+              cache_hits=()):
     print("=" * 60)
     print("DEBUG SAVE_TEST:")
     print(f"user_id: {user_id}")
@@ -153,19 +820,22 @@ def save_test(user_id, filename, file_type, results, exec_times, best):
     print(f"best: {best}")
     print("=" * 60)
     
+    # A cache hit replays an earlier run: its time and stream metrics are not new samples
+    cache_hits = set(cache_hits or ())
+    exec_times = {provider: None if provider in cache_hits else value for provider, value in exec_times.items()}
+
     try:
         with engine.begin() as conn:
+            preprocessing = preprocessing or {}
             data = {
                 "uid": user_id,
                 "filename": filename,
                 "file_type": file_type,
-                "gemini": json.dumps(results.get("gemini")) if "gemini" in results else None,
-                "exec_gemini": exec_times.get("gemini"),
-                "docai": json.dumps(results.get("document_ai")) if "document_ai" in results else None,
-                "exec_docai": exec_times.get("document_ai"),
-                "unstract": json.dumps(results.get("unstract")) if "unstract" in results else None,
-                "exec_unstract": exec_times.get("unstract"),
-                "best": best
+                "best": best,
+                "original_size": preprocessing.get("original_size"),
+                "upload_size": preprocessing.get("size"),
+                # Only set when the upload was actually changed, so it doubles as the "preprocessed" flag
+                "preprocess_time": preprocessing.get("duration") if preprocessing.get("steps") else None
             }
 
             result = conn.execute(
@@ -174,25 +844,19 @@ def save_test(user_id, filename, file_type, results, exec_times, best):
                         user_id,
                         filename,
                         file_type,
-                        gemini_response,
-                        exec_time_gemini,
-                        document_ai_response,
-                        exec_time_document_ai,
-                        unstract_response,
-                        exec_time_unstract,
-                        best_response
+                        best_response,
+                        original_size,
+                        upload_size,
+                        preprocess_time
                     )
                     VALUES (
                         :uid,
                         :filename,
                         :file_type,
-                        :gemini,
-                        :exec_gemini,
-                        :docai,
-                        :exec_docai,
-                        :unstract,
-                        :exec_unstract,
-                        :best
+                        :best,
+                        :original_size,
+                        :upload_size,
+                        :preprocess_time
                     )
                     RETURNING id
                 """),
@@ -200,12 +864,240 @@ def save_test(user_id, filename, file_type, results, exec_times, best):
             )
             
             inserted_id = result.fetchone()[0]
-            print(f"Saved ID: {inserted_id}")
-            return {"success": True, "id": inserted_id}
+            _insert_results(conn, inserted_id, results, exec_times, cache_hits)
+            _update_provider_stats(conn, results, exec_times, best)
+            _insert_phases(conn, inserted_id, phases or {})
+            _insert_records(conn, inserted_id, records or {})
+
+        invalidate_read_caches()
+        print(f"Saved ID: {inserted_id}")
+        return {"success": True, "id": inserted_id}
             
     except Exception as e:
         print(f"ERROR")
         print(f"Error type: {type(e).__name__}")
         import traceback
         traceback.print_exc()
-        raise
\ No newline at end of file
+        raise
+
+
+def get_cached_result(file_sha256, provider, model, prompt_version, ttl_hours=RESULT_CACHE_TTL_HOURS):
+    with engine.begin() as conn:
+        row = conn.execute(
+            text("""
+                UPDATE result_cache
+                SET hits = hits + 1, last_hit_at = NOW()
+                WHERE file_sha256 = :sha
+                  AND provider = :provider
+                  AND model = :model
+                  AND prompt_version = :version
+                  AND created_at > NOW() - make_interval(hours => :ttl)
+                RETURNING response, exec_time
+            """),
+            {
+                "sha": file_sha256,
+                "provider": provider,
+                "model": model,
+                "version": prompt_version,
+                "ttl": ttl_hours
+            }
+        ).fetchone()
+
+        if row is None:
+            return None
+        return row[0], float(row[1]) if row[1] is not None else None
+
+
+def store_cached_result(file_sha256, provider, model, prompt_version, response, exec_time):
+    import json
+
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO result_cache (
+                    file_sha256, provider, model, prompt_version, response, exec_time
+                )
+                VALUES (:sha, :provider, :model, :version, :response, :exec_time)
+                ON CONFLICT (file_sha256, provider, model, prompt_version) DO UPDATE
+                SET response = EXCLUDED.response,
+                    exec_time = EXCLUDED.exec_time,
+                    hits = 0,
+                    created_at = NOW(),
+                    last_hit_at = NOW()
+            """),
+            {
+                "sha": file_sha256,
+                "provider": provider,
+                "model": model,
+                "version": prompt_version,
+                "response": json.dumps(response),
+                "exec_time": exec_time
+            }
+        )
+        _evict_cached_results(conn, RESULT_CACHE_TTL_HOURS, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_MB)
+
+
+def evict_cached_results(ttl_hours=RESULT_CACHE_TTL_HOURS, max_entries=RESULT_CACHE_MAX_ENTRIES, max_mb=RESULT_CACHE_MAX_MB):
+    with engine.begin() as conn:
+        return _evict_cached_results(conn, ttl_hours, max_entries, max_mb)
+
+
+def _evict_cached_results(conn, ttl_hours, max_entries, max_mb):
+    # Drop expired entries, then the least recently hit ones beyond the count/size budget
+    expired = conn.execute(
+        text("""
+            DELETE FROM result_cache
+            WHERE created_at <= NOW() - make_interval(hours => :ttl)
+        """),
+        {"ttl": ttl_hours}
+    ).rowcount
+
+    overflow = conn.execute(
+        text("""
+            DELETE FROM result_cache
+            WHERE ctid IN (
+                SELECT ctid FROM (
+                    SELECT
+                        ctid,
+                        ROW_NUMBER() OVER w AS position,
+                        SUM(pg_column_size(response)) OVER w AS running_bytes
+                    FROM result_cache
+                    WINDOW w AS (ORDER BY last_hit_at DESC)
+                ) ranked
+                WHERE position > :max_entries
+                   OR running_bytes > :max_bytes
+            )
+        """),
+        {"max_entries": max_entries, "max_bytes": max_mb * 1024 * 1024}
+    ).rowcount
+
+    return expired + overflow
+
+
+def enqueue_job(user_id, filename, file_type, file_bytes, providers, force_refresh=False, page_chunk=None):
+    with engine.begin() as conn:
+        return conn.execute(
+            text("""
+                INSERT INTO jobs (user_id, filename, file_type, file_bytes, providers, force_refresh, page_chunk)
+                VALUES (:uid, :filename, :file_type, :file_bytes, :providers, :force_refresh, :page_chunk)
+                RETURNING id
+            """),
+            {
+                "uid": user_id,
+                "filename": filename,
+                "file_type": file_type,
+                "file_bytes": bytes(file_bytes),
+                "providers": list(providers),
+                "force_refresh": force_refresh,
+                "page_chunk": page_chunk
+            }
+        ).fetchone()[0]
+
+
+def claim_job(worker_id, stale_after=JOB_STALE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+    with engine.begin() as conn:
+        # Jobs whose worker died mid-flight too many times are given up on
+        conn.execute(
+            text("""
+                UPDATE jobs
+                SET status = 'failed', error = 'Worker lost too many times', finished_at = NOW()
+                WHERE status = 'running'
+                  AND locked_at < NOW() - make_interval(secs => :stale)
+                  AND attempts >= :max_attempts
+            """),
+            {"stale": stale_after, "max_attempts": max_attempts}
+        )
+
+        return conn.execute(
+            text("""
+                UPDATE jobs
+                SET status = 'running',
+                    worker_id = :worker_id,
+                    locked_at = NOW(),
+                    attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued'
+                       OR (status = 'running' AND locked_at < NOW() - make_interval(secs => :stale))
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, user_id, filename, file_type, file_bytes, providers, force_refresh, page_chunk, attempts
+            """),
+            {"worker_id": worker_id, "stale": stale_after}
+        ).fetchone()
+
+
+def heartbeat_job(job_id, worker_id):
+    # Keeps a long job from looking stale; False once another worker has taken it over
+    with engine.begin() as conn:
+        return conn.execute(
+            text("""
+                UPDATE jobs
+                SET locked_at = NOW()
+                WHERE id = :id AND worker_id = :worker_id AND status = 'running'
+            """),
+            {"id": job_id, "worker_id": worker_id}
+        ).rowcount > 0
+
+
+def complete_job(job_id, worker_id, results, exec_times, cache_hits, phases=None, preprocessing=None):
+    import json
+
+    # Only the current owner may finish the job; a worker that lost it must not overwrite
+    with engine.begin() as conn:
+        return conn.execute(
+            text("""
+                UPDATE jobs
+                SET status = 'done',
+                    results = :results,
+                    exec_times = :exec_times,
+                    cache_hits = :cache_hits,
+                    phases = :phases,
+                    preprocessing = :preprocessing,
+                    file_bytes = NULL,
+                    finished_at = NOW()
+                WHERE id = :id AND worker_id = :worker_id AND status = 'running'
+            """),
+            {
+                "id": job_id,
+                "worker_id": worker_id,
+                "results": json.dumps(results),
+                "exec_times": json.dumps(exec_times),
+                "cache_hits": list(cache_hits),
+                "phases": json.dumps(phases or {}),
+                "preprocessing": json.dumps(preprocessing) if preprocessing else None
+            }
+        ).rowcount > 0
+
+
+def fail_job(job_id, worker_id, error, max_attempts=JOB_MAX_ATTEMPTS):
+    # Requeued while attempts remain; the upload is only dropped once the job is given up on
+    with engine.begin() as conn:
+        return conn.execute(
+            text("""
+                UPDATE jobs
+                SET status = CASE WHEN attempts < :max_attempts THEN 'queued' ELSE 'failed' END,
+                    error = :error,
+                    worker_id = CASE WHEN attempts < :max_attempts THEN NULL ELSE worker_id END,
+                    locked_at = CASE WHEN attempts < :max_attempts THEN NULL ELSE locked_at END,
+                    file_bytes = CASE WHEN attempts < :max_attempts THEN file_bytes END,
+                    finished_at = CASE WHEN attempts < :max_attempts THEN NULL ELSE NOW() END
+                WHERE id = :id AND worker_id = :worker_id AND status = 'running'
+                RETURNING status
+            """),
+            {"id": job_id, "worker_id": worker_id, "error": error, "max_attempts": max_attempts}
+        ).scalar()
+
+
+def get_job(job_id):
+    with engine.connect() as conn:
+        return conn.execute(
+            text("""
+                SELECT id, status, attempts, results, exec_times, cache_hits, phases, preprocessing, error
+                FROM jobs
+                WHERE id = :id
+            """),
+            {"id": job_id}
+        ).fetchone()
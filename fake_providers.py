@@ -0,0 +1,378 @@
+"""Local stand-ins for Gemini, Unstract and Document AI, for load testing without network.
+
+Each fake speaks the same HTTP contract the services use, with latencies drawn
+from a log-normal distribution and configurable error and 429 rates:
+
+    python fake_providers.py --port 8765 --latency gemini=3 unstract=20,0.6 --throttle-rate 0.05
+
+then point the app, worker or benchmark at it:
+
+    GEMINI_BASE_URL=http://127.0.0.1:8765/gemini
+    UNSTRACT_URL_WORKFLOW=http://127.0.0.1:8765/unstract/
+    DOCAI_URL=http://127.0.0.1:8765/documentai/v1/processors/fake:process
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROVIDERS = ("gemini", "unstract", "document_ai")
+
+
+@dataclass
+class LatencyProfile:
+    """Log-normal latency (median seconds, sigma) plus failure rates for one provider."""
+
+    median: float
+    sigma: float = 0.35
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+
+    def sample(self):
+        return self.median * math.exp(random.gauss(0.0, self.sigma))
+
+    def outcome(self):
+        draw = random.random()
+        if draw < self.throttle_rate:
+            return "throttled"
+        if draw < self.throttle_rate + self.error_rate:
+            return "error"
+        return "ok"
+
+
+DEFAULT_PROFILES = {
+    "gemini": LatencyProfile(4.0),
+    "unstract": LatencyProfile(15.0, sigma=0.5),
+    "document_ai": LatencyProfile(2.5)
+}
+
+
+def _b64decode(data):
+    # google-genai sends URL-safe base64 (-/_) which b64decode would silently drop; accept both alphabets
+    data = data.strip()
+    return base64.b64decode(data + "=" * (-len(data) % 4), altchars=b"-_")
+
+
+def fake_invoice(seed):
+    """A deterministic invoice per document, so repeated runs extract the same fields."""
+    rng = random.Random(seed)
+    items = []
+    for index in range(rng.randint(1, 6)):
+        quantity = rng.randint(1, 10)
+        unit_price = round(rng.uniform(5, 500), 2)
+        items.append({
+            "description": f"Item {index + 1}",
+            "quantity": str(quantity),
+            "unitPrice": f"{unit_price:.2f}",
+            "subtotal": f"{quantity * unit_price:.2f}"
+        })
+    subtotal = round(sum(float(item["subtotal"]) for item in items), 2)
+    tax = round(subtotal * 0.21, 2)
+    return {
+        "documentType": "invoice",
+        "invoiceNumber": f"F-{seed[:6].upper()}",
+        "issueDate": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "seller": {"name": "Fake Supplies S.L.", "taxId": "B12345678"},
+        "buyer": {"name": "Load Test Corp", "taxId": "A87654321"},
+        "items": items,
+        "subtotal": f"{subtotal:.2f}",
+        "tax": f"{tax:.2f}",
+        "total": f"{subtotal + tax:.2f}",
+        "currency": "EUR"
+    }
+
+
+def _document_ai_response(invoice):
+    def entity(entity_type, value):
+        return {"type": entity_type, "mentionText": value, "confidence": round(random.uniform(0.8, 1.0), 3)}
+
+    entities = [
+        entity("invoice_id", invoice["invoiceNumber"]),
+        entity("invoice_date", invoice["issueDate"]),
+        entity("supplier_name", invoice["seller"]["name"]),
+        entity("supplier_tax_id", invoice["seller"]["taxId"]),
+        entity("receiver_name", invoice["buyer"]["name"]),
+        entity("currency", invoice["currency"]),
+        entity("net_amount", invoice["subtotal"]),
+        entity("total_tax_amount", invoice["tax"]),
+        entity("total_amount", invoice["total"])
+    ]
+    for item in invoice["items"]:
+        line = entity("line_item", item["description"])
+        line["properties"] = [
+            entity("line_item/description", item["description"]),
+            entity("line_item/quantity", item["quantity"]),
+            entity("line_item/unit_price", item["unitPrice"]),
+            entity("line_item/amount", item["subtotal"])
+        ]
+        entities.append(line)
+    return {"document": {"mimeType": "application/pdf", "text": json.dumps(invoice), "entities": entities, "pages": [{}]}}
+
+
+class FakeProviders:
+    """State shared by the request handlers: profiles and in-flight Unstract executions."""
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.executions = {}
+        self.lock = threading.Lock()
+        self.requests = {provider: 0 for provider in PROVIDERS}
+
+    def count(self, provider):
+        with self.lock:
+            self.requests[provider] += 1
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeProviders/1.0"
+
+    @property
+    def fakes(self):
+        return self.server.fakes
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _document_seed(self, body):
+        # Hash the document itself rather than the request, so every provider
+        # (and every retry) sees the same invoice for the same file
+        try:
+            if self.path.startswith("/unstract"):
+                start = body.index(b"\r\n\r\n") + 4
+                document = body[start:body.rindex(b"\r\n--")]
+            elif self.path.startswith("/documentai/"):
+                document = _b64decode(json.loads(body)["rawDocument"]["content"])
+            else:
+                parts = json.loads(body)["contents"][0]["parts"]
+                inline = next(part.get("inlineData") or part.get("inline_data") for part in parts if "inlineData" in part or "inline_data" in part)
+                document = _b64decode(inline["data"])
+        except (ValueError, KeyError, IndexError, StopIteration):
+            document = body
+        return hashlib.sha256(document).hexdigest()
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _throttled(self, retry_after=1):
+        self._send_json(
+            429,
+            {"error": {"code": 429, "message": "Resource has been exhausted (fake)", "status": "RESOURCE_EXHAUSTED"}},
+            {"Retry-After": str(retry_after)}
+        )
+
+    def _failed(self):
+        self._send_json(500, {"error": {"code": 500, "message": "Internal error (fake)", "status": "INTERNAL"}})
+
+    def do_HEAD(self):
+        # Connection warm-up
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        path = urllib.parse.urlparse(self.path).path
+        seed = self._document_seed(self._read_body())
+        if path.startswith("/gemini/"):
+            self._gemini(path, seed)
+        elif path.startswith("/unstract"):
+            self._unstract_submit(path, seed)
+        elif path.startswith("/documentai/"):
+            self._document_ai(seed)
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        if parsed.path.startswith("/unstract"):
+            self._unstract_status(urllib.parse.parse_qs(parsed.query).get("execution_id", [None])[0])
+        else:
+            self._send_json(404, {"error": f"Unknown path {parsed.path}"})
+
+    # --------------------------
+    # Document AI: rawDocument JSON in, document.entities out
+    # --------------------------
+    def _document_ai(self, seed):
+        self.fakes.count("document_ai")
+        profile = self.fakes.profiles["document_ai"]
+        outcome = profile.outcome()
+        if outcome == "throttled":
+            return self._throttled()
+        time.sleep(profile.sample())
+        if outcome == "error":
+            return self._failed()
+        self._send_json(200, _document_ai_response(fake_invoice(seed)))
+
+    # --------------------------
+    # Unstract: multipart POST, then status_api polling by execution_id
+    # --------------------------
+    def _unstract_submit(self, path, seed):
+        self.fakes.count("unstract")
+        profile = self.fakes.profiles["unstract"]
+        outcome = profile.outcome()
+        if outcome == "throttled":
+            return self._throttled(retry_after=2)
+
+        execution_id = uuid.uuid4().hex
+        with self.fakes.lock:
+            self.fakes.executions[execution_id] = (time.monotonic() + profile.sample(), outcome, seed)
+        self._send_json(200, {
+            "message": {
+                "execution_status": "PENDING",
+                "execution_id": execution_id,
+                "status_api": f"{path.rstrip('/')}/?execution_id={execution_id}"
+            }
+        })
+
+    def _unstract_status(self, execution_id):
+        with self.fakes.lock:
+            execution = self.fakes.executions.get(execution_id)
+        if execution is None:
+            return self._send_json(422, {"status": "ERROR", "error": f"Unknown execution_id {execution_id}"})
+
+        ready_at, outcome, seed = execution
+        if time.monotonic() < ready_at:
+            return self._send_json(200, {"status": "EXECUTING", "message": []})
+
+        with self.fakes.lock:
+            self.fakes.executions.pop(execution_id, None)
+        if outcome == "error":
+            return self._send_json(200, {"status": "ERROR", "error": "Workflow failed (fake)", "message": []})
+        self._send_json(200, {
+            "status": "COMPLETED",
+            "message": [{"file": "document", "status": "Success", "result": {"output": fake_invoice(seed)}}]
+        })
+
+    # --------------------------
+    # Gemini: models/{model}:generateContent and :streamGenerateContent (SSE)
+    # --------------------------
+    def _gemini(self, path, seed):
+        self.fakes.count("gemini")
+        profile = self.fakes.profiles["gemini"]
+        outcome = profile.outcome()
+        if outcome == "throttled":
+            return self._throttled()
+
+        latency = profile.sample()
+        text = json.dumps(fake_invoice(seed))
+        tokens = max(1, len(text) // 4)
+        if ":streamGenerateContent" in path:
+            return self._gemini_stream(text, tokens, latency, outcome)
+
+        time.sleep(latency)
+        if outcome == "error":
+            return self._failed()
+        self._send_json(200, self._gemini_chunk(text, tokens, finished=True))
+
+    @staticmethod
+    def _gemini_chunk(text, tokens, finished):
+        candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+        chunk = {"candidates": [candidate], "modelVersion": "fake-gemini"}
+        if finished:
+            candidate["finishReason"] = "STOP"
+            chunk["usageMetadata"] = {"promptTokenCount": 258, "candidatesTokenCount": tokens, "totalTokenCount": 258 + tokens}
+        return chunk
+
+    def _gemini_stream(self, text, tokens, latency, outcome):
+        # About a third of the latency before the first token, the rest spread over the chunks
+        time.sleep(latency * 0.35)
+        if outcome == "error":
+            return self._failed()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        pieces = [text[start:start + 64] for start in range(0, len(text), 64)]
+        delay = latency * 0.65 / len(pieces)
+        for index, piece in enumerate(pieces):
+            event = b"data: " + json.dumps(self._gemini_chunk(piece, tokens, index == len(pieces) - 1)).encode("utf-8") + b"\r\n\r\n"
+            self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+            if index < len(pieces) - 1:
+                time.sleep(delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def make_server(host="127.0.0.1", port=8765, profiles=None, verbose=False):
+    """Build the server; call serve_forever() on it (e.g. in a daemon thread for in-process use)."""
+    server = ThreadingHTTPServer((host, port), FakeProviderHandler)
+    server.daemon_threads = True
+    server.fakes = FakeProviders({**DEFAULT_PROFILES, **(profiles or {})})
+    server.verbose = verbose
+    return server
+
+
+def _parse_latency(values, sigma, error_rate, throttle_rate):
+    # "gemini=3" or "gemini=3,0.6" (median seconds, optional sigma)
+    profiles = {}
+    for value in values or []:
+        provider, _, spec = value.partition("=")
+        if provider not in PROVIDERS or not spec:
+            raise argparse.ArgumentTypeError(f"Expected <provider>=<median>[,<sigma>], got {value!r}")
+        median, _, provider_sigma = spec.partition(",")
+        if provider_sigma:
+            sigma_for = float(provider_sigma)
+        else:
+            sigma_for = sigma if sigma is not None else DEFAULT_PROFILES[provider].sigma
+        profiles[provider] = LatencyProfile(float(median), sigma_for, error_rate, throttle_rate)
+    for provider, default in DEFAULT_PROFILES.items():
+        profiles.setdefault(provider, LatencyProfile(
+            default.median, sigma if sigma is not None else default.sigma, error_rate, throttle_rate
+        ))
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake Gemini, Unstract and Document AI endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", nargs="+", metavar="PROVIDER=MEDIAN[,SIGMA]", help="Median latency per provider (seconds)")
+    parser.add_argument("--sigma", type=float, help="Log-normal spread for providers that do not give their own")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    profiles = _parse_latency(args.latency, args.sigma, args.error_rate, args.throttle_rate)
+    server = make_server(args.host, args.port, profiles, args.verbose)
+    base = f"http://{args.host}:{args.port}"
+    print("Fake providers listening. Point the app at them with:")
+    print(f"  GEMINI_BASE_URL={base}/gemini")
+    print(f"  UNSTRACT_URL_WORKFLOW={base}/unstract/")
+    print(f"  DOCAI_URL={base}/documentai/v1/processors/fake:process")
+    for provider, profile in profiles.items():
+        print(f"  {provider:12} median={profile.median:.2f}s sigma={profile.sigma:.2f} "
+              f"errors={profile.error_rate:.0%} 429s={profile.throttle_rate:.0%}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Requests served: {server.fakes.requests}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Maintenance commands.
+
+    python manage.py rebuild-stats
+    python manage.py migrate-results --batch-size 200 --drop-legacy
+    python manage.py score ground_truth.csv --since-hours 168
+"""
+import argparse
+
+from database.models import init_db
+from database.queries import rebuild_provider_stats, migrate_test_results
+from services.scoring import load_ground_truth, score_saved_tests
+
+
+def rebuild_stats(args):
+    total = rebuild_provider_stats()
+    print(f"✅ provider_stats rebuilt from {total} tests")
+
+
+def migrate_results(args):
+    copied, moved = migrate_test_results(args.batch_size, args.drop_legacy)
+    print(f"✅ Copied {copied} provider results to test_results, moved {moved} inline responses to response_blobs")
+    if args.drop_legacy:
+        print("✅ Dropped the per-provider columns of tests")
+
+
+def score(args):
+    metrics, judged = score_saved_tests(load_ground_truth(args.ground_truth), args.since_hours, args.rescore)
+    if metrics.empty:
+        print("Nothing to score: no saved records match the ground truth")
+        return
+    print(metrics.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    print(f"✅ best_response filled in for {judged} tests")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR comparator maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser(
+        "rebuild-stats",
+        help="Recompute provider_stats from test_results (after backfills or manual edits)"
+    ).set_defaults(handler=rebuild_stats)
+
+    migrate = commands.add_parser(
+        "migrate-results",
+        aliases=["migrate-blobs"],
+        help="Move per-provider columns of tests to test_results and their raw responses to blob storage"
+    )
+    migrate.add_argument("--batch-size", type=int, default=100, help="Results migrated per transaction")
+    migrate.add_argument(
+        "--drop-legacy", action="store_true",
+        help="Drop the old per-provider columns of tests once everything is moved"
+    )
+    migrate.set_defaults(handler=migrate_results)
+
+    scoring = commands.add_parser(
+        "score",
+        help="Score saved invoice records against ground truth and fill best_response for unjudged tests"
+    )
+    scoring.add_argument("ground_truth", help="CSV or JSON file with a filename column and the expected fields")
+    scoring.add_argument("--since-hours", type=int, help="Only score tests created in this window")
+    scoring.add_argument("--rescore", action="store_true", help="Also rescore tests that already have a best_response")
+    scoring.set_defaults(handler=score)
+
+    args = parser.parse_args()
+    init_db()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
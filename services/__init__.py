@@ -1,3 +1,5 @@
-from .gemini_service import process_with_gemini
-from .unstract_service import run_unstract_workflow
-from .document_ai_service import process_with_document_ai
+from .gemini_service import process_with_gemini, process_with_gemini_async
+from .unstract_service import run_unstract_workflow, run_unstract_workflow_async
+from .document_ai_service import process_with_document_ai, process_with_document_ai_async
+from .orchestrator import iter_provider_results, run_providers
+from .batch import expand_uploads, iter_batch_results
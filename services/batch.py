@@ -0,0 +1,91 @@
+import asyncio
+import io
+import mimetypes
+import zipfile
+from pathlib import PurePosixPath
+from config.settings import BATCH_CONCURRENCY, PROVIDER_DEADLINES
+from .orchestrator import ProviderRun, run_document_provider, split_pages, stream_from_loop
+
+SUPPORTED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".pdf"}
+
+
+def _document(filename, file_bytes):
+    file_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return {"filename": filename, "file_bytes": file_bytes, "file_type": file_type}
+
+
+def expand_uploads(uploads):
+    """Turn (filename, bytes) uploads into invoice documents, unpacking any ZIP archives."""
+    documents = []
+    for filename, file_bytes in uploads:
+        suffix = PurePosixPath(filename).suffix.lower()
+
+        if suffix == ".zip":
+            with zipfile.ZipFile(io.BytesIO(file_bytes)) as archive:
+                for entry in archive.infolist():
+                    path = PurePosixPath(entry.filename)
+                    if entry.is_dir() or "__MACOSX" in path.parts or path.name.startswith("."):
+                        continue
+                    if path.suffix.lower() in SUPPORTED_EXTENSIONS:
+                        documents.append(_document(entry.filename, archive.read(entry)))
+        elif suffix in SUPPORTED_EXTENSIONS:
+            documents.append(_document(filename, file_bytes))
+
+    return documents
+
+
+def _provider_input(document):
+    # Documents prepared by services.preprocessing carry the bytes actually sent
+    upload = document.get("upload")
+    if upload is not None:
+        return upload.file_bytes, upload.filename, upload.file_type
+    return document["file_bytes"], document["filename"], document["file_type"]
+
+
+# Terminal failure states, compared case-insensitively (Unstract reports "ERROR" / "STOPPED")
+FAILED_STATUSES = ("error", "failed", "stopped")
+
+
+def result_status(result):
+    if not isinstance(result, dict):
+        return "error"
+    if "error" in result or str(result.get("status") or "").lower() in FAILED_STATUSES:
+        return "error"
+    return "ok"
+
+
+async def run_batch(documents, providers, concurrency=None, deadlines=None, on_document=None, page_chunk=None):
+    # Limits are per provider, so a slow Unstract queue never starves Gemini
+    limits = {**BATCH_CONCURRENCY, **(concurrency or {})}
+    deadlines = {**PROVIDER_DEADLINES, **(deadlines or {})}
+    semaphores = {provider: asyncio.Semaphore(max(1, int(limits[provider]))) for provider in providers}
+
+    async def limited(provider, document, chunks):
+        async with semaphores[provider]:
+            return await run_document_provider(provider, *_provider_input(document), deadlines[provider], chunks)
+
+    async def process(document):
+        cached = document.get("cached", {})
+        pending = [provider for provider in providers if provider not in cached]
+        runs = [ProviderRun(provider, *cached[provider]) for provider in providers if provider in cached]
+        file_bytes, _, file_type = _provider_input(document)
+        chunks = await split_pages(file_bytes, file_type, page_chunk) if pending else None
+        runs += await asyncio.gather(*(limited(provider, document, chunks) for provider in pending))
+        if on_document:
+            on_document((document, runs))
+        return runs
+
+    tasks = [asyncio.create_task(process(document)) for document in documents]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def iter_batch_results(documents, providers, concurrency=None, deadlines=None, page_chunk=None):
+    """Fan documents out to providers on the shared loop, yielding (document, runs) per finished document."""
+    return stream_from_loop(
+        lambda on_document: run_batch(documents, providers, concurrency, deadlines, on_document, page_chunk),
+        len(documents)
+    )
@@ -0,0 +1,255 @@
+import asyncio
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import threading
+import time
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from config.settings import CASSETTE_MODE, CASSETTE_PATH, CASSETTE_REPLAY_SPEED
+from .tracing import traced, record
+
+
+class Cassette:
+    """Recorded provider exchanges in one zip archive, one JSON member per (provider, document).
+
+    Members are written once and read lazily, so a cassette holding thousands of
+    documents costs an index in memory rather than every response.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._names = None
+        self._reader = None
+
+    @staticmethod
+    def key(provider, file_bytes):
+        # Same model and prompt version as the result cache, so a prompt change records
+        # anew instead of replaying stale answers. The bytes are what the provider was
+        # sent, so preprocessing and page chunks already give their own keys.
+        from .result_cache import provider_signature
+
+        model, version = provider_signature(provider)
+        digest = hashlib.sha256(f"{model}\n{version}\n".encode("utf-8"))
+        digest.update(file_bytes)
+        return f"{provider}/{digest.hexdigest()}.json"
+
+    def _index(self):
+        if self._names is None:
+            if self.path.exists():
+                with zipfile.ZipFile(self.path) as archive:
+                    self._names = set(archive.namelist())
+            else:
+                self._names = set()
+        return self._names
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._index()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index())
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._index():
+                return None
+            if self._reader is None:
+                self._reader = zipfile.ZipFile(self.path)
+            return json.loads(self._reader.read(key))
+
+    def put(self, key, exchange):
+        data = json.dumps(exchange, default=str).encode("utf-8")
+        with self._lock:
+            # The first recording of a document wins; re-recording needs a new cassette
+            if key in self._index():
+                return False
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with zipfile.ZipFile(self.path, "a", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+                archive.writestr(key, data)
+            self._names.add(key)
+            return True
+
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path=CASSETTE_PATH):
+    with _cassettes_lock:
+        cassette = _cassettes.get(path)
+        if cassette is None:
+            cassette = _cassettes[path] = Cassette(path)
+        return cassette
+
+
+class _Recorder:
+    """Times one live call and turns it into an exchange; also captures streamed output."""
+
+    def __init__(self, provider, call):
+        self.provider = provider
+        self.call = call
+        self.started = time.perf_counter()
+        self.partials = []
+        self.streamed_text = ""
+
+    def wrap_partial(self, on_partial):
+        def capture(text):
+            self.partials.append((round(time.perf_counter() - self.started, 4), len(text)))
+            self.streamed_text = text
+            if on_partial:
+                on_partial(text)
+        return capture
+
+    def exchange(self, result, trace, exception=None):
+        elapsed = time.perf_counter() - self.started
+        # Hand the spans on to the caller's trace as if no one had been listening
+        for span in trace.spans:
+            start = trace.origin + span["start"]
+            record(span["phase"], start, start + span["duration"])
+        return {
+            "provider": self.provider,
+            "filename": self.call.get("filename"),
+            "file_type": self.call.get("file_type") or self.call.get("mime_type"),
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "elapsed": round(elapsed, 4),
+            "phases": [{**span, "start": round(trace.origin + span["start"] - self.started, 4)} for span in trace.spans],
+            # Streamed output as (offset, length) prefixes of one text, not a copy per chunk
+            "partials": self.partials,
+            "streamed_text": self.streamed_text,
+            "result": result,
+            **({"exception": str(exception)} if exception is not None else {})
+        }
+
+
+def _replay(exchange, speed, on_partial=None):
+    """Yield the sleeps that reproduce a recorded exchange at `speed` x real time (0 = no
+    sleeps); each recorded span or partial output is emitted once the sleep before it is over."""
+    started = time.perf_counter()
+    # Seconds of replay per recorded second
+    scale = 1.0 / speed if speed else 0.0
+    events = sorted(
+        [(span["start"] + span["duration"], "span", span) for span in exchange["phases"]]
+        + [(offset, "partial", length) for offset, length in exchange["partials"]],
+        key=lambda event: event[0]
+    )
+
+    previous = 0.0
+    for offset, kind, value in events:
+        yield (offset - previous) * scale
+        previous = offset
+        if kind == "span":
+            # With no sleeps, spans keep their recorded shape
+            span_scale = scale or 1.0
+            start = started + value["start"] * span_scale
+            record(value["phase"], start, start + value["duration"] * span_scale)
+        elif on_partial:
+            on_partial(exchange["streamed_text"][:value])
+    yield max(0.0, exchange["elapsed"] - previous) * scale
+
+
+def _replayed(exchange):
+    if "exception" in exchange:
+        raise RuntimeError(exchange["exception"])
+    return copy.deepcopy(exchange["result"])
+
+
+def _missing(provider, call):
+    return {
+        "status": "error",
+        "error": f"No recorded {provider} exchange for {call.get('filename') or 'this document'}",
+        "error_type": "cassette_miss"
+    }
+
+
+def cassette(provider):
+    """Record or replay a provider service call, keyed by the document bytes it was given.
+
+    CASSETTE_MODE=record stores every live exchange (result, phases, timing and
+    streamed output) in CASSETTE_PATH; CASSETTE_MODE=replay answers from it without
+    touching the network, CASSETTE_REPLAY_SPEED times as fast as recorded (0 = as fast
+    as possible). Documents missing from the cassette come back as errors.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def arguments(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return bound.arguments
+
+        def start_recording(args, kwargs, call):
+            recorder = _Recorder(provider, call)
+            if "on_partial" in call:
+                # Capture streamed output on its way to the real callback
+                return recorder, (), {**call, "on_partial": recorder.wrap_partial(call["on_partial"])}
+            return recorder, args, kwargs
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if CASSETTE_MODE == "off":
+                    return await func(*args, **kwargs)
+                call = arguments(args, kwargs)
+                key = Cassette.key(provider, call["file_bytes"])
+
+                if CASSETTE_MODE == "replay":
+                    # Zip reads and writes stay off the event loop shared by every provider call
+                    exchange = await asyncio.to_thread(get_cassette().get, key)
+                    if exchange is None:
+                        return _missing(provider, call)
+                    for delay in _replay(exchange, CASSETTE_REPLAY_SPEED, call.get("on_partial")):
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    return _replayed(exchange)
+
+                recorder, args, kwargs = start_recording(args, kwargs, call)
+                result, error = None, None
+                with traced() as trace:
+                    try:
+                        result = await func(*args, **kwargs)
+                    except Exception as e:
+                        error = e
+                await asyncio.to_thread(get_cassette().put, key, recorder.exchange(result, trace, error))
+                if error is not None:
+                    raise error
+                return result
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if CASSETTE_MODE == "off":
+                    return func(*args, **kwargs)
+                call = arguments(args, kwargs)
+                key = Cassette.key(provider, call["file_bytes"])
+
+                if CASSETTE_MODE == "replay":
+                    exchange = get_cassette().get(key)
+                    if exchange is None:
+                        return _missing(provider, call)
+                    for delay in _replay(exchange, CASSETTE_REPLAY_SPEED, call.get("on_partial")):
+                        if delay > 0:
+                            time.sleep(delay)
+                    return _replayed(exchange)
+
+                recorder, args, kwargs = start_recording(args, kwargs, call)
+                result, error = None, None
+                with traced() as trace:
+                    try:
+                        result = func(*args, **kwargs)
+                    except Exception as e:
+                        error = e
+                get_cassette().put(key, recorder.exchange(result, trace, error))
+                if error is not None:
+                    raise error
+                return result
+
+        return wrapper
+    return decorator
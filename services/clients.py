@@ -0,0 +1,126 @@
+import threading
+import urllib.parse
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from google import genai
+from google.genai import types
+from config.settings import (
+    GOOGLE_API_KEY,
+    GEMINI_BASE_URL,
+    UNSTRACT_URL_WORKFLOW,
+    DOCAI_URL,
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_KEEPALIVE_EXPIRY
+)
+
+# ==========================
+# Process-wide provider clients
+# ==========================
+# Every session and every service call reuses these, so keep-alive
+# connections survive between invoices instead of paying TCP+TLS each time.
+_lock = threading.Lock()
+_sessions = {}
+_genai_client = None
+
+# Async clients are only touched from the orchestrator event loop thread
+_async_clients = {}
+
+
+def _verify_tls(provider):
+    # Unstract is called with TLS verification disabled
+    return provider != "unstract"
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=HTTP_POOL_MAXSIZE,
+        max_keepalive_connections=HTTP_POOL_MAXSIZE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+
+
+def get_http_session(provider):
+    with _lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.verify = _verify_tls(provider)
+            _sessions[provider] = session
+        return session
+
+
+def get_async_http_client(provider):
+    client = _async_clients.get(provider)
+    if client is None:
+        client = httpx.AsyncClient(
+            verify=_verify_tls(provider),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=_limits()
+        )
+        _async_clients[provider] = client
+    return client
+
+
+def get_genai_client():
+    global _genai_client
+    with _lock:
+        if _genai_client is None:
+            _genai_client = genai.Client(
+                api_key=GOOGLE_API_KEY,
+                http_options=types.HttpOptions(
+                    base_url=GEMINI_BASE_URL,
+                    client_args={"limits": _limits()},
+                    async_client_args={"limits": _limits()}
+                )
+            )
+        return _genai_client
+
+
+def _origin(url):
+    parsed = urllib.parse.urlparse(url or "")
+    if not parsed.scheme or not parsed.netloc:
+        return None
+    return f"{parsed.scheme}://{parsed.netloc}/"
+
+
+async def _warm_up_async(endpoints):
+    for provider, origin in endpoints.items():
+        try:
+            await get_async_http_client(provider).head(origin, timeout=5)
+        except httpx.HTTPError as e:
+            print(f"Warm-up of async {provider} client failed: {e}")
+
+
+def warm_up_clients():
+    """Build every provider client and open a first connection to each endpoint."""
+    from .orchestrator import run_coroutine
+
+    try:
+        get_genai_client()
+    except Exception as e:
+        print(f"Warm-up of Gemini client failed: {e}")
+
+    endpoints = {
+        provider: origin
+        for provider, origin in (
+            ("unstract", _origin(UNSTRACT_URL_WORKFLOW)),
+            ("document_ai", _origin(DOCAI_URL))
+        )
+        if origin
+    }
+
+    for provider, origin in endpoints.items():
+        try:
+            get_http_session(provider).head(origin, timeout=5)
+        except requests.exceptions.RequestException as e:
+            print(f"Warm-up of {provider} session failed: {e}")
+
+    run_coroutine(_warm_up_async(endpoints))
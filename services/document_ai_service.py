@@ -1,31 +1,76 @@
-import requests
-import base64
 from config.settings import DOCAI_URL
+from .cassettes import cassette
+from .clients import get_http_session, get_async_http_client
+from .rate_limit import ProviderThrottled, get_limiter, retry_after_seconds
+from .request_bodies import docai_json_body
+from .tracing import phase
 
+
+def _build_payload(file_bytes, mime_type):
+    # Base64 is produced chunk by chunk while the request is sent, so the
+    # encoded copy of the document never exists in memory as a whole
+    body = docai_json_body(file_bytes, mime_type)
+    headers = {
+        "Content-Type": "application/json",
+        "Content-Length": str(len(body))
+    }
+    return body, headers
+
+
+def _check_response(response):
+    if response.status_code == 429:
+        raise ProviderThrottled("Document AI rate limit (429)", retry_after_seconds(response))
+    response.raise_for_status()
+    with phase("parse"):
+        return response.json()
+
+
+def _post(url, body, headers):
+    # Streamed so the time to first byte and the body download are measured separately
+    with phase("request"):
+        response = get_http_session("document_ai").post(url, data=body, headers=headers, stream=True)
+    with phase("download"):
+        response.content
+    return _check_response(response)
+
+
+async def _post_async(url, body, headers):
+    client = get_async_http_client("document_ai")
+    request = client.build_request("POST", url, content=body.async_chunks(), headers=headers)
+    with phase("request"):
+        response = await client.send(request, stream=True)
+    try:
+        with phase("download"):
+            await response.aread()
+    finally:
+        await response.aclose()
+    return _check_response(response)
+
+
+@cassette("document_ai")
 def process_with_document_ai(
     file_bytes: bytes,
     mime_type: str,
     url=DOCAI_URL
 ):
-    encoded_content = base64.b64encode(file_bytes).decode("utf-8")
+    with phase("encode"):
+        body, headers = _build_payload(file_bytes, mime_type)
 
-    data = {
-        "rawDocument": {
-            "content": encoded_content,
-            "mimeType": mime_type
-        }
-    }
+    print("Sending ...")
 
-    headers = {
-        "Content-Type": "application/json"
-    }
+    return get_limiter("document_ai").call(_post, url, body, headers)
 
-    print("Sending ...")
 
-    response = requests.post(url, json=data, headers=headers)
-    response.raise_for_status()
+@cassette("document_ai")
+async def process_with_document_ai_async(
+    file_bytes: bytes,
+    mime_type: str,
+    url=DOCAI_URL
+):
+    with phase("encode"):
+        body, headers = _build_payload(file_bytes, mime_type)
 
-    return response.json()
+    return await get_limiter("document_ai").call_async(_post_async, url, body, headers)
 
 
 # from google.cloud import documentai_v1 as documentai
@@ -1,90 +1,207 @@
-from google import genai
+import time
 from google.genai import types
-from config.settings import GOOGLE_API_KEY
+from config.settings import GEMINI_STREAM
+from .cassettes import cassette
+from .clients import get_genai_client
+from .invoice_schema import Invoice, InvalidInvoiceOutput, parse_invoice
+from .rate_limit import get_limiter
+from .tracing import phase, record
 
-def process_with_gemini(file_bytes, filename, file_type):
-    try:
-        client = genai.Client(api_key=GOOGLE_API_KEY)
-
-        if file_type.startswith("image"):
-            mime_type = file_type
-        else:
-            mime_type = "application/pdf"
+GEMINI_MODEL = "gemini-2.5-flash"
 
-        part = types.Part.from_bytes(data=file_bytes, mime_type=mime_type)
+# Bump whenever INVOICE_PROMPT or the Invoice schema changes so cached results are not reused
+PROMPT_VERSION = "v2"
 
-        prompt = """
+INVOICE_PROMPT = """
         Analyze the following document containing invoice data.  
 
-        Your goal is to extract as much information as possible and return it in a structured JSON object.
-
-        Always return a JSON with this structure:
-
-        {
-          "documentType": "invoice",
-          "invoiceNumber": "",
-          "invoiceSeries": "",
-          "issueDate": "",
-          "dueDate": "",
-          "seller": {
-            "name": "",
-            "taxId": "",
-            "address": "",
-            "phone": "",
-            "email": ""
-          },
-          "buyer": {
-            "name": "",
-            "taxId": "",
-            "address": "",
-            "phone": "",
-            "email": ""
-          },
-          "items": [
-            {
-              "description": "",
-              "quantity": "",
-              "unitPrice": "",
-              "subtotal": ""
-            }
-          ],
-          "subtotal": "",
-          "tax": "",
-          "discount": "",
-          "total": "",
-          "currency": "",
-          "paymentMethod": "",
-          "paymentStatus": "",
-          "notes": ""
-        }
+        Your goal is to extract as much information as possible into the invoice schema.
 
         Important rules:
         - If a field does not exist in the document, leave it as an empty string "".
         - Detect data even if the names change.
         - Extract numbers even if they have different formats.
-        - Returns only valid JSON, without comments or explanations.
+        - Add one entry to "items" per invoice line.
         """
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[part, prompt]
+# The schema is enforced by the API instead of being described in the prompt
+GENERATION_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=Invoice
+)
+
+
+def _build_part(file_bytes, file_type):
+    if file_type.startswith("image"):
+        mime_type = file_type
+    else:
+        mime_type = "application/pdf"
+
+    # The SDK only accepts bytes; uploads may arrive as zero-copy memoryviews
+    return types.Part.from_bytes(data=bytes(file_bytes), mime_type=mime_type)
+
+
+def _generate(client, part):
+    with phase("inference"):
+        return client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=[part, INVOICE_PROMPT],
+            config=GENERATION_CONFIG
+        )
+
+
+async def _generate_async(client, part):
+    with phase("inference"):
+        return await client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=[part, INVOICE_PROMPT],
+            config=GENERATION_CONFIG
         )
 
+
+class _StreamCollector:
+    """Accumulates a streamed response and the timings derived from it."""
+
+    def __init__(self, on_partial=None):
+        self.on_partial = on_partial
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.chunks = []
+        self.usage = None
+
+    def add(self, chunk):
+        if chunk.usage_metadata is not None:
+            self.usage = chunk.usage_metadata
+        text = chunk.text
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            record("first_token", self.started, self.first_token_at)
+        self.chunks.append(text)
+        if self.on_partial:
+            self.on_partial("".join(self.chunks))
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def metrics(self):
+        finished = time.perf_counter()
+        first_token_at = self.first_token_at or finished
+        record("streaming", first_token_at, finished)
+
+        tokens = getattr(self.usage, "candidates_token_count", None)
+        generation_time = finished - first_token_at
         return {
-            "status": "success",
-            "data": response.text,
-            "model": "gemini-2.5-flash"
+            "ttft": round(first_token_at - self.started, 4),
+            "tokens": tokens,
+            "tokens_per_sec": round(tokens / generation_time, 2) if tokens and generation_time > 0 else None
         }
 
-    except Exception as e:
-        if "429" in error_message or "RESOURCE_EXHAUSTED" in error_message:
-            return {
-                "status": "error",
-                "error": "Gemini API quota exceeded. Please wait or upgrade your plan.",
-                "error_type": "quota_exceeded"
-            }
+
+def _generate_stream(client, part, on_partial=None):
+    collector = _StreamCollector(on_partial)
+    for chunk in client.models.generate_content_stream(
+        model=GEMINI_MODEL,
+        contents=[part, INVOICE_PROMPT],
+        config=GENERATION_CONFIG
+    ):
+        collector.add(chunk)
+    return collector
+
+
+async def _generate_stream_async(client, part, on_partial=None):
+    collector = _StreamCollector(on_partial)
+    async for chunk in await client.aio.models.generate_content_stream(
+        model=GEMINI_MODEL,
+        contents=[part, INVOICE_PROMPT],
+        config=GENERATION_CONFIG
+    ):
+        collector.add(chunk)
+    return collector
+
+
+def _success_result(text, parsed=None, metrics=None):
+    # Parsed and validated exactly once, here; everything downstream gets the dict
+    if isinstance(parsed, Invoice):
+        invoice, repaired = parsed, False
+    else:
+        invoice, repaired = parse_invoice(text)
+
+    result = {
+        "status": "success",
+        "data": invoice.model_dump(),
+        "model": GEMINI_MODEL
+    }
+    if repaired:
+        result["repaired"] = True
+    if metrics:
+        result["metrics"] = metrics
+    return result
+
+
+def _error_result(e):
+    if isinstance(e, InvalidInvoiceOutput):
         return {
             "status": "error",
-            "error": str(e)
+            "error": str(e),
+            "error_type": "invalid_output",
+            "raw": e.text
         }
 
+    error_message = str(e)
+    if "429" in error_message or "RESOURCE_EXHAUSTED" in error_message:
+        return {
+            "status": "error",
+            "error": "Gemini API quota exceeded. Please wait or upgrade your plan.",
+            "error_type": "quota_exceeded"
+        }
+    return {
+        "status": "error",
+        "error": error_message
+    }
+
+
+@cassette("gemini")
+def process_with_gemini(file_bytes, filename, file_type, stream=GEMINI_STREAM, on_partial=None):
+    try:
+        client = get_genai_client()
+        with phase("encode"):
+            part = _build_part(file_bytes, file_type)
+
+        if stream:
+            # on_partial(text_so_far) is called as chunks arrive
+            collector = get_limiter("gemini").call(_generate_stream, client, part, on_partial)
+            with phase("parse"):
+                return _success_result(collector.text, metrics=collector.metrics())
+
+        # Queues and retries on 429 instead of failing the request outright
+        response = get_limiter("gemini").call(_generate, client, part)
+
+        with phase("parse"):
+            return _success_result(response.text, response.parsed)
+
+    except Exception as e:
+        return _error_result(e)
+
+
+@cassette("gemini")
+async def process_with_gemini_async(file_bytes, filename, file_type, stream=GEMINI_STREAM, on_partial=None):
+    try:
+        client = get_genai_client()
+        with phase("encode"):
+            part = _build_part(file_bytes, file_type)
+
+        if stream:
+            collector = await get_limiter("gemini").call_async(_generate_stream_async, client, part, on_partial)
+            with phase("parse"):
+                return _success_result(collector.text, metrics=collector.metrics())
+
+        response = await get_limiter("gemini").call_async(_generate_async, client, part)
+
+        with phase("parse"):
+            return _success_result(response.text, response.parsed)
+
+    except Exception as e:
+        return _error_result(e)
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from config.settings import HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_BUDGET, HEDGE_MIN_SAMPLES, HEDGE_MIN_DELAY
+from .polling import ExecutionTimeTracker
+from .tracing import traced, record
+
+
+class HedgeBudget:
+    """Every call earns `ratio` of a hedge and every hedge spends a whole one.
+
+    With ratio <= 1 hedges can never outnumber calls, so hedging at most doubles the
+    load; the burst bounds how much unused credit a quiet period can save up.
+    """
+
+    def __init__(self, ratio, burst=3.0):
+        self.ratio = min(1.0, max(0.0, ratio))
+        self.burst = max(1.0, burst)
+        self._credit = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._credit = min(self.burst, self._credit + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._credit < 1.0:
+                return False
+            self._credit -= 1.0
+            return True
+
+
+class ProviderHedger:
+    """Latency window and hedge budget of one provider and call granularity, shared by every call in the process.
+
+    Whole documents and single page chunks take very different times, so each keeps
+    its own window (and its own hedge delay).
+    """
+
+    def __init__(self, provider, granularity="document", percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET,
+                 min_samples=HEDGE_MIN_SAMPLES, min_delay=HEDGE_MIN_DELAY):
+        self.provider = provider
+        self.granularity = granularity
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = ExecutionTimeTracker()
+        self.budget = HedgeBudget(budget)
+
+    def delay(self):
+        """Seconds after which a call gets hedged, or None while too few calls were observed."""
+        threshold = self.latencies.percentile(self.percentile, self.min_samples)
+        return None if threshold is None else max(threshold, self.min_delay)
+
+    def projected_remaining(self, elapsed, delay):
+        """Expected further time of a call that is still running after `elapsed` seconds."""
+        remaining = [seconds - elapsed for seconds in self.latencies.samples() if seconds > elapsed]
+        if remaining:
+            return sum(remaining) / len(remaining)
+        # It outlived every observed call: assume it needs at least what it has overrun so far
+        return max(0.0, elapsed - delay)
+
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(provider, granularity="document"):
+    with _hedgers_lock:
+        hedger = _hedgers.get((provider, granularity))
+        if hedger is None:
+            hedger = _hedgers[provider, granularity] = ProviderHedger(provider, granularity)
+        return hedger
+
+
+def seed_latencies(provider, durations):
+    # test_results holds whole-document times; page windows fill from live calls
+    get_hedger(provider).latencies.seed(durations)
+
+
+def _succeeded(result):
+    return not (isinstance(result, dict) and (
+        "error" in result or str(result.get("status") or "").lower() in ("error", "failed", "stopped")
+    ))
+
+
+def _retrieve(task):
+    # Keeps asyncio from warning about an exception nobody awaited
+    if not task.cancelled():
+        task.exception()
+
+
+async def hedged_call(provider, call, on_partial=None, granularity="document", deadline=None):
+    """Await call(on_partial), backed up by an identical second call when it runs slow.
+
+    Once the first call has run past the hedge delay for this provider and
+    granularity, and the budget has credit, the same call is made again; the first
+    successful answer wins. A losing second call is cancelled. A losing first call is
+    left to finish in the background (until `deadline`) and ignored, so its real
+    latency still reaches the window instead of a truncated one. Only the call that
+    streamed first feeds on_partial, so the text shown never switches between the
+    two. Returns (result, hedge), where hedge is None unless a second call was made.
+    """
+    hedger = get_hedger(provider, granularity)
+    hedger.budget.earn()
+    delay = hedger.delay() if HEDGE_ENABLED else None
+
+    streaming = []
+    returned = []
+
+    def partial_callback(name):
+        if on_partial is None:
+            return None
+
+        def forward(text):
+            if not streaming:
+                streaming.append(name)
+            if streaming[0] == name and not returned:
+                on_partial(text)
+        return forward
+
+    async def attempt(name):
+        started = time.perf_counter()
+        result = await call(partial_callback(name))
+        # Only finished calls are samples; cancelled ones would drag the percentile down
+        if _succeeded(result):
+            hedger.latencies.record(time.perf_counter() - started)
+        return result
+
+    if delay is None:
+        return await attempt("primary"), None
+
+    traces = {}
+
+    async def traced_attempt(name):
+        with traced() as trace:
+            traces[name] = trace
+            return await attempt(name)
+
+    started = time.perf_counter()
+    primary = asyncio.create_task(traced_attempt("primary"))
+    tasks = {primary}
+    hedge = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and hedger.budget.try_spend():
+            tasks.add(asyncio.create_task(traced_attempt("hedge")))
+            hedge = {"delay": round(delay, 3)}
+
+        winner, pending = None, tasks
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if not task.exception() and _succeeded(task.result())), None)
+        # Both calls failed: report the original one
+        winner = winner or primary
+
+        if hedge is not None:
+            won = winner is not primary
+            saved = 0.0
+            if won and not primary.done():
+                # The original call is still running: project its finish from the window
+                elapsed = time.perf_counter() - started
+                saved = hedger.projected_remaining(elapsed, delay)
+                primary.add_done_callback(_retrieve)
+                if deadline is not None:
+                    asyncio.get_running_loop().call_later(max(0.0, deadline - elapsed), primary.cancel)
+                tasks.discard(primary)
+            hedge.update(won=won, saved=round(saved, 3))
+            print(f"{provider} hedged after {delay:.2f}s, {'second' if won else 'first'} call answered first")
+        return winner.result(), hedge
+    except asyncio.CancelledError:
+        # The caller gave up: neither call may outlive it, a detached first call included
+        primary.cancel()
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        returned.append(True)
+        for task in tasks:
+            task.cancel()
+        # Spans as of now; a first call still running in the background adds no more
+        for name, trace in traces.items():
+            prefix = "hedge:" if name == "hedge" else ""
+            for span in list(trace.spans):
+                start = trace.origin + span["start"]
+                record(f"{prefix}{span['phase']}", start, start + span["duration"])
@@ -0,0 +1,138 @@
+import json
+from pydantic import BaseModel, ValidationError, field_validator
+
+
+class _Lenient(BaseModel):
+    # Models sometimes answer 12.5 or null where the schema says string
+    @field_validator("*", mode="before")
+    @classmethod
+    def _coerce_scalars(cls, value):
+        if value is None:
+            return ""
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return value
+
+
+class Party(_Lenient):
+    name: str = ""
+    taxId: str = ""
+    address: str = ""
+    phone: str = ""
+    email: str = ""
+
+
+class LineItem(_Lenient):
+    description: str = ""
+    quantity: str = ""
+    unitPrice: str = ""
+    subtotal: str = ""
+
+
+class Invoice(_Lenient):
+    documentType: str = "invoice"
+    invoiceNumber: str = ""
+    invoiceSeries: str = ""
+    issueDate: str = ""
+    dueDate: str = ""
+    seller: Party = Party()
+    buyer: Party = Party()
+    items: list[LineItem] = []
+    subtotal: str = ""
+    tax: str = ""
+    discount: str = ""
+    total: str = ""
+    currency: str = ""
+    paymentMethod: str = ""
+    paymentStatus: str = ""
+    notes: str = ""
+
+    @field_validator("seller", "buyer", mode="before")
+    @classmethod
+    def _empty_party(cls, value):
+        return value or {}
+
+    @field_validator("items", mode="before")
+    @classmethod
+    def _empty_items(cls, value):
+        return value or []
+
+
+def _close_partial_json(text):
+    closers = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]" and closers:
+            closers.pop()
+    if escaped:
+        # Cut right after a backslash: drop it so the closing quote is not escaped
+        text = text[:-1]
+    return text + ('"' if in_string else "") + "".join(reversed(closers))
+
+
+def parse_partial_json(text):
+    """Best-effort parse of JSON cut off mid-stream; None until there is something to show."""
+    text = (text or "").strip().strip("`").removeprefix("json")
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = text[start:]
+
+    # Drop the incomplete trailing member until the rest closes cleanly
+    while True:
+        try:
+            return json.loads(_close_partial_json(text.rstrip().rstrip(",")))
+        except ValueError:
+            cut = text.rfind(",")
+            if cut <= 0:
+                return None
+            text = text[:cut]
+
+
+class InvalidInvoiceOutput(ValueError):
+    def __init__(self, message, text):
+        super().__init__(message)
+        self.text = text
+
+
+def _repair(text):
+    # Cheap fixes for what models actually get wrong: code fences, chatter
+    # around the object, or output cut off before the closing brackets
+    text = (text or "").strip().strip("`").removeprefix("json").strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start >= 0 and end > start:
+        try:
+            return json.loads(text[start:end + 1])
+        except ValueError:
+            pass
+    return parse_partial_json(text)
+
+
+def parse_invoice(text):
+    """Validate model output into an Invoice once; returns (invoice, repaired)."""
+    try:
+        return Invoice.model_validate_json(text), False
+    except ValidationError:
+        pass
+
+    payload = _repair(text)
+    if not isinstance(payload, dict):
+        raise InvalidInvoiceOutput("Gemini returned output that is not an invoice JSON object", text)
+    try:
+        return Invoice.model_validate(payload), True
+    except ValidationError as e:
+        raise InvalidInvoiceOutput(
+            f"Gemini output does not match the invoice schema: {e.error_count()} errors", text
+        ) from e
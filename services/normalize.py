@@ -0,0 +1,241 @@
+import math
+from array import array
+from .pages import to_number, unstract_output
+
+# Header fields shared by every provider, in display order
+TEXT_FIELDS = (
+    "invoice_number", "issue_date", "due_date",
+    "seller_name", "seller_tax_id", "buyer_name", "buyer_tax_id", "currency"
+)
+AMOUNT_FIELDS = ("subtotal", "tax", "discount", "total")
+FIELDS = TEXT_FIELDS + AMOUNT_FIELDS
+
+# Keys providers use for the same field, compared case-insensitively without "_" / "-"
+_ALIASES = {
+    "invoice_number": ("invoicenumber", "invoiceno", "invoiceid", "number"),
+    "issue_date": ("issuedate", "invoicedate", "date"),
+    "due_date": ("duedate", "paymentduedate"),
+    "currency": ("currency", "currencycode"),
+    "subtotal": ("subtotal", "netamount", "totalnet"),
+    "tax": ("tax", "taxamount", "totaltaxamount", "vat"),
+    "discount": ("discount", "discountamount"),
+    "total": ("total", "totalamount", "amountdue", "grandtotal"),
+    "name": ("name", "companyname"),
+    "tax_id": ("taxid", "vatnumber", "nif", "cif", "rfc", "ruc")
+}
+_PARTIES = {
+    "seller": ("seller", "supplier", "vendor", "issuer"),
+    "buyer": ("buyer", "customer", "receiver", "client", "billto")
+}
+_ITEM_KEYS = ("items", "lineitems", "lines")
+_DOCAI_FIELDS = {
+    "invoice_id": "invoice_number",
+    "invoice_date": "issue_date",
+    "due_date": "due_date",
+    "supplier_name": "seller_name",
+    "supplier_tax_id": "seller_tax_id",
+    "receiver_name": "buyer_name",
+    "receiver_tax_id": "buyer_tax_id",
+    "currency": "currency",
+    "net_amount": "subtotal",
+    "total_tax_amount": "tax",
+    "total_amount": "total"
+}
+
+
+class LineItems:
+    """Line items stored column-wise: one list of descriptions and three float arrays (NaN = missing)."""
+
+    __slots__ = ("descriptions", "quantities", "unit_prices", "amounts")
+
+    def __init__(self):
+        self.descriptions = []
+        self.quantities = array("d")
+        self.unit_prices = array("d")
+        self.amounts = array("d")
+
+    def append(self, description, quantity, unit_price, amount):
+        self.descriptions.append(description or "")
+        for column, value in ((self.quantities, quantity), (self.unit_prices, unit_price), (self.amounts, amount)):
+            number = to_number(value)
+            column.append(math.nan if number is None else number)
+
+    def __len__(self):
+        return len(self.descriptions)
+
+    def amounts_sum(self):
+        values = [amount for amount in self.amounts if not math.isnan(amount)]
+        return round(sum(values), 2) if values else None
+
+    def to_dict(self):
+        def column(values):
+            return [None if math.isnan(value) else value for value in values]
+        return {
+            "description": self.descriptions,
+            "quantity": column(self.quantities),
+            "unit_price": column(self.unit_prices),
+            "amount": column(self.amounts)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        items = cls()
+        data = data or {}
+        for description, quantity, unit_price, amount in zip(
+            data.get("description", []), data.get("quantity", []), data.get("unit_price", []), data.get("amount", [])
+        ):
+            items.append(description, quantity, unit_price, amount)
+        return items
+
+
+class InvoiceRecord:
+    """One provider's extraction, normalised to the fields every provider can fill."""
+
+    __slots__ = ("provider", "status", "error") + FIELDS + ("items",)
+
+    def __init__(self, provider, status="ok", error=None, items=None, **fields):
+        self.provider = provider
+        self.status = status
+        self.error = error
+        self.items = items if items is not None else LineItems()
+        for name in TEXT_FIELDS:
+            setattr(self, name, str(fields.get(name) or "").strip())
+        for name in AMOUNT_FIELDS:
+            setattr(self, name, to_number(fields.get(name)))
+
+    def value(self, name):
+        return getattr(self, name)
+
+    def to_row(self):
+        row = {name: getattr(self, name) for name in FIELDS}
+        row.update(
+            provider=self.provider,
+            status=self.status,
+            error=self.error,
+            item_count=len(self.items),
+            items=self.items.to_dict()
+        )
+        return row
+
+    @classmethod
+    def from_row(cls, row):
+        row = dict(row)
+        items = LineItems.from_dict(row.pop("items", None))
+        row.pop("item_count", None)
+        return cls(items=items, **row)
+
+    def __repr__(self):
+        return f"InvoiceRecord({self.provider!r}, {self.status!r}, invoice={self.invoice_number!r}, total={self.total!r}, items={len(self.items)})"
+
+
+# ==========================
+# Provider mappers
+# ==========================
+def _key(name):
+    return name.lower().replace("_", "").replace("-", "").replace(" ", "")
+
+
+def _lookup(data, aliases):
+    keys = {_key(key): value for key, value in data.items()}
+    for alias in aliases:
+        value = keys.get(alias)
+        if value not in (None, "", [], {}):
+            return value
+    return None
+
+
+def _from_invoice_dict(provider, data):
+    # Some workflows wrap the invoice in a single top-level key
+    if len(data) == 1 and isinstance(next(iter(data.values())), dict):
+        data = next(iter(data.values()))
+
+    fields = {name: _lookup(data, _ALIASES[name]) for name in ("invoice_number", "issue_date", "due_date", "currency")}
+    fields.update({name: _lookup(data, _ALIASES[name]) for name in AMOUNT_FIELDS})
+    for party, aliases in _PARTIES.items():
+        block = _lookup(data, aliases)
+        if isinstance(block, dict):
+            fields[f"{party}_name"] = _lookup(block, _ALIASES["name"])
+            fields[f"{party}_tax_id"] = _lookup(block, _ALIASES["tax_id"])
+        elif isinstance(block, str):
+            fields[f"{party}_name"] = block
+
+    items = LineItems()
+    for item in _lookup(data, _ITEM_KEYS) or []:
+        if isinstance(item, dict):
+            items.append(
+                _lookup(item, ("description", "name", "concept")),
+                _lookup(item, ("quantity", "qty")),
+                _lookup(item, ("unitprice", "price")),
+                _lookup(item, ("subtotal", "amount", "total"))
+            )
+    return InvoiceRecord(provider, items=items, **fields)
+
+
+def _entity_value(entity):
+    return entity.get("mentionText") or (entity.get("normalizedValue") or {}).get("text")
+
+
+def _from_document_ai(result):
+    fields = {}
+    items = LineItems()
+    for entity in (result.get("document") or {}).get("entities", []):
+        entity_type = entity.get("type", "")
+        if entity_type == "line_item":
+            properties = {prop.get("type", "").split("/")[-1]: _entity_value(prop) for prop in entity.get("properties", [])}
+            items.append(
+                properties.get("description"),
+                properties.get("quantity"),
+                properties.get("unit_price"),
+                properties.get("amount")
+            )
+        elif entity_type in _DOCAI_FIELDS and not fields.get(_DOCAI_FIELDS[entity_type]):
+            fields[_DOCAI_FIELDS[entity_type]] = _entity_value(entity)
+    return InvoiceRecord("document_ai", items=items, **fields)
+
+
+def normalize(provider, result):
+    """Map one provider response onto an InvoiceRecord (status "error" when there is nothing to map)."""
+    if not isinstance(result, dict) or "error" in result or result.get("status") == "error":
+        error = result.get("error") if isinstance(result, dict) else str(result)
+        return InvoiceRecord(provider, status="error", error=str(error or "Unknown error"))
+
+    if provider == "gemini":
+        data = result.get("data")
+        return _from_invoice_dict(provider, data) if isinstance(data, dict) else InvoiceRecord(
+            provider, status="error", error="Unstructured Gemini output"
+        )
+    if provider == "unstract":
+        output = unstract_output(result)
+        return _from_invoice_dict(provider, output) if isinstance(output, dict) else InvoiceRecord(
+            provider, status="error", error="Unstract returned no output"
+        )
+    if provider == "document_ai":
+        return _from_document_ai(result)
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+def normalize_results(results):
+    return {provider: normalize(provider, result) for provider, result in results.items()}
+
+
+def _same(a, b):
+    if isinstance(a, str) and isinstance(b, str):
+        return _key(a) == _key(b)
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return abs(a - b) <= 0.01
+    return False
+
+
+def compare_records(records):
+    """Rows of (field, {provider: value}, agree) across the successful records."""
+    records = [record for record in records.values() if record.status == "ok"]
+    rows = []
+    for name in FIELDS + ("item_count",):
+        values = {
+            record.provider: len(record.items) if name == "item_count" else record.value(name)
+            for record in records
+        }
+        present = [value for value in values.values() if value not in (None, "")]
+        agree = len(present) == len(records) > 1 and all(_same(present[0], value) for value in present[1:])
+        rows.append((name, values, agree))
+    return rows
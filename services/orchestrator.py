@@ -0,0 +1,226 @@
+import asyncio
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import PurePosixPath
+from config.settings import PROVIDER_DEADLINES
+from .gemini_service import process_with_gemini_async
+from .unstract_service import run_unstract_workflow_async
+from .document_ai_service import process_with_document_ai_async
+from .pages import can_split, split_pdf, merge_page_results
+from .hedging import hedged_call
+from .tracing import traced
+
+
+# on_partial(text_so_far) is only honoured by providers that stream their output
+PROVIDER_CALLS = {
+    "gemini": lambda file_bytes, filename, file_type, on_partial=None: process_with_gemini_async(
+        file_bytes, filename, file_type, on_partial=on_partial
+    ),
+    "unstract": lambda file_bytes, filename, file_type, on_partial=None: run_unstract_workflow_async(
+        file_bytes=file_bytes, filename=filename, file_type=file_type
+    ),
+    "document_ai": lambda file_bytes, filename, file_type, on_partial=None: process_with_document_ai_async(
+        file_bytes, file_type
+    )
+}
+
+
+@dataclass
+class ProviderRun:
+    provider: str
+    result: dict
+    exec_time: float | None
+    # Spans recorded by the service: [{"phase", "start", "duration"}] in seconds
+    phases: list = field(default_factory=list)
+
+
+@dataclass
+class PartialResult:
+    """Output streamed so far by a provider that has not finished yet."""
+    provider: str
+    text: str
+
+
+# ==========================
+# Shared event loop
+# ==========================
+# A single loop thread serves every Streamlit session in the process, so an
+# in-flight provider call costs a coroutine instead of an OS thread.
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever,
+                name="provider-orchestrator",
+                daemon=True
+            ).start()
+        return _loop
+
+
+def run_coroutine(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+# ==========================
+# Orchestration
+# ==========================
+async def run_provider(provider, file_bytes, filename, file_type, deadline, on_partial=None, granularity="document"):
+    with traced() as trace:
+        start_time = time.time()
+        try:
+            result, hedge = await asyncio.wait_for(
+                hedged_call(
+                    provider,
+                    lambda partial: PROVIDER_CALLS[provider](file_bytes, filename, file_type, partial),
+                    on_partial,
+                    granularity,
+                    deadline
+                ),
+                timeout=deadline
+            )
+            if hedge and isinstance(result, dict):
+                # Travels with the result like Gemini's stream metrics; never cached
+                result = {**result, "hedge": hedge}
+            return ProviderRun(provider, result, time.time() - start_time, trace.spans)
+        except asyncio.TimeoutError:
+            return ProviderRun(provider, {
+                "status": "error",
+                "error": f"{provider} did not answer within {deadline:g}s",
+                "error_type": "timeout"
+            }, None, trace.spans)
+        except Exception as e:
+            return ProviderRun(provider, {"status": "error", "error": str(e)}, None, trace.spans)
+
+
+async def run_provider_pages(provider, chunks, filename, file_type, deadline):
+    """Send every page chunk to the provider concurrently and merge the extractions."""
+    start_time = time.time()
+    path = PurePosixPath(filename)
+    page_runs = await asyncio.gather(*(
+        run_provider(provider, chunk, f"{path.stem}_p{label}{path.suffix}", file_type, deadline, granularity="page")
+        for label, chunk in chunks
+    ))
+
+    labels = [label for label, _ in chunks]
+    hedges = [run.result.pop("hedge") for run in page_runs if isinstance(run.result, dict) and "hedge" in run.result]
+    result = merge_page_results(provider, [
+        (label, run.result, run.exec_time) for label, run in zip(labels, page_runs)
+    ])
+    if hedges:
+        # Pages run in parallel, so the document gains at most what its best-hedged page saved
+        result["hedge"] = {
+            "delay": min(hedge["delay"] for hedge in hedges),
+            "won": any(hedge["won"] for hedge in hedges),
+            "saved": max(hedge["saved"] for hedge in hedges),
+            "pages": len(hedges)
+        }
+    # Prefix spans with their page so the waterfall shows one row per page
+    spans = [
+        {**span, "phase": f"p{label}:{span['phase']}"}
+        for label, run in zip(labels, page_runs)
+        for span in run.phases
+    ]
+    exec_time = None if result.get("status") == "error" else time.time() - start_time
+    return ProviderRun(provider, result, exec_time, spans)
+
+
+async def split_pages(file_bytes, file_type, page_chunk):
+    """Return the page chunks of a PDF, or None when the document is sent whole."""
+    if not page_chunk or not can_split(file_type):
+        return None
+    try:
+        chunks = await asyncio.to_thread(split_pdf, file_bytes, page_chunk)
+    except Exception as e:
+        print(f"Could not split PDF, sending it whole: {e}")
+        return None
+    return chunks if len(chunks) > 1 else None
+
+
+def run_document_provider(provider, file_bytes, filename, file_type, deadline, chunks=None, on_partial=None):
+    if chunks:
+        # Partial output of individual pages would not add up to the document
+        return run_provider_pages(provider, chunks, filename, file_type, deadline)
+    return run_provider(provider, file_bytes, filename, file_type, deadline, on_partial)
+
+
+async def run_providers(
+    providers, file_bytes, filename, file_type, deadlines=None, on_result=None, page_chunk=None, partials=False
+):
+    deadlines = {**PROVIDER_DEADLINES, **(deadlines or {})}
+    # Split once; every provider gets the same chunks
+    chunks = await split_pages(file_bytes, file_type, page_chunk)
+
+    def partial_callback(provider):
+        if not (partials and on_result):
+            return None
+        return lambda text: on_result(PartialResult(provider, text))
+
+    tasks = [
+        asyncio.create_task(run_document_provider(
+            provider, file_bytes, filename, file_type, deadlines[provider], chunks, partial_callback(provider)
+        ))
+        for provider in providers
+    ]
+
+    runs = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            run = await next_done
+            runs.append(run)
+            if on_result:
+                on_result(run)
+    finally:
+        # Reached early only when the caller cancelled us; stop the stragglers
+        for task in tasks:
+            task.cancel()
+
+    return runs
+
+
+def stream_from_loop(make_coroutine, count):
+    """Run make_coroutine(on_result) on the shared loop and yield its first `count` results.
+
+    PartialResult items are passed through as they come but do not count towards `count`.
+    """
+    finished = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(make_coroutine(finished.put), get_event_loop())
+
+    try:
+        received = 0
+        while received < count:
+            try:
+                item = finished.get(timeout=0.5)
+            except queue.Empty:
+                if future.done():
+                    # Surfaces unexpected orchestrator failures instead of waiting forever
+                    future.result()
+                continue
+            if not isinstance(item, PartialResult):
+                received += 1
+            yield item
+    finally:
+        # The caller stopped iterating (e.g. a Streamlit rerun): cancel what is left
+        future.cancel()
+
+
+def iter_provider_results(providers, file_bytes, filename, file_type, deadlines=None, page_chunk=None, partials=False):
+    """Run providers concurrently on the shared loop, yielding each ProviderRun as it finishes.
+
+    With page_chunk set, multi-page PDFs are split into chunks of that many pages
+    which are processed in parallel and merged back into one result per provider.
+    With partials=True, streaming providers also yield PartialResult items as output arrives.
+    """
+    return stream_from_loop(
+        lambda on_result: run_providers(
+            providers, file_bytes, filename, file_type, deadlines, on_result, page_chunk, partials
+        ),
+        len(providers)
+    )
@@ -0,0 +1,195 @@
+import io
+import re
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = PdfWriter = None
+
+# Totals are printed once, normally on the last page
+TOTAL_FIELDS = ("subtotal", "tax", "discount", "total")
+
+
+def can_split(file_type):
+    return PdfReader is not None and file_type == "application/pdf"
+
+
+def split_pdf(file_bytes, pages_per_chunk=1):
+    """Split a PDF into [(label, bytes)] chunks of pages_per_chunk pages each.
+
+    Returns a single chunk when the document is too short to be worth splitting.
+    """
+    if PdfReader is None:
+        raise RuntimeError("The pypdf package is required to split PDFs into pages")
+
+    reader = PdfReader(io.BytesIO(file_bytes))
+    page_count = len(reader.pages)
+    if page_count <= pages_per_chunk:
+        return [(f"1-{page_count}", file_bytes)]
+
+    chunks = []
+    for first in range(0, page_count, pages_per_chunk):
+        last = min(first + pages_per_chunk, page_count)
+        writer = PdfWriter()
+        for index in range(first, last):
+            writer.add_page(reader.pages[index])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        label = str(first + 1) if last - first == 1 else f"{first + 1}-{last}"
+        chunks.append((label, buffer.getvalue()))
+    return chunks
+
+
+# ==========================
+# Merging per-page extractions
+# ==========================
+def _is_empty(value):
+    return value in (None, "", [], {})
+
+
+def to_number(value):
+    """Parse amounts like '1.234,56', '1,234.56', '$ 99' or 12.5; None when not a number."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    digits = re.sub(r"[^\d,.\-]", "", value)
+    if not re.search(r"\d", digits):
+        return None
+    if "," in digits and "." in digits:
+        # Whichever separator comes last is the decimal one
+        if digits.rfind(",") > digits.rfind("."):
+            digits = digits.replace(".", "").replace(",", ".")
+        else:
+            digits = digits.replace(",", "")
+    elif "," in digits or "." in digits:
+        # A lone separator is grouping when thousands follow it ('1.000', '1,250', '1.234.567')
+        separator = "," if "," in digits else "."
+        whole, _, decimals = digits.rpartition(separator)
+        grouped = (
+            re.fullmatch(rf"-?\d{{1,3}}(\{separator}\d{{3}})+", digits) is not None
+            and whole.lstrip("-") not in ("", "0")
+        )
+        digits = digits.replace(separator, "") if grouped else f"{whole.replace(separator, '')}.{decimals}"
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+def _merge_headers(extractions):
+    # First page that has a value wins; nested blocks (seller, buyer) merge field by field
+    merged = {}
+    for extraction in extractions:
+        for key, value in extraction.items():
+            if key in TOTAL_FIELDS or isinstance(value, list):
+                continue
+            if isinstance(value, dict):
+                merged[key] = _merge_headers([merged.get(key) or {}, value])
+            elif _is_empty(merged.get(key)) and not _is_empty(value):
+                merged[key] = value
+            else:
+                merged.setdefault(key, value)
+    return merged
+
+
+def _reconcile(merged):
+    items_sum = 0.0
+    for item in merged.get("items") or []:
+        amount = to_number(item.get("subtotal")) if isinstance(item, dict) else None
+        if amount is None:
+            return None
+        items_sum += amount
+
+    subtotal = to_number(merged.get("subtotal"))
+    total = to_number(merged.get("total"))
+    tax = to_number(merged.get("tax")) or 0.0
+    discount = to_number(merged.get("discount")) or 0.0
+    expected = subtotal if subtotal is not None else (total - tax + discount if total is not None else None)
+    if expected is None:
+        return None
+    return {
+        "items_sum": round(items_sum, 2),
+        "expected": round(expected, 2),
+        "matches": abs(items_sum - expected) <= max(0.01, abs(expected) * 0.001)
+    }
+
+
+def merge_invoice_extractions(extractions):
+    """Merge per-page invoice dicts: header from the first page that has it,
+    line items concatenated in page order, totals from the last page that has them."""
+    extractions = [extraction for extraction in extractions if isinstance(extraction, dict)]
+    if not extractions:
+        return {}
+
+    merged = _merge_headers(extractions)
+
+    list_keys = {key for extraction in extractions for key, value in extraction.items() if isinstance(value, list)}
+    for key in sorted(list_keys):
+        merged[key] = [item for extraction in extractions for item in extraction.get(key) or []]
+
+    for key in TOTAL_FIELDS:
+        values = [extraction.get(key) for extraction in extractions if not _is_empty(extraction.get(key))]
+        if values or any(key in extraction for extraction in extractions):
+            merged[key] = values[-1] if values else ""
+
+    reconciliation = _reconcile(merged)
+    if reconciliation is not None:
+        merged["reconciliation"] = reconciliation
+    return merged
+
+
+def _page_failed(result):
+    return not isinstance(result, dict) or "error" in result or result.get("status") == "error"
+
+
+def unstract_output(result):
+    for item in result.get("message") or []:
+        if isinstance(item, dict):
+            return (item.get("result") or {}).get("output")
+    return None
+
+
+def merge_page_results(provider, page_runs):
+    """Combine [(label, result, exec_time)] from one provider into a single document result."""
+    pages = [
+        {
+            "pages": label,
+            "status": "error" if _page_failed(result) else "ok",
+            "exec_time": exec_time,
+            "error": result.get("error") if isinstance(result, dict) else str(result)
+        }
+        for label, result, exec_time in page_runs
+    ]
+    succeeded = [result for _, result, _ in page_runs if not _page_failed(result)]
+    if not succeeded:
+        return {
+            "status": "error",
+            "error": "; ".join(f"page {page['pages']}: {page['error']}" for page in pages),
+            "pages": pages
+        }
+
+    if provider == "gemini":
+        # Each page was already validated against the Invoice schema by the service
+        merged = {**succeeded[0], "data": merge_invoice_extractions([result.get("data") for result in succeeded])}
+    elif provider == "unstract":
+        output = merge_invoice_extractions([unstract_output(result) for result in succeeded])
+        first_message = next(
+            (item for item in succeeded[0].get("message") or [] if isinstance(item, dict)), {}
+        )
+        merged = {
+            **succeeded[0],
+            "message": [{**first_message, "result": {**(first_message.get("result") or {}), "output": output}}]
+        }
+    else:
+        documents = [result.get("document") or {} for result in succeeded]
+        merged = {
+            **succeeded[0],
+            "document": {
+                "text": "\n".join(document.get("text", "") for document in documents),
+                "entities": [entity for document in documents for entity in document.get("entities", [])]
+            }
+        }
+
+    merged["pages"] = pages
+    return merged
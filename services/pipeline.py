@@ -0,0 +1,55 @@
+from database.queries import get_cached_result, store_cached_result
+from .orchestrator import ProviderRun, PartialResult, iter_provider_results
+from .pages import can_split
+from .result_cache import file_sha256, provider_signature, is_cacheable
+
+
+def cache_variant(file_type, page_chunk):
+    # Only PDFs are ever split, so other files share the whole-document cache entries
+    return page_chunk if page_chunk and can_split(file_type) else None
+
+
+def lookup_cached_results(file_hash, providers, page_chunk=None):
+    cached = {}
+    for provider in providers:
+        try:
+            model, prompt_version = provider_signature(provider, page_chunk)
+            hit = get_cached_result(file_hash, provider, model, prompt_version)
+        except Exception as e:
+            print(f"Cache lookup failed for {provider}: {e}")
+            hit = None
+        if hit:
+            cached[provider] = hit
+    return cached
+
+
+def store_run(file_hash, run, page_chunk=None):
+    if not is_cacheable(run.provider, run.result):
+        return
+    try:
+        model, prompt_version = provider_signature(run.provider, page_chunk)
+        # How this run was hedged or streamed says nothing about a later cache hit
+        result = {key: value for key, value in run.result.items() if key not in ("hedge", "metrics")}
+        store_cached_result(file_hash, run.provider, model, prompt_version, result, run.exec_time)
+    except Exception as e:
+        print(f"Cache store failed for {run.provider}: {e}")
+
+
+def iter_document_runs(file_bytes, filename, file_type, providers, force_refresh=False, page_chunk=None, partials=False):
+    """Yield (ProviderRun, from_cache) for one document, serving repeats from the result cache.
+
+    With partials=True, (PartialResult, False) items are interleaved while providers stream.
+    """
+    file_hash = file_sha256(file_bytes)
+    page_chunk = cache_variant(file_type, page_chunk)
+    cached = {} if force_refresh else lookup_cached_results(file_hash, providers, page_chunk)
+
+    for provider in providers:
+        if provider in cached:
+            yield ProviderRun(provider, *cached[provider]), True
+
+    pending = [provider for provider in providers if provider not in cached]
+    for run in iter_provider_results(pending, file_bytes, filename, file_type, page_chunk=page_chunk, partials=partials):
+        if not isinstance(run, PartialResult):
+            store_run(file_hash, run, page_chunk)
+        yield run, False
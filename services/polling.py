@@ -0,0 +1,158 @@
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class ExecutionTimeTracker:
+    """Rolling window of observed execution durations (seconds)."""
+
+    def __init__(self, maxlen=200):
+        self._lock = threading.Lock()
+        self._durations = deque(maxlen=maxlen)
+
+    def record(self, seconds):
+        if seconds is not None and seconds > 0:
+            with self._lock:
+                self._durations.append(float(seconds))
+
+    def seed(self, durations):
+        for seconds in durations:
+            self.record(seconds)
+
+    def expected(self):
+        with self._lock:
+            if not self._durations:
+                return None
+            return statistics.median(self._durations)
+
+    def percentile(self, q, min_samples=1):
+        with self._lock:
+            if len(self._durations) < max(1, min_samples):
+                return None
+            ordered = sorted(self._durations)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def samples(self):
+        with self._lock:
+            return list(self._durations)
+
+
+def adaptive_delays(expected=None, min_delay=0.5, max_delay=5.0, factor=1.5, jitter=0.2):
+    """Yield poll delays: sleep until near the expected finish, then back off with jitter."""
+    if expected:
+        # Most executions finish close to the median, so the first check goes just before it
+        yield _jittered(min(max(expected * 0.8, min_delay), max_delay * 4), jitter)
+
+    delay = min_delay
+    while True:
+        yield _jittered(delay, jitter)
+        delay = min(delay * factor, max_delay)
+
+
+def _jittered(delay, jitter):
+    return max(0.0, delay * random.uniform(1 - jitter, 1 + jitter))
+
+
+class _Execution:
+    __slots__ = ("status_url", "headers", "future", "callback", "delays", "started_at", "deadline", "next_poll_at")
+
+    def __init__(self, status_url, headers, future, callback, delays, timeout):
+        self.status_url = status_url
+        self.headers = headers
+        self.future = future
+        self.callback = callback
+        self.delays = delays
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + timeout
+        self.next_poll_at = self.started_at + next(delays)
+
+
+class StatusPoller:
+    """One background thread that polls many executions and resolves a Future for each."""
+
+    def __init__(self, fetch_status, tracker=None, max_parallel_requests=4):
+        # fetch_status(status_url, headers) returns the final payload, or None while running
+        self._fetch_status = fetch_status
+        self.tracker = tracker or ExecutionTimeTracker()
+        self._requests = ThreadPoolExecutor(max_workers=max_parallel_requests, thread_name_prefix="status-poll")
+        self._executions = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def track(self, execution_id, status_url, headers, timeout=300, max_delay=5.0, callback=None):
+        """Start polling an execution; tracking an id that is already polled returns its existing Future."""
+        future = Future()
+        delays = adaptive_delays(self.tracker.expected(), max_delay=max_delay)
+        execution = _Execution(status_url, headers, future, callback, delays, timeout)
+
+        with self._lock:
+            existing = self._executions.get(execution_id)
+            if existing is not None and not existing.future.cancelled():
+                return existing.future
+            self._executions[execution_id] = execution
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="status-poller", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return future
+
+    def pending(self):
+        with self._lock:
+            return len(self._executions)
+
+    def _run(self):
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                for execution_id, execution in list(self._executions.items()):
+                    # Callers that gave up (e.g. a cancelled async task) stop being polled
+                    if execution.future.cancelled():
+                        del self._executions[execution_id]
+                due = [
+                    (execution_id, execution)
+                    for execution_id, execution in self._executions.items()
+                    if execution.next_poll_at <= now
+                ]
+
+            checks = [
+                (execution_id, execution, self._requests.submit(self._fetch_status, execution.status_url, execution.headers))
+                for execution_id, execution in due
+            ]
+            for execution_id, execution, check in checks:
+                try:
+                    final = check.result()
+                except Exception as e:
+                    final = {"error": f"Error consultando status: {str(e)}"}
+                self._advance(execution_id, execution, final)
+
+            with self._lock:
+                # Cleared under the lock, so a track() landing after this still wakes the wait below
+                self._wakeup.clear()
+                next_poll = min((e.next_poll_at for e in self._executions.values()), default=None)
+            self._wakeup.wait(timeout=None if next_poll is None else max(0.0, next_poll - time.monotonic()))
+
+    def _advance(self, execution_id, execution, final):
+        now = time.monotonic()
+        if final is None and now > execution.deadline:
+            final = {"error": "Timeout alcanzado esperando a que la ejecución se complete"}
+
+        if final is None:
+            execution.next_poll_at = now + next(execution.delays)
+            return
+
+        with self._lock:
+            self._executions.pop(execution_id, None)
+        if "error" not in final:
+            self.tracker.record(now - execution.started_at)
+        if execution.future.set_running_or_notify_cancel():
+            execution.future.set_result(final)
+            if execution.callback:
+                # A failing callback must not take the polling thread down with it
+                try:
+                    execution.callback(execution_id, final)
+                except Exception as e:
+                    print(f"Status callback failed for execution {execution_id}: {e}")
@@ -0,0 +1,145 @@
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import PurePosixPath
+
+from PIL import Image, ImageOps
+from config.settings import (
+    PREPROCESS_ENABLED,
+    PREPROCESS_MAX_LONG_EDGE,
+    PREPROCESS_GRAYSCALE,
+    PREPROCESS_JPEG_QUALITY,
+    PREPROCESS_REENCODE
+)
+
+PREPROCESSABLE_TYPES = {"image/jpeg", "image/jpg", "image/png"}
+ORIENTATION_TAG = 0x0112
+
+
+@dataclass
+class PreparedUpload:
+    file_bytes: bytes
+    filename: str
+    file_type: str
+    original_size: int
+    duration: float = 0.0
+    steps: list = field(default_factory=list)
+
+    @property
+    def bytes_saved(self):
+        return self.original_size - len(self.file_bytes)
+
+    def summary(self):
+        return {
+            "original_size": self.original_size,
+            "size": len(self.file_bytes),
+            "duration": round(self.duration, 4),
+            "steps": self.steps
+        }
+
+
+def _flatten_alpha(image):
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+        return background
+    return image
+
+
+def _encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    if image_format == "JPEG":
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffer, format=image_format, optimize=True)
+    return buffer.getvalue()
+
+
+def preprocess_image(file_bytes, max_long_edge, grayscale=False, jpeg_quality=85, reencode=False):
+    """Return (image_bytes, image_format, steps, geometry_changed) for an invoice photo.
+
+    JPEG photos are written back as JPEG; lossless images keep their format unless
+    `reencode` asks for JPEG.
+    """
+    steps = []
+    with Image.open(io.BytesIO(file_bytes)) as image:
+        image_format = "JPEG" if reencode or image.format == "JPEG" else image.format
+        # For JPEGs, let the decoder skip detail we would throw away anyway
+        if image.format == "JPEG" and max(image.size) > 2 * max_long_edge:
+            image.draft("RGB", (max_long_edge, max_long_edge))
+            steps.append("draft")
+
+        # Phones store the sensor orientation in EXIF; not every provider honours it
+        geometry_changed = image.getexif().get(ORIENTATION_TAG, 1) != 1
+        if geometry_changed:
+            image = ImageOps.exif_transpose(image)
+            steps.append("exif_transpose")
+
+        if max(image.size) > max_long_edge:
+            image.thumbnail((max_long_edge, max_long_edge), Image.Resampling.LANCZOS)
+            geometry_changed = True
+            steps.append(f"resize:{image.width}x{image.height}")
+
+        if image_format == "JPEG":
+            image = _flatten_alpha(image)
+        if grayscale:
+            image = image.convert("LA" if image.mode in ("RGBA", "LA") else "L")
+            steps.append("grayscale")
+        elif image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        steps.append(f"jpeg:q{jpeg_quality}" if image_format == "JPEG" else image_format.lower())
+        return _encode(image, image_format, jpeg_quality), image_format, steps, geometry_changed
+
+
+def prepare_upload(
+    file_bytes,
+    filename,
+    file_type,
+    enabled=PREPROCESS_ENABLED,
+    max_long_edge=PREPROCESS_MAX_LONG_EDGE,
+    grayscale=PREPROCESS_GRAYSCALE,
+    jpeg_quality=PREPROCESS_JPEG_QUALITY,
+    reencode=PREPROCESS_REENCODE
+):
+    """Shrink an image upload once, before it is fanned out to the providers.
+
+    PDFs and unknown types pass through untouched, as does any image the
+    re-encode would not make smaller (unless its orientation had to be fixed).
+    """
+    upload = PreparedUpload(file_bytes, filename, file_type, len(file_bytes))
+    if not enabled or file_type not in PREPROCESSABLE_TYPES:
+        return upload
+
+    start = time.perf_counter()
+    try:
+        processed, image_format, steps, geometry_changed = preprocess_image(
+            file_bytes, max_long_edge, grayscale, jpeg_quality, reencode
+        )
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"Preprocessing skipped for {filename}: {e}")
+        upload.duration = time.perf_counter() - start
+        return upload
+
+    if geometry_changed or len(processed) < len(file_bytes):
+        upload.file_bytes = processed
+        if image_format == "JPEG":
+            upload.filename = str(PurePosixPath(filename).with_suffix(".jpg"))
+            upload.file_type = "image/jpeg"
+        upload.steps = steps
+    upload.duration = time.perf_counter() - start
+    return upload
+
+
+def prepare_documents(documents, **options):
+    """Prepare batch documents in place (document["upload"]), decoding images in parallel."""
+    def prepare(document):
+        document["upload"] = prepare_upload(document["file_bytes"], document["filename"], document["file_type"], **options)
+        document["file_bytes"] = None
+
+    # Pillow releases the GIL while decoding and resampling
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+        list(executor.map(prepare, documents))
+    return documents
@@ -0,0 +1,227 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from config.settings import RATE_LIMITS, RATE_LIMIT_MAX_RETRIES
+from .tracing import phase
+
+
+class ProviderThrottled(Exception):
+    """The provider pushed back (HTTP 429 / RESOURCE_EXHAUSTED)."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_throttled(error):
+    if isinstance(error, ProviderThrottled):
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message
+
+
+def retry_after_seconds(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Requests per second with bursts; the rate drops on push-back and recovers additively."""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # Takes a token now and returns how long the caller must wait before using it;
+        # tokens may go negative so waiting callers are served in arrival order
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def slow_down(self):
+        with self._lock:
+            self.rate = max(self.max_rate / 20, self.rate / 2)
+
+    def recover(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight calls: +1/limit per success, halved on push-back.
+
+    Sync and async callers wait in one FIFO queue and are handed a slot directly when
+    one frees up, so they are served in arrival order whichever path they came from.
+    """
+
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        # (loop, future) for async callers, (None, granted list) for threads
+        self._waiters = deque()
+
+    def _has_room(self):
+        return self.in_flight < max(self.min_limit, int(self.limit))
+
+    def try_acquire(self):
+        with self._condition:
+            if not self._waiters and self._has_room():
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._condition:
+            if not self._waiters and self._has_room():
+                self.in_flight += 1
+                return
+            granted = []
+            self._waiters.append((None, granted))
+            while not granted:
+                self._condition.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            if not self._waiters and self._has_room():
+                self.in_flight += 1
+                return
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._condition:
+                if (loop, waiter) in self._waiters:
+                    self._waiters.remove((loop, waiter))
+                elif waiter.done() and not waiter.cancelled():
+                    # The slot arrived just as we were cancelled: pass it on
+                    self.in_flight -= 1
+                    self._wake()
+            raise
+
+    def _hand_over(self, waiter):
+        # Runs on the waiter's loop; a waiter cancelled in the meantime gives its slot back
+        if waiter.done():
+            with self._condition:
+                self.in_flight -= 1
+                self._wake()
+        else:
+            waiter.set_result(None)
+
+    def _wake(self):
+        # Called with the condition held: free slots go to the queued callers in order
+        while self._waiters and self._has_room():
+            loop, waiter = self._waiters.popleft()
+            self.in_flight += 1
+            if loop is None:
+                waiter.append(True)
+            else:
+                loop.call_soon_threadsafe(self._hand_over, waiter)
+        self._condition.notify_all()
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit / 2)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+
+
+class ProviderLimiter:
+    def __init__(self, provider, rate, burst, max_concurrency, max_retries=RATE_LIMIT_MAX_RETRIES):
+        self.provider = provider
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.max_retries = max_retries
+
+    def _backoff(self, attempt, error):
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after:
+            return retry_after
+        return min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _settle(self, throttled):
+        self.concurrency.release(throttled=throttled)
+        if throttled:
+            self.bucket.slow_down()
+        else:
+            self.bucket.recover()
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn under the limits, queueing and retrying when the provider pushes back."""
+        for attempt in range(self.max_retries + 1):
+            with phase("queue"):
+                self.concurrency.acquire()
+                time.sleep(self.bucket.reserve())
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttled(e)
+                self._settle(throttled)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                print(f"{self.provider} throttled, retrying (attempt {attempt + 1}): {e}")
+                with phase("backoff"):
+                    time.sleep(self._backoff(attempt, e))
+                continue
+            self._settle(False)
+            return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            with phase("queue"):
+                await self.concurrency.acquire_async()
+                try:
+                    await asyncio.sleep(self.bucket.reserve())
+                except asyncio.CancelledError:
+                    self.concurrency.release()
+                    raise
+            try:
+                result = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                self.concurrency.release()
+                raise
+            except Exception as e:
+                throttled = is_throttled(e)
+                self._settle(throttled)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                print(f"{self.provider} throttled, retrying (attempt {attempt + 1}): {e}")
+                with phase("backoff"):
+                    await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            self._settle(False)
+            return result
+
+
+# One limiter per provider, shared by every session in the process
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider):
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rate_per_minute, burst, max_concurrency = RATE_LIMITS[provider]
+            limiter = ProviderLimiter(provider, rate_per_minute / 60, burst, max_concurrency)
+            _limiters[provider] = limiter
+        return limiter
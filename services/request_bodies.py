@@ -0,0 +1,85 @@
+import base64
+import json
+import uuid
+
+# A multiple of 3, so base64 chunks concatenate without padding in between
+CHUNK_SIZE = 3 * 64 * 1024
+
+
+def _source_size(source):
+    if hasattr(source, "read"):
+        position = source.seek(0, 2)
+        source.seek(0)
+        return position
+    return memoryview(source).nbytes
+
+
+def iter_chunks(source, size=CHUNK_SIZE):
+    """Yield a bytes buffer, memoryview or binary file (e.g. a SpooledTemporaryFile) piece by piece."""
+    if hasattr(source, "read"):
+        source.seek(0)
+        while chunk := source.read(size):
+            yield chunk
+        return
+
+    view = memoryview(source).cast("B")
+    for start in range(0, len(view), size):
+        # Slicing a memoryview does not copy; bytes() copies one chunk at a time
+        yield bytes(view[start:start + size])
+
+
+class StreamingBody:
+    """A request body produced chunk by chunk, with its length known up front.
+
+    The length lets both requests and httpx send Content-Length instead of
+    chunked encoding, and the body can be replayed when the limiter retries.
+    """
+
+    def __init__(self, make_chunks, length):
+        self._make_chunks = make_chunks
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return self._make_chunks()
+
+    async def async_chunks(self):
+        for chunk in self._make_chunks():
+            yield chunk
+
+
+def docai_json_body(source, mime_type):
+    """{"rawDocument": {"mimeType", "content": <base64>}} without building the base64 string."""
+    prefix = b'{"rawDocument":{"mimeType":' + json.dumps(mime_type).encode("utf-8") + b',"content":"'
+    suffix = b'"}}'
+    size = _source_size(source)
+
+    def chunks():
+        yield prefix
+        for chunk in iter_chunks(source):
+            yield base64.b64encode(chunk)
+        yield suffix
+
+    return StreamingBody(chunks, len(prefix) + 4 * ((size + 2) // 3) + len(suffix))
+
+
+def multipart_file_body(field, filename, mime_type, source):
+    """A single-file multipart/form-data body; returns (body, content_type)."""
+    boundary = uuid.uuid4().hex
+    quoted_name = filename.replace("\\", "\\\\").replace('"', "%22")
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{quoted_name}"\r\n'
+        f"Content-Type: {mime_type}\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+    size = _source_size(source)
+
+    def chunks():
+        yield head
+        yield from iter_chunks(source)
+        yield tail
+
+    return StreamingBody(chunks, len(head) + size + len(tail)), f"multipart/form-data; boundary={boundary}"
@@ -0,0 +1,38 @@
+import hashlib
+from config.settings import UNSTRACT_URL_WORKFLOW, DOCAI_URL
+from .gemini_service import GEMINI_MODEL, PROMPT_VERSION
+
+
+def file_sha256(file_bytes):
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def provider_signature(provider, page_chunk=None):
+    """Return (model, prompt_version) identifying how a provider builds its result."""
+    if provider == "gemini":
+        model, version = GEMINI_MODEL, PROMPT_VERSION
+    elif provider == "unstract":
+        # The workflow deployment decides the prompts, so its URL is the version
+        model, version = UNSTRACT_URL_WORKFLOW or "", "workflow"
+    elif provider == "document_ai":
+        model, version = DOCAI_URL or "", "processor"
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+
+    # Page-split results are merged extractions, not interchangeable with whole-document ones
+    if page_chunk:
+        version = f"{version}+pages{page_chunk}"
+    return model, version
+
+
+def is_cacheable(provider, result):
+    # Only successful results are worth replaying; errors should be retried
+    if not isinstance(result, dict) or "error" in result:
+        return False
+    if any(page.get("status") == "error" for page in result.get("pages") or []):
+        return False
+    if provider == "gemini":
+        return result.get("status") == "success"
+    if provider == "unstract":
+        return str(result.get("status", "")).upper() == "COMPLETED"
+    return result.get("status") != "error"
@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from database.queries import get_records_for_scoring, save_scores
+from .normalize import AMOUNT_FIELDS, FIELDS
+
+# Line items are scored through two derived columns rather than item by item
+ITEM_FIELDS = ("item_count", "items_total")
+SCORED_FIELDS = FIELDS + ITEM_FIELDS
+DATE_FIELDS = ("issue_date", "due_date")
+NUMBER_FIELDS = AMOUNT_FIELDS + ITEM_FIELDS
+
+AMOUNT_TOLERANCE = 0.01
+
+
+def _document_key(filenames):
+    # "archive.zip/inv_001.PNG" and "inv_001.png" refer to the same ground-truth row
+    return filenames.astype(str).str.rsplit("/", n=1).str[-1].str.lower()
+
+
+def load_ground_truth(source):
+    """Ground truth from a CSV or JSON file (path or upload) with a filename column plus any SCORED_FIELDS."""
+    name = str(getattr(source, "name", source)).lower()
+    if name.endswith(".json") or name.endswith(".jsonl"):
+        truth = pd.read_json(source, lines=name.endswith(".jsonl"), dtype=False)
+    else:
+        truth = pd.read_csv(source, dtype=str, keep_default_na=False)
+
+    if "filename" not in truth.columns:
+        raise ValueError("Ground truth needs a 'filename' column")
+    unknown = set(truth.columns) - set(SCORED_FIELDS) - {"filename"}
+    if unknown:
+        print(f"Ignoring ground truth columns: {sorted(unknown)}")
+
+    truth = truth[["filename"] + [name for name in SCORED_FIELDS if name in truth.columns]].copy()
+    truth["document"] = _document_key(truth["filename"])
+    return truth.drop_duplicates("document", keep="last").drop(columns="filename")
+
+
+def records_frame(rows):
+    """One row per (document, provider) from (filename, InvoiceRecord) pairs; extra keys become columns."""
+    data = []
+    for filename, record, *extra in rows:
+        row = {name: record.value(name) for name in FIELDS}
+        row.update(
+            filename=filename,
+            provider=record.provider,
+            status=record.status,
+            item_count=len(record.items),
+            items_total=record.items.amounts_sum()
+        )
+        for item in extra:
+            row.update(item)
+        data.append(row)
+    frame = pd.DataFrame(data)
+    frame = frame.reindex(columns=list(dict.fromkeys(["filename", "provider", "status", *SCORED_FIELDS, *frame.columns])))
+    frame["document"] = _document_key(frame["filename"])
+    return frame
+
+
+def _text_key(values):
+    return values.fillna("").astype(str).str.upper().str.replace(r"[^0-9A-Z]", "", regex=True)
+
+
+def _date_key(values):
+    values = values.fillna("").astype(str).str.strip()
+    # ISO dates are year-first; everything else on these invoices is day-first
+    iso = values.str.match(r"^\d{4}[-/.]")
+    dates = pd.to_datetime(values.where(iso), format="mixed", errors="coerce")
+    dates = dates.fillna(pd.to_datetime(values.where(~iso), format="mixed", dayfirst=True, errors="coerce"))
+    return dates.dt.strftime("%Y-%m-%d").fillna(_text_key(values)).replace("", np.nan)
+
+
+def _number(values):
+    return pd.to_numeric(values.replace("", np.nan), errors="coerce")
+
+
+def _compare(field, predicted, expected):
+    """Vectorised (has_prediction, has_truth, correct) for one field across the whole batch."""
+    if field in NUMBER_FIELDS:
+        predicted, expected = _number(predicted), _number(expected)
+        has_prediction, has_truth = predicted.notna(), expected.notna()
+        if field == "item_count":
+            # A provider that found no items did not predict a count
+            has_prediction &= predicted > 0
+        match = np.isclose(predicted.fillna(np.inf), expected.fillna(-np.inf), rtol=0, atol=AMOUNT_TOLERANCE)
+    else:
+        key = _date_key if field in DATE_FIELDS else _text_key
+        predicted, expected = key(predicted), key(expected)
+        has_prediction = predicted.fillna("").ne("")
+        has_truth = expected.fillna("").ne("")
+        match = predicted.eq(expected)
+    return has_prediction, has_truth, has_prediction & has_truth & match
+
+
+def score_fields(records, truth):
+    """Long frame of (document, provider, field, predicted, expected, correct) for every scorable field.
+
+    records comes from records_frame; only documents present in the ground truth
+    are scored, and failed provider runs count as predicting nothing.
+    """
+    merged = records.merge(truth, on="document", how="inner", suffixes=("", "_truth"))
+    ok = merged["status"].eq("ok")
+    keep = [column for column in ("filename", "provider", "document", "test_id", "exec_time") if column in merged.columns]
+
+    scores = []
+    for field in SCORED_FIELDS:
+        if field not in truth.columns:
+            continue
+        predicted, expected, correct = _compare(field, merged[field], merged[f"{field}_truth"])
+        frame = merged[keep].copy()
+        frame["field"] = field
+        frame["predicted"] = (predicted & ok).to_numpy()
+        frame["expected"] = expected.to_numpy()
+        frame["correct"] = (correct & ok).to_numpy()
+        scores.append(frame)
+
+    if not scores:
+        return pd.DataFrame(columns=keep + ["field", "predicted", "expected", "correct"])
+    return pd.concat(scores, ignore_index=True)
+
+
+def field_metrics(scores):
+    """Precision, recall and F1 per (provider, field)."""
+    totals = scores.groupby(["provider", "field"], sort=True)[["predicted", "expected", "correct"]].sum()
+    precision = totals["correct"] / totals["predicted"].replace(0, np.nan)
+    recall = totals["correct"] / totals["expected"].replace(0, np.nan)
+    totals["precision"] = precision
+    totals["recall"] = recall
+    totals["f1"] = 2 * precision * recall / (precision + recall).replace(0, np.nan)
+    return totals.reset_index()
+
+
+def pick_best(scores):
+    """Provider with the most correct fields per document; ties go to the fastest run.
+
+    Returns a Series indexed by document (or test_id when present); documents where
+    no provider got a single field right get no winner.
+    """
+    document = "test_id" if "test_id" in scores.columns else "document"
+    totals = scores.groupby([document, "provider"], sort=False)["correct"].sum().reset_index()
+    if "exec_time" in scores.columns:
+        exec_times = scores.groupby([document, "provider"], sort=False)["exec_time"].first().reset_index()
+        totals = totals.merge(exec_times, on=[document, "provider"])
+        totals["exec_time"] = totals["exec_time"].fillna(np.inf)
+    else:
+        totals["exec_time"] = 0.0
+
+    totals = totals[totals["correct"] > 0].sort_values(
+        [document, "correct", "exec_time"], ascending=[True, False, True]
+    )
+    return totals.drop_duplicates(document).set_index(document)["provider"]
+
+
+def score_saved_tests(truth, since_hours=None, rescore=False):
+    """Score stored invoice records against ground truth and fill best_response automatically.
+
+    Only tests without a best_response are considered unless rescore is set; even
+    then a manual judgement is never overwritten. Returns (metrics, tests_judged).
+    """
+    rows = get_records_for_scoring(since_hours, unjudged_only=not rescore)
+    if not rows:
+        return field_metrics(score_fields(records_frame([]), truth)), 0
+
+    records = pd.DataFrame(rows)
+    records["document"] = _document_key(records["filename"])
+    scores = score_fields(records, truth)
+    judged = save_scores(scores, pick_best(scores).to_dict())
+    return field_metrics(scores), judged
@@ -0,0 +1,48 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+# The trace of the provider call running in this thread / asyncio task
+_current_trace = contextvars.ContextVar("provider_trace", default=None)
+
+
+class Trace:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, start, end):
+        self.spans.append({
+            "phase": name,
+            "start": round(start - self.origin, 4),
+            "duration": round(end - start, 4)
+        })
+
+
+@contextmanager
+def traced():
+    """Collect the phases recorded by the provider call made inside this block."""
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record(name, start, end):
+    """Add a span measured by hand (perf_counter timestamps) to the current trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, start, end)
+
+
+@contextmanager
+def phase(name):
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add(name, start, time.perf_counter())
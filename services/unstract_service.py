@@ -1,62 +1,178 @@
 import requests
+import httpx
+import asyncio
+import threading
 import urllib.parse
-import time
+from concurrent.futures import TimeoutError as FutureTimeout
 from config.settings import UNSTRACT_API_KEY, UNSTRACT_URL_WORKFLOW
+from .cassettes import cassette
+from .clients import get_http_session, get_async_http_client
+from .polling import StatusPoller
+from .rate_limit import ProviderThrottled, get_limiter, retry_after_seconds
+from .request_bodies import multipart_file_body
+from .tracing import phase
 
-def run_unstract_workflow(
-    file_bytes,
-    filename,          
-    file_type,         
-    api_key=UNSTRACT_API_KEY,
-    workflow_url=UNSTRACT_URL_WORKFLOW,
-    poll_interval=5,   
-    timeout=300        
-):
+
+def _build_request(file_bytes, filename, api_key):
     import mimetypes
     mime_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
-    headers = {"Authorization": f"Bearer {"a877dca1-b121-4209-82c1-62db54369652"}"}
-    files = {"files": (filename, file_bytes, mime_type)} 
+    headers = {"Authorization": f"Bearer {api_key}"}
+    # The multipart body streams straight from file_bytes instead of being assembled in memory
+    body, content_type = multipart_file_body("files", filename, mime_type, file_bytes)
+    upload_headers = {**headers, "Content-Type": content_type, "Content-Length": str(len(body))}
+    return headers, upload_headers, body
 
-    try:
-        response = requests.post(workflow_url, headers=headers, files=files, verify=False)
-        response.raise_for_status()
-        resp_json = response.json()
-    except requests.exceptions.RequestException as e:
-        return {"error": f"Error al enviar archivo a Unstract: {str(e)}"}
-    
+
+def _execution(workflow_url, resp_json):
     status_api_url = resp_json['message']['status_api']
     parsed_url = urllib.parse.urlparse(status_api_url)
     query_params = urllib.parse.parse_qs(parsed_url.query)
     execution_id = query_params.get("execution_id", [None])[0]
-    
+
     if not execution_id:
+        return None, None
+    return execution_id, f"{workflow_url.rstrip('/')}/?execution_id={execution_id}"
+
+
+def _raise_if_throttled(response):
+    if response.status_code == 429:
+        raise ProviderThrottled("Unstract rate limit (429)", retry_after_seconds(response))
+
+
+def _submit(session, workflow_url, headers, body):
+    with phase("upload"):
+        response = session.post(workflow_url, headers=headers, data=body)
+    _raise_if_throttled(response)
+    response.raise_for_status()
+    with phase("parse"):
+        return response.json()
+
+
+async def _submit_async(client, workflow_url, headers, body):
+    with phase("upload"):
+        response = await client.post(workflow_url, headers=headers, content=body.async_chunks())
+    _raise_if_throttled(response)
+    response.raise_for_status()
+    with phase("parse"):
+        return response.json()
+
+
+def _check_status(status_json):
+    # Returns the final payload, or None while the execution is still running
+    status = status_json.get("status", "").upper()
+
+    if status in ("COMPLETED", "ERROR", "STOPPED"):
+        return status_json
+    elif status in ("PENDING", "EXECUTING"):
+        return None
+    else:
+        return {"error": f"Status desconocido: {status}"}
+
+
+def _fetch_status(status_url, headers):
+    status_resp = get_http_session("unstract").get(status_url, headers=headers, timeout=30)
+    try:
+        status_resp.raise_for_status()
+    except requests.exceptions.HTTPError as e:
+        if status_resp.status_code != 422:
+            return {"error": f"HTTP error consultando status: {e}"}
+
+    return _check_status(status_resp.json())
+
+
+# ==========================
+# Shared status poller
+# ==========================
+# One thread polls every in-flight execution with adaptive backoff, so
+# waiting jobs hold a Future instead of a thread stuck in time.sleep.
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_status_poller():
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = StatusPoller(_fetch_status)
+        return _poller
+
+
+def seed_execution_times(durations):
+    get_status_poller().tracker.seed(durations)
+
+
+def _track_execution(workflow_url, resp_json, headers, poll_interval, timeout):
+    execution_id, status_url = _execution(workflow_url, resp_json)
+    if not execution_id:
+        return None
+
+    # poll_interval is now the ceiling of the adaptive backoff
+    return get_status_poller().track(
+        execution_id,
+        status_url,
+        headers,
+        timeout=timeout,
+        max_delay=poll_interval
+    )
+
+
+@cassette("unstract")
+def run_unstract_workflow(
+    file_bytes,
+    filename,
+    file_type,
+    api_key=UNSTRACT_API_KEY,
+    workflow_url=UNSTRACT_URL_WORKFLOW,
+    poll_interval=5,
+    timeout=300
+):
+    session = get_http_session("unstract")
+    headers, upload_headers, body = _build_request(file_bytes, filename, api_key)
+
+    try:
+        resp_json = get_limiter("unstract").call(_submit, session, workflow_url, upload_headers, body)
+    except (requests.exceptions.RequestException, ProviderThrottled) as e:
+        return {"error": f"Error al enviar archivo a Unstract: {str(e)}"}
+
+    execution = _track_execution(workflow_url, resp_json, headers, poll_interval, timeout)
+    if execution is None:
         return {"error": "No se recibió execution_id de Unstract", "response": resp_json}
 
-    status_url = f"{workflow_url.rstrip('/')}/?execution_id={execution_id}"
-    start_time = time.time()
-    
-    while True:
-        if time.time() - start_time > timeout:
-            return {"error": "Timeout alcanzado esperando a que la ejecución se complete"}
-        
+    # Server-side queueing and processing, as seen through the status poller
+    with phase("poll_wait"):
         try:
-            status_resp = requests.get(status_url, headers=headers, verify=False)
-            try:
-                status_resp.raise_for_status()
-            except requests.exceptions.HTTPError as e:
-                if status_resp.status_code != 422:
-                    return {"error": f"HTTP error consultando status: {e}"}
-            
-            status_json = status_resp.json()
-        except requests.exceptions.RequestException as e:
-            return {"error": f"Error consultando status: {str(e)}"}
-
-        status = status_json.get("status", "").upper()
-        
-        if status in ("COMPLETED", "ERROR", "STOPPED"):
-            return status_json
-        elif status in ("PENDING", "EXECUTING"):
-            time.sleep(poll_interval)
-        else:
-            return {"error": f"Status desconocido: {status}"}
+            # The poller enforces the deadline; the margin only guards against it stalling
+            return execution.result(timeout=timeout + poll_interval * 2)
+        except FutureTimeout:
+            execution.cancel()
+            return {"error": "Timeout alcanzado esperando a que la ejecución se complete"}
+
+
+@cassette("unstract")
+async def run_unstract_workflow_async(
+    file_bytes,
+    filename,
+    file_type,
+    api_key=UNSTRACT_API_KEY,
+    workflow_url=UNSTRACT_URL_WORKFLOW,
+    poll_interval=5,
+    timeout=300
+):
+    client = get_async_http_client("unstract")
+    headers, upload_headers, body = _build_request(file_bytes, filename, api_key)
 
+    try:
+        resp_json = await get_limiter("unstract").call_async(_submit_async, client, workflow_url, upload_headers, body)
+    except (httpx.HTTPError, ValueError, ProviderThrottled) as e:
+        return {"error": f"Error al enviar archivo a Unstract: {str(e)}"}
+
+    execution = _track_execution(workflow_url, resp_json, headers, poll_interval, timeout)
+    if execution is None:
+        return {"error": "No se recibió execution_id de Unstract", "response": resp_json}
+
+    with phase("poll_wait"):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(execution), timeout + poll_interval * 2)
+        except asyncio.TimeoutError:
+            execution.cancel()
+            return {"error": "Timeout alcanzado esperando a que la ejecución se complete"}
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The app runs from the repository root; make its packages importable the same way
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Some services import the database package, which builds its engine on import; no test connects
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,50 @@
+import pytest
+
+from services.invoice_schema import InvalidInvoiceOutput, _repair, parse_invoice, parse_partial_json
+
+
+def test_partial_json_closes_open_string_and_brackets():
+    assert parse_partial_json('{"invoiceNumber": "INV-1", "seller": {"name": "Ac') == {
+        "invoiceNumber": "INV-1", "seller": {"name": "Ac"}
+    }
+
+
+def test_partial_json_drops_incomplete_trailing_member():
+    assert parse_partial_json('{"invoiceNumber": "INV-1", "total": ') == {"invoiceNumber": "INV-1"}
+    assert parse_partial_json('{"items": [{"subtotal": "1"}, {"sub') == {"items": [{"subtotal": "1"}]}
+
+
+def test_partial_json_keeps_escaped_quotes_and_trailing_backslash():
+    assert parse_partial_json('{"notes": "say \\"hi\\"", "a": "x\\') == {"notes": 'say "hi"', "a": "x"}
+
+
+def test_partial_json_strips_code_fence():
+    assert parse_partial_json('```json\n{"total": "10"}\n```') == {"total": "10"}
+
+
+@pytest.mark.parametrize("text", [None, "", "thinking...", "```json\n"])
+def test_partial_json_needs_an_object(text):
+    assert parse_partial_json(text) is None
+
+
+def test_repair_extracts_object_from_chatter():
+    assert _repair('Here is the invoice:\n{"total": "10"}\nLet me know!') == {"total": "10"}
+
+
+def test_repair_falls_back_to_partial_parse():
+    assert _repair('```json\n{"invoiceNumber": "INV-1", "items": [') == {"invoiceNumber": "INV-1", "items": []}
+
+
+def test_parse_invoice_coerces_scalars_and_flags_repairs():
+    invoice, repaired = parse_invoice('{"invoiceNumber": 42, "total": 12.5, "seller": null, "items": null}')
+    assert not repaired
+    assert (invoice.invoiceNumber, invoice.total, invoice.seller.name, invoice.items) == ("42", "12.5", "", [])
+
+    invoice, repaired = parse_invoice('```json\n{"invoiceNumber": "INV-1"}\n```')
+    assert repaired and invoice.invoiceNumber == "INV-1"
+
+
+def test_parse_invoice_rejects_non_objects():
+    with pytest.raises(InvalidInvoiceOutput) as error:
+        parse_invoice("I could not read this document")
+    assert error.value.text == "I could not read this document"
@@ -0,0 +1,55 @@
+from services.normalize import InvoiceRecord, LineItems, compare_records, normalize
+
+
+def _rows(records):
+    return {name: (values, agree) for name, values, agree in compare_records(records)}
+
+
+def test_compare_records_agrees_on_equivalent_values():
+    gemini = normalize("gemini", {"status": "success", "data": {
+        "invoiceNumber": "INV-001", "total": "1.250,00", "seller": {"name": "Acme S.L."},
+        "items": [{"subtotal": "1.250,00"}]
+    }})
+    unstract = normalize("unstract", {"message": [{"result": {"output": {
+        "invoice_number": "inv 001", "total_amount": 1250.004, "vendor": "ACME SL",
+        "line_items": [{"amount": 1250}]
+    }}}]})
+
+    rows = _rows({"gemini": gemini, "unstract": unstract})
+    assert rows["invoice_number"] == ({"gemini": "INV-001", "unstract": "inv 001"}, True)
+    assert rows["total"][1]
+    assert rows["item_count"] == ({"gemini": 1, "unstract": 1}, True)
+    # Only case, spaces, "_" and "-" are ignored
+    assert not rows["seller_name"][1]
+
+
+def test_compare_records_needs_every_provider_to_have_the_value():
+    records = {
+        "gemini": InvoiceRecord("gemini", currency="EUR"),
+        "document_ai": InvoiceRecord("document_ai", currency="")
+    }
+    assert not _rows(records)["currency"][1]
+
+
+def test_compare_records_skips_failed_records():
+    records = {
+        "gemini": InvoiceRecord("gemini", total="10"),
+        "unstract": InvoiceRecord("unstract", total="10"),
+        "document_ai": InvoiceRecord("document_ai", status="error", error="boom")
+    }
+    values, agree = _rows(records)["total"]
+    assert values == {"gemini": 10.0, "unstract": 10.0}
+    assert agree
+
+
+def test_compare_records_never_agrees_with_a_single_record():
+    items = LineItems()
+    items.append("Widget", "2", "5", "10")
+    rows = _rows({"gemini": InvoiceRecord("gemini", total="10", items=items)})
+    assert not any(agree for _, agree in rows.values())
+
+
+def test_normalize_reports_errors():
+    record = normalize("gemini", {"error": "quota"})
+    assert (record.status, record.error) == ("error", "quota")
+    assert normalize("unstract", {"message": []}).status == "error"
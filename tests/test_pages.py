@@ -0,0 +1,65 @@
+import pytest
+
+from services.pages import _reconcile, merge_invoice_extractions, to_number
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1.000", 1000.0),
+    ("€ 1.250", 1250.0),
+    ("1,250", 1250.0),
+    ("1.234.567", 1234567.0),
+    ("1,234,567", 1234567.0),
+    ("-1.000", -1000.0),
+    ("1.234,56", 1234.56),
+    ("1,234.56", 1234.56),
+    ("12.50", 12.5),
+    ("12,50", 12.5),
+    ("0.500", 0.5),
+    ("$ 99", 99.0),
+    (12.5, 12.5),
+    (3, 3.0),
+])
+def test_to_number(value, expected):
+    assert to_number(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "n/a", None, ["1"]])
+def test_to_number_rejects_non_numbers(value):
+    assert to_number(value) is None
+
+
+def test_merge_takes_header_from_first_page_and_totals_from_last():
+    merged = merge_invoice_extractions([
+        {"invoice_number": "INV-1", "seller": {"name": "Acme"}, "items": [{"subtotal": "10,00"}], "total": ""},
+        {"invoice_number": "", "seller": {"vat": "DE1"}, "items": [{"subtotal": "5,00"}], "total": "15,00"},
+    ])
+    assert merged["invoice_number"] == "INV-1"
+    assert merged["seller"] == {"name": "Acme", "vat": "DE1"}
+    assert merged["items"] == [{"subtotal": "10,00"}, {"subtotal": "5,00"}]
+    assert merged["total"] == "15,00"
+    assert merged["reconciliation"] == {"items_sum": 15.0, "expected": 15.0, "matches": True}
+
+
+def test_merge_skips_pages_that_are_not_dicts():
+    assert merge_invoice_extractions([None, "oops"]) == {}
+    assert merge_invoice_extractions([None, {"total": "1"}])["total"] == "1"
+
+
+def test_reconcile_prefers_subtotal_over_total():
+    reconciliation = _reconcile({"items": [{"subtotal": "1.000"}], "subtotal": "1.000", "total": "1.190", "tax": "190"})
+    assert reconciliation == {"items_sum": 1000.0, "expected": 1000.0, "matches": True}
+
+
+def test_reconcile_derives_expected_from_total_tax_and_discount():
+    reconciliation = _reconcile({"items": [{"subtotal": 100}], "total": 110, "tax": 20, "discount": 10})
+    assert reconciliation["expected"] == 100.0
+    assert reconciliation["matches"]
+
+
+def test_reconcile_flags_mismatch():
+    assert not _reconcile({"items": [{"subtotal": 90}], "subtotal": 100})["matches"]
+
+
+def test_reconcile_needs_every_item_amount_and_an_expected_total():
+    assert _reconcile({"items": [{"subtotal": "n/a"}], "subtotal": 1}) is None
+    assert _reconcile({"items": [{"subtotal": 1}]}) is None
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from services.scoring import _compare, pick_best
+
+
+def _series(*values):
+    return pd.Series(values, dtype=object)
+
+
+def test_compare_amounts_within_tolerance():
+    predicted, expected, correct = _compare("total", _series("10.004", "", 5, "x"), _series("10", "3", None, "1"))
+    assert predicted.tolist() == [True, False, True, False]
+    assert expected.tolist() == [True, True, False, True]
+    assert correct.tolist() == [True, False, False, False]
+
+
+def test_compare_zero_item_count_is_no_prediction():
+    predicted, _, correct = _compare("item_count", _series(0, 2), _series(0, 2))
+    assert predicted.tolist() == [False, True]
+    assert correct.tolist() == [False, True]
+
+
+def test_compare_dates_iso_and_day_first():
+    predicted, _, correct = _compare(
+        "issue_date", _series("2024-03-05", "05/03/2024", "03/05/2024", ""), _series("05.03.2024", "2024-03-05", "2024-03-05", "")
+    )
+    assert correct.tolist() == [True, True, False, False]
+    assert predicted.tolist() == [True, True, True, False]
+
+
+def test_compare_text_ignores_case_and_punctuation():
+    _, _, correct = _compare("invoice_number", _series("inv-001", "INV 002", None), _series("INV001", "INV-003", "X"))
+    assert correct.tolist() == [True, False, False]
+
+
+def _scores(rows):
+    return pd.DataFrame(rows, columns=["document", "provider", "field", "correct", "exec_time"])
+
+
+def test_pick_best_most_correct_fields_wins():
+    best = pick_best(_scores([
+        ("a.pdf", "gemini", "total", True, 3.0),
+        ("a.pdf", "gemini", "tax", True, 3.0),
+        ("a.pdf", "unstract", "total", True, 1.0),
+        ("a.pdf", "unstract", "tax", False, 1.0),
+    ]))
+    assert best.to_dict() == {"a.pdf": "gemini"}
+
+
+def test_pick_best_ties_go_to_fastest_and_unknown_times_last():
+    best = pick_best(_scores([
+        ("a.pdf", "gemini", "total", True, 3.0),
+        ("a.pdf", "unstract", "total", True, 1.0),
+        ("b.pdf", "gemini", "total", True, np.nan),
+        ("b.pdf", "unstract", "total", True, 8.0),
+    ]))
+    assert best.to_dict() == {"a.pdf": "unstract", "b.pdf": "unstract"}
+
+
+def test_pick_best_no_winner_without_a_correct_field():
+    best = pick_best(_scores([("a.pdf", "gemini", "total", False, 1.0)]).drop(columns="exec_time"))
+    assert best.empty
+
+
+def test_pick_best_groups_by_test_id_when_present():
+    scores = _scores([
+        ("a.pdf", "gemini", "total", True, 1.0),
+        ("a.pdf", "unstract", "total", True, 2.0),
+    ])
+    scores["test_id"] = [7, 7]
+    assert pick_best(scores).to_dict() == {7: "gemini"}
@@ -0,0 +1,30 @@
+import altair as alt
+import pandas as pd
+
+
+def phase_waterfall_chart(phases):
+    """Horizontal waterfall of provider phases: one row per platform, one bar per phase.
+
+    Page-split runs name their spans "p<pages>:<phase>" and get one row per page.
+    """
+    rows = []
+    for provider, spans in phases.items():
+        for span in spans:
+            page, _, name = span["phase"].rpartition(":")
+            rows.append({
+                "Platform": f"{provider.upper()} {page}".strip(),
+                "Phase": name,
+                "Start (s)": span["start"],
+                "End (s)": span["start"] + span["duration"],
+                "Duration (s)": span["duration"]
+            })
+    if not rows:
+        return None
+
+    return alt.Chart(pd.DataFrame(rows)).mark_bar().encode(
+        x=alt.X("Start (s):Q", title="Seconds since submit"),
+        x2="End (s):Q",
+        y=alt.Y("Platform:N", title=None),
+        color=alt.Color("Phase:N"),
+        tooltip=["Platform", "Phase", alt.Tooltip("Duration (s):Q", format=".2f"), alt.Tooltip("Start (s):Q", format=".2f")]
+    )
@@ -28,31 +28,28 @@ def verify_database_connection():
         print(f"❌ Error conectando a la base de datos: {e}")
         return False
 
-def verify_enum_values():
-    """Verificar valores del enum response_type"""
+def verify_result_providers():
+    """Verificar los proveedores guardados en test_results"""
     try:
         engine = create_engine(DB_URL, future=True)
         with engine.connect() as conn:
             result = conn.execute(text("""
-                SELECT e.enumlabel 
-                FROM pg_enum e
-                JOIN pg_type t ON e.enumtypid = t.oid
-                WHERE t.typname = 'response_type'
-                ORDER BY e.enumsortorder;
+                SELECT provider, COUNT(*)
+                FROM test_results
+                GROUP BY provider
+                ORDER BY provider;
             """))
-            values = [row[0] for row in result]
-            print(f"✅ Valores del enum response_type: {values}")
+            counts = {row[0]: row[1] for row in result}
+            print(f"✅ Resultados por proveedor: {counts}")
             
             expected = ['unstract', 'gemini', 'document_ai']
-            if set(values) == set(expected):
-                print("✅ Enum tiene los valores correctos")
-            else:
-                print(f"⚠️  Valores esperados: {expected}")
-                print(f"⚠️  Valores actuales: {values}")
-            return values
+            unknown = set(counts) - set(expected)
+            if unknown:
+                print(f"⚠️  Proveedores no reconocidos: {sorted(unknown)}")
+            return counts
     except Exception as e:
-        print(f"❌ Error verificando enum: {e}")
-        return []
+        print(f"❌ Error verificando test_results: {e}")
+        return {}
 
 def verify_tables():
     """Verificar que las tablas existan"""
@@ -83,6 +80,18 @@ def verify_tables():
             else:
                 print("❌ Tabla 'tests' no existe")
             
+            # Verificar tabla test_results
+            result = conn.execute(text("""
+                SELECT EXISTS (
+                    SELECT FROM information_schema.tables 
+                    WHERE table_name = 'test_results'
+                );
+            """))
+            if result.fetchone()[0]:
+                print("✅ Tabla 'test_results' existe")
+            else:
+                print("❌ Tabla 'test_results' no existe")
+            
             # Contar registros
             result = conn.execute(text("SELECT COUNT(*) FROM users"))
             user_count = result.fetchone()[0]
@@ -163,7 +172,7 @@ def test_queries():
     try:
         from database.queries import get_statistics
         stats = get_statistics()
-        print(f"✅ get_statistics() funciona - Total tests: {stats[0]}")
+        print(f"✅ get_statistics() funciona - Total tests: {stats[0].tests if stats else 0}")
     except Exception as e:
         print(f"❌ Error en get_statistics(): {e}")
     
@@ -182,8 +191,8 @@ if __name__ == "__main__":
     print("\n1️⃣ Verificando conexión a base de datos...")
     verify_database_connection()
     
-    print("\n2️⃣ Verificando valores del enum...")
-    verify_enum_values()
+    print("\n2️⃣ Verificando proveedores en test_results...")
+    verify_result_providers()
     
     print("\n3️⃣ Verificando tablas...")
     verify_tables()
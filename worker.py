@@ -0,0 +1,120 @@
+"""OCR worker: claims queued jobs from Postgres and runs the providers.
+
+Start as many as needed, on any node that can reach the database:
+
+    python worker.py --threads 4
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+import traceback
+
+from config.settings import WORKER_POLL_INTERVAL, PROVIDER_DEADLINES, JOB_STALE_SECONDS
+from database.models import init_db
+from database.queries import claim_job, heartbeat_job, complete_job, fail_job, get_recent_exec_times
+from services.clients import warm_up_clients
+from services.hedging import seed_latencies
+from services.pipeline import iter_document_runs
+from services.preprocessing import prepare_upload
+
+
+def process_job(job, worker_id):
+    results = {}
+    exec_times = {}
+    cache_hits = []
+    phases = {}
+
+    # psycopg2 hands BYTEA back as a memoryview; pass it on without copying
+    upload = prepare_upload(job.file_bytes, job.filename, job.file_type)
+    for run, from_cache in iter_document_runs(
+        upload.file_bytes, upload.filename, upload.file_type, list(job.providers),
+        force_refresh=job.force_refresh, page_chunk=job.page_chunk
+    ):
+        results[run.provider] = run.result
+        exec_times[run.provider] = run.exec_time
+        if from_cache:
+            cache_hits.append(run.provider)
+        else:
+            phases[run.provider] = run.phases
+
+    if not complete_job(job.id, worker_id, results, exec_times, cache_hits, phases, upload.summary()):
+        print(f"[{worker_id}] Job #{job.id} was taken over by another worker; result discarded")
+
+
+def heartbeat(job, worker_id, finished):
+    # Refreshes locked_at well inside JOB_STALE_SECONDS so long jobs are not claimed twice
+    while not finished.wait(JOB_STALE_SECONDS / 3):
+        try:
+            if not heartbeat_job(job.id, worker_id):
+                print(f"[{worker_id}] Lost job #{job.id} to another worker")
+                return
+        except Exception as e:
+            print(f"[{worker_id}] Heartbeat for job #{job.id} failed: {e}")
+
+
+def work(worker_id, stop):
+    while not stop.is_set():
+        try:
+            job = claim_job(worker_id)
+        except Exception as e:
+            print(f"[{worker_id}] Could not claim a job: {e}")
+            stop.wait(WORKER_POLL_INTERVAL)
+            continue
+
+        if job is None:
+            stop.wait(WORKER_POLL_INTERVAL)
+            continue
+
+        print(f"[{worker_id}] Job #{job.id}: {job.filename} -> {list(job.providers)}")
+        start = time.time()
+        finished = threading.Event()
+        threading.Thread(target=heartbeat, args=(job, worker_id, finished), daemon=True).start()
+        try:
+            process_job(job, worker_id)
+            print(f"[{worker_id}] Job #{job.id} done in {time.time() - start:.2f}s")
+        except Exception as e:
+            traceback.print_exc()
+            try:
+                status = fail_job(job.id, worker_id, str(e))
+                if status == "queued":
+                    print(f"[{worker_id}] Job #{job.id} requeued (attempt {job.attempts})")
+            except Exception as db_error:
+                print(f"[{worker_id}] Could not record the failure of job #{job.id}: {db_error}")
+        finally:
+            finished.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued OCR jobs")
+    parser.add_argument("--threads", type=int, default=2, help="Jobs processed concurrently by this worker")
+    args = parser.parse_args()
+
+    init_db()
+    warm_up_clients()
+    for provider in PROVIDER_DEADLINES:
+        seed_latencies(provider, get_recent_exec_times(provider))
+
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=work, args=(f"{base_id}:{n}", stop), daemon=True)
+        for n in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Worker {base_id} started with {args.threads} threads")
+
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping worker...")
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+if __name__ == "__main__":
+    main()